@@ -1,20 +1,319 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from datetime import datetime, timezone
+import concurrent.futures
+import itertools
+import json
+import math
 import requests
 
+import canvas_graphql
+import tracing
+from canvas_client import get_client, client_stats, InvalidCanvasResponse
+from cache import ResponseCache, scope_key
+from canvas_graphql import GraphQLUnavailable, wants_graphql
+from compression import COMPRESSIBLE_TYPES, MIN_SIZE, choose_encoding, compress, compress_chunks
+from dashboard import course_grades, fan_out
+from grade_engine import compile_course, compile_roster, grade_timeline, required_scores, sensitivities
+from grade_engine.roster import NUMPY_AVAILABLE
+from prefetch import Prefetcher
+from projection import project_assignments, project_groups, project_roster_submissions, project_submissions
+from sessions import GradeSessions, session_id
+from single_flight import SingleFlight
+from snapshot_store import open_store, sync_course
+from upcoming import UpcomingFeed
+
+# Response header carrying the what-if session handle for a course
+SESSION_HEADER = 'X-Grade-Session'
+
+class TracedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON encoding, timed as a span on the current request"""
+    
+    def dumps(self, obj, **kwargs):
+        with tracing.span('json'):
+            return super().dumps(obj, **kwargs)
+
 app = Flask(__name__)
-CORS(app)
+app.json = TracedJSONProvider(app)
+CORS(app, expose_headers=[SESSION_HEADER, tracing.REQUEST_ID_HEADER])
 
 USER_ID = "self"
 
-def make_headers(token):
-    return {"Authorization": f"Bearer {token}"}
+cache = ResponseCache()
+sessions = GradeSessions()
+flights = SingleFlight()
+prefetcher = Prefetcher()
+# On-disk course snapshots, only when SNAPSHOT_DB is set
+snapshots = open_store()
+
+# One course listing serves both /api/courses and /api/upcoming-assignments
+COURSES_PATH = f"users/{USER_ID}/courses?enrollment_state=active&include[]=enrollments&include[]=total_scores&per_page=100"
+
+def submissions_path(course_id):
+    return f"courses/{course_id}/students/submissions?student_ids[]={USER_ID}&include[]=assignment&per_page=50"
+
+def groups_path(course_id):
+    # Assignments are only listed so snapshot syncs can spot changed ones
+    return f"courses/{course_id}/assignment_groups?include[]=assignments&exclude_response_fields[]=description&exclude_response_fields[]=rubric"
+
+def course_assignments_path(course_id):
+    # Only assignments still to come, soonest first, so the feed can stop early
+    return f"courses/{course_id}/assignments?bucket=future&order_by=due_at&per_page=50"
+
+def roster_submissions_path(course_id):
+    # Every student's submissions; Canvas only allows this for teachers and TAs
+    return f"courses/{course_id}/students/submissions?student_ids[]=all&per_page=100"
+
+def roster_assignments_path(course_id):
+    return f"courses/{course_id}/assignments?per_page=100"
+
+INVALID_RESPONSE_ERROR = 'Canvas returned an invalid response. The course may be too large or temporarily unavailable.'
+SESSION_EXPIRED_ERROR = 'Grade session expired. Send the course payload again.'
+ROSTER_UNAVAILABLE_ERROR = 'Roster grades need numpy installed on the server'
+ROSTER_FORBIDDEN_ERROR = 'Roster grades need a teacher or TA enrollment in the course'
+# Most what-if scenarios evaluated by one batch request
+MAX_SCENARIOS = 10000
+
+def ndjson(obj):
+    with tracing.span('json'):
+        return json.dumps(obj, separators=(',', ':')) + '\n'
+
+def model_from_request(data):
+    """Compiled grade model for a request: its session handle if given, else the posted payload"""
+    sid = data.get('session_id')
+    if sid:
+        return sessions.model(sid)
+    return compile_course(data.get('assignments', []), data.get('assignment_groups', []))
+
+def scenarios_from_request(data):
+    """Expand a batch request into modification sets, or None if there are too many.
+    
+    Scenarios come either as an explicit list of {index: score} dicts or as a
+    grid of {index: [candidate scores]}, which means every combination.
+    """
+    grid = data.get('grid')
+    if grid:
+        if math.prod(len(values) for values in grid.values()) > MAX_SCENARIOS:
+            return None
+        indices = [int(k) for k in grid]
+        return [dict(zip(indices, values)) for values in itertools.product(*grid.values())]
+    
+    scenarios = data.get('scenarios', [])
+    if len(scenarios) > MAX_SCENARIOS:
+        return None
+    return [{int(k): v for k, v in modifications.items()} for modifications in scenarios]
+
+@app.before_request
+def start_trace():
+    rule = request.url_rule.rule if request.url_rule is not None else None
+    tracing.start(request.method, tracing.route_label(rule), request.headers.get(tracing.REQUEST_ID_HEADER))
+
+@app.after_request
+def finish_trace(response):
+    """Tag the response with its request id and timings; streamed ones are logged once they finish"""
+    trace = tracing.current()
+    if trace is None:
+        return response
+    response.headers[tracing.REQUEST_ID_HEADER] = trace.request_id
+    response.headers['Server-Timing'] = trace.server_timing()
+    if response.is_streamed:
+        response.call_on_close(lambda: tracing.finish(trace, response.status_code))
+    else:
+        tracing.finish(trace, response.status_code)
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli every JSON/NDJSON response the client accepts it for"""
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+    if encoding is None:
+        return response
+    
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding)
+    else:
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+        response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+def cached_fetch(kind, scope, resource, fetch):
+    """Cached Canvas data; concurrent misses for the same entry share one fetch"""
+    return flights.do(
+        (kind, scope, resource),
+        lambda: cache.get_or_fetch(kind, scope, resource, fetch)
+    )
 
-def get_base_url(canvas_url):
-    """Construct base URL from canvas domain"""
-    # Remove any protocol and trailing slashes
-    clean_url = canvas_url.replace('https://', '').replace('http://', '').rstrip('/')
-    return f"https://{clean_url}/api/v1"
+def warm_fetch(kind, scope, resource, fetch):
+    """cached_fetch for prefetching: a fresh entry is left alone, and checking isn't counted as a cache lookup"""
+    def load():
+        value = cache.peek(kind, scope, resource)
+        if value is None:
+            value = fetch()
+            cache.set(kind, scope, resource, value)
+        return value
+    
+    return flights.do((kind, scope, resource), load)
+
+def summarize_courses(courses):
+    result = []
+    for course in courses:
+        enrollments = course.get("enrollments", [])
+        current_score = None
+        current_grade = None
+        
+        for e in enrollments:
+            if "computed_current_score" in e:
+                current_score = e["computed_current_score"]
+                current_grade = e["computed_current_grade"]
+        
+        result.append({
+            'id': course.get('id'),
+            'name': course.get('name', 'Unnamed Course'),
+            'current_score': current_score,
+            'current_grade': current_grade
+        })
+    
+    return result
+
+def fetch_course_list(client, token, scope):
+    """Raw active course listing, shared by concurrent callers for the same user"""
+    def fetch():
+        response = client.get(COURSES_PATH, token, conditional=True)
+        response.raise_for_status()
+        return response.json()
+    
+    return flights.do(('course_list', scope), fetch)
+
+def fetch_courses(client, token, scope):
+    return summarize_courses(fetch_course_list(client, token, scope))
+
+def snapshot_pages(client, token, course_id):
+    """Sync the course's snapshot and yield its submissions as a single page"""
+    assignments, _, how = sync_course(
+        snapshots, client, token, course_id,
+        submissions_path(course_id), groups_path(course_id)
+    )
+    print(f"Synced course {course_id} snapshot ({how})")
+    yield assignments
+
+def iter_submission_pages(client, token, course_id):
+    if snapshots is not None:
+        return snapshot_pages(client, token, course_id)
+    pages = client.iter_pages(submissions_path(course_id), token, timeout=45)
+    return (project_submissions(page) for page in pages)
+
+def fetch_submissions(client, token, course_id):
+    assignments = []
+    for page in iter_submission_pages(client, token, course_id):
+        assignments.extend(page)
+    print(f"Successfully fetched {len(assignments)} assignments for course {course_id}")
+    return assignments
+
+def fetch_groups(client, token, course_id):
+    response = client.get(groups_path(course_id), token, conditional=True)
+    response.raise_for_status()
+    return project_groups(response.json())
+
+def fetch_roster(client, token, course_id):
+    """Every assignment and every student's submissions for a course, trimmed to the grade inputs"""
+    assignments = project_assignments(client.get_all(roster_assignments_path(course_id), token, timeout=45))
+    submissions = project_roster_submissions(client.get_all(roster_submissions_path(course_id), token, timeout=45))
+    print(f"Fetched {len(submissions)} roster submissions over {len(assignments)} assignments for course {course_id}")
+    return {'assignments': assignments, 'submissions': submissions}
+
+def roster_grades(roster, groups, modifications):
+    """{"students": [{user_id, grade}], "summary": {...}} for a fetched roster"""
+    with tracing.span('grade'):
+        grades = compile_roster(roster['assignments'], roster['submissions'], groups).grades(modifications)
+        return {'students': grades.as_list(), 'summary': grades.summary()}
+
+def fetch_course_graphql(client, token, scope, course_id):
+    """Submissions from one GraphQL walk, caching the groups it brings along; REST if GraphQL fails"""
+    try:
+        submissions, groups = canvas_graphql.fetch_course(client, token, course_id)
+    except GraphQLUnavailable as e:
+        print(f"GraphQL fetch failed for course {course_id}, falling back to REST: {e}")
+        return fetch_submissions(client, token, course_id)
+    cache.set('groups', scope, course_id, groups)
+    print(f"Successfully fetched {len(submissions)} assignments for course {course_id} over GraphQL")
+    return submissions
+
+def submissions_fetch(client, token, scope, course_id, graphql=False):
+    if graphql:
+        return lambda: fetch_course_graphql(client, token, scope, course_id)
+    return lambda: fetch_submissions(client, token, course_id)
+
+def groups_fetch(client, token, scope, course_id, graphql=False):
+    """Over GraphQL, groups arrive with the course's submissions, so a groups miss runs (or joins) that fetch"""
+    if not graphql:
+        return lambda: fetch_groups(client, token, course_id)
+    
+    def fetch():
+        cached_fetch('submissions', scope, course_id, submissions_fetch(client, token, scope, course_id, True))
+        hit, groups = cache.get('groups', scope, course_id)
+        return groups if hit else fetch_groups(client, token, course_id)
+    return fetch
+
+def prefetch_course(client, token, scope, course_id, cancelled, graphql=False):
+    """Load a course's submissions and groups into the cache ahead of the user opening it"""
+    if cache.peek('submissions', scope, course_id) is not None and cache.peek('groups', scope, course_id) is not None:
+        return 'cached'
+    warm_fetch('submissions', scope, course_id, submissions_fetch(client, token, scope, course_id, graphql))
+    if cancelled.is_set():
+        return 'cancelled'
+    warm_fetch('groups', scope, course_id, groups_fetch(client, token, scope, course_id, graphql))
+    return 'fetched'
+
+def fetch_upcoming_page(client, token, url):
+    """One page of a course's upcoming assignments and the next page's URL; (None, None) on failure"""
+    try:
+        response = client.get(url, token, timeout=5, conditional=True)
+        if response.status_code == 200:
+            return response.json(), response.links.get('next', {}).get('url')
+        print(f"Skipping upcoming page {client.url(url)}: HTTP {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"Skipping upcoming page {client.url(url)}: {str(e)}")
+    return None, None
+
+def fetch_upcoming(client, token, scope):
+    # Get all active courses
+    courses = fetch_course_list(client, token, scope)
+    
+    print(f"Found {len(courses)} courses")
+    
+    feed = UpcomingFeed(datetime.now(timezone.utc))
+    # Next page to read for every course that could still place in the feed
+    cursors = {position: course_assignments_path(course.get('id')) for position, course in enumerate(courses)}
+    
+    # Read one page from every live course per round until no course's next
+    # page could beat the current last place; the client's rate limiter
+    # decides how many of these actually run at once for this token
+    with concurrent.futures.ThreadPoolExecutor(max_workers=client.limiter.max_concurrency) as executor:
+        while cursors:
+            positions = list(cursors)
+            pages = executor.map(
+                tracing.propagate(lambda url: fetch_upcoming_page(client, token, url)),
+                [cursors[p] for p in positions]
+            )
+            
+            next_cursors = {}
+            for position, (assignments, next_url) in zip(positions, pages):
+                if assignments is None:
+                    continue
+                course_name = courses[position].get('name', 'Unknown Course')
+                print(f"Course {course_name}: {len(assignments)} assignments")
+                if feed.add(position, course_name, assignments) and next_url:
+                    next_cursors[position] = next_url
+            cursors = next_cursors
+    
+    return feed.results()
 
 @app.route('/api/courses', methods=['POST'])
 def get_courses():
@@ -24,50 +323,40 @@ def get_courses():
     if not token:
         return jsonify({'error': 'Token required'}), 400
     
-    BASE_URL = get_base_url(canvas_url)
-    headers = make_headers(token)
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
     
-    # Get user info for logging
-    try:
-        user_response = requests.get(f"{BASE_URL}/users/{USER_ID}", headers=headers, timeout=5)
-        if user_response.status_code == 200:
-            user_data = user_response.json()
-            username = user_data.get('name', 'Unknown User')
-            user_id = user_data.get('id', 'Unknown ID')
-            print(f"\n{'='*60}")
-            print(f"USER LOGIN: {username} (ID: {user_id}) - {canvas_url}")
-            print(f"{'='*60}")
-    except:
-        print(f"\nUSER LOGIN: Unable to fetch user info - {canvas_url}")
-    
-    courses_url = f"{BASE_URL}/users/{USER_ID}/courses?enrollment_state=active&include[]=enrollments&include[]=total_scores"
-    
-    try:
-        response = requests.get(courses_url, headers=headers)
-        response.raise_for_status()
-        courses = response.json()
+    def fetch():
+        courses = fetch_courses(client, token, scope)
         
-        result = []
-        for course in courses:
-            enrollments = course.get("enrollments", [])
-            current_score = None
-            current_grade = None
-            
-            for e in enrollments:
-                if "computed_current_score" in e:
-                    current_score = e["computed_current_score"]
-                    current_grade = e["computed_current_grade"]
-            
-            result.append({
-                'id': course.get('id'),
-                'name': course.get('name', 'Unnamed Course'),
-                'current_score': current_score,
-                'current_grade': current_grade
-            })
+        # Get user info for logging; listing courses first lets a concurrent
+        # /api/upcoming-assignments call share the same Canvas request
+        try:
+            user_response = client.get(f"users/{USER_ID}", token, timeout=5)
+            if user_response.status_code == 200:
+                user_data = user_response.json()
+                username = user_data.get('name', 'Unknown User')
+                user_id = user_data.get('id', 'Unknown ID')
+                print(f"\n{'='*60}")
+                print(f"USER LOGIN: {username} (ID: {user_id}) - {canvas_url}")
+                print(f"{'='*60}")
+        except:
+            print(f"\nUSER LOGIN: Unable to fetch user info - {canvas_url}")
         
-        return jsonify(result)
+        return courses
+    
+    try:
+        courses = cached_fetch('courses', scope, 'courses', fetch)
     except requests.exceptions.RequestException as e:
         return jsonify({'error': str(e)}), 500
+    
+    if prefetcher.enabled and request.json.get('prefetch', True):
+        graphql = wants_graphql(request.json, snapshots)
+        prefetcher.schedule(
+            scope, courses,
+            lambda course_id, cancelled: prefetch_course(client, token, scope, course_id, cancelled, graphql)
+        )
+    return jsonify(courses)
 
 @app.route('/api/course/<int:course_id>/assignments', methods=['POST'])
 def get_assignments(course_id):
@@ -77,66 +366,93 @@ def get_assignments(course_id):
     if not token:
         return jsonify({'error': 'Token required'}), 400
     
-    BASE_URL = get_base_url(canvas_url)
-    headers = make_headers(token)
-    url = f"{BASE_URL}/courses/{course_id}/students/submissions?student_ids[]={USER_ID}&include[]=assignment&per_page=50"
-    
-    assignments = []
-    max_retries = 2
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+    sid = session_id(scope, course_id)
     
     try:
-        while url:
-            retry_count = 0
-            success = False
-            
-            while retry_count < max_retries and not success:
-                try:
-                    response = requests.get(url, headers=headers, timeout=45)
-                    response.raise_for_status()
-                    
-                    # Check if response is JSON
-                    content_type = response.headers.get('Content-Type', '')
-                    if 'application/json' not in content_type:
-                        print(f"Non-JSON response for course {course_id}: {content_type}")
-                        print(f"Response preview: {response.text[:200]}")
-                        retry_count += 1
-                        if retry_count < max_retries:
-                            import time
-                            time.sleep(2)
-                            continue
-                        return jsonify({'error': 'Canvas returned an invalid response. The course may be too large or temporarily unavailable.'}), 500
-                    
-                    submissions = response.json()
-                    assignments.extend(submissions)
-                    success = True
-                    
-                except requests.exceptions.Timeout:
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        print(f"Timeout for course {course_id}, retrying...")
-                        import time
-                        time.sleep(2)
-                    else:
-                        raise
-            
-            if not success:
-                break
-                
-            if 'link' in response.headers:
-                links = response.headers['link'].split(',')
-                url = None
-                for link in links:
-                    if 'rel="next"' in link:
-                        url = link[link.find('<')+1 : link.find('>')]
-            else:
-                url = None
+        # Streams follow REST's pages, whichever fetch path was asked for
+        if request.json.get('stream'):
+            return stream_submissions(client, token, scope, course_id, sid)
         
-        print(f"Successfully fetched {len(assignments)} assignments for course {course_id}")
-        return jsonify(assignments)
+        assignments = cached_fetch(
+            'submissions', scope, course_id,
+            submissions_fetch(client, token, scope, course_id, wants_graphql(request.json, snapshots))
+        )
+        sessions.put(sid, submissions=assignments)
+        response = jsonify(assignments)
+        response.headers[SESSION_HEADER] = sid
+        return response
+    except InvalidCanvasResponse:
+        return jsonify({'error': INVALID_RESPONSE_ERROR}), 500
     except requests.exceptions.RequestException as e:
         print(f"Error fetching assignments for course {course_id}: {str(e)}")
         return jsonify({'error': f'Failed to load course data: {str(e)}'}), 500
 
+def stream_submissions(client, token, scope, course_id, sid):
+    """NDJSON response with one line per submissions page as it arrives from Canvas.
+    
+    Each page is {"page": n, "submissions": [...]}. A successful stream always
+    ends with {"done": true, "count": total}; a failure after the first page
+    ends it with {"error": message, "page": n} instead. Failures on the first
+    page are raised here so they become ordinary HTTP errors. A request for a
+    course that is already being fetched waits for that fetch and gets the
+    whole list as one page.
+    """
+    key = ('submissions', scope, course_id)
+    call, leader = flights.join(key)
+    if leader:
+        hit, cached = cache.get(
+            'submissions', scope, course_id,
+            refresh=lambda: fetch_submissions(client, token, course_id)
+        )
+        if hit:
+            flights.finish(key, call, cached)
+    else:
+        hit, cached = True, call.wait()
+    
+    pages = iter([cached]) if hit else iter_submission_pages(client, token, course_id)
+    try:
+        first = next(pages)
+    except Exception as e:
+        flights.finish(key, call, error=e)
+        raise
+    
+    def generate():
+        assignments = list(first)
+        page_number = 1
+        yield ndjson({'page': page_number, 'submissions': first})
+        
+        try:
+            for page in pages:
+                page_number += 1
+                assignments.extend(page)
+                yield ndjson({'page': page_number, 'submissions': page})
+        except InvalidCanvasResponse as e:
+            flights.finish(key, call, error=e)
+            yield ndjson({'error': INVALID_RESPONSE_ERROR, 'page': page_number + 1})
+            return
+        except requests.exceptions.RequestException as e:
+            flights.finish(key, call, error=e)
+            print(f"Error streaming assignments for course {course_id}: {str(e)}")
+            yield ndjson({'error': f'Failed to load course data: {str(e)}', 'page': page_number + 1})
+            return
+        
+        if not hit:
+            cache.set('submissions', scope, course_id, assignments)
+            flights.finish(key, call, assignments)
+            print(f"Successfully fetched {len(assignments)} assignments for course {course_id}")
+        sessions.put(sid, submissions=assignments)
+        yield ndjson({'done': True, 'count': len(assignments)})
+    
+    response = Response(generate(), mimetype='application/x-ndjson', headers={SESSION_HEADER: sid})
+    if not hit:
+        # Requests waiting on this fetch must not hang if our client disconnects mid-stream
+        response.call_on_close(lambda: flights.finish(
+            key, call, error=requests.exceptions.RequestException('Submissions stream was interrupted')
+        ))
+    return response
+
 @app.route('/api/course/<int:course_id>/groups', methods=['POST'])
 def get_assignment_groups(course_id):
     token = request.json.get('token')
@@ -145,30 +461,152 @@ def get_assignment_groups(course_id):
     if not token:
         return jsonify({'error': 'Token required'}), 400
     
-    BASE_URL = get_base_url(canvas_url)
-    headers = make_headers(token)
-    url = f"{BASE_URL}/courses/{course_id}/assignment_groups?include[]=assignments"
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
     
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return jsonify(response.json())
+        groups = cached_fetch(
+            'groups', scope, course_id,
+            groups_fetch(client, token, scope, course_id, wants_graphql(request.json, snapshots))
+        )
+        sid = session_id(scope, course_id)
+        sessions.put(sid, groups=groups)
+        response = jsonify(groups)
+        response.headers[SESSION_HEADER] = sid
+        return response
     except requests.exceptions.RequestException as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/course/<int:course_id>/roster', methods=['POST'])
+def get_roster(course_id):
+    """Course grades for every student, with optional class-wide {assignment id: score} modifications"""
+    token = request.json.get('token')
+    canvas_url = request.json.get('canvasUrl', 'cuhsd.instructure.com')
+    modifications = {int(k): v for k, v in request.json.get('modifications', {}).items()}
+    
+    if not token:
+        return jsonify({'error': 'Token required'}), 400
+    if not NUMPY_AVAILABLE:
+        return jsonify({'error': ROSTER_UNAVAILABLE_ERROR}), 501
+    
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+    
+    try:
+        roster = cached_fetch('roster', scope, course_id, lambda: fetch_roster(client, token, course_id))
+        groups = cached_fetch('groups', scope, course_id, lambda: fetch_groups(client, token, course_id))
+    except InvalidCanvasResponse:
+        return jsonify({'error': INVALID_RESPONSE_ERROR}), 500
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code in (401, 403):
+            return jsonify({'error': ROSTER_FORBIDDEN_ERROR}), 403
+        return jsonify({'error': f'Failed to load course data: {str(e)}'}), 500
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching the roster for course {course_id}: {str(e)}")
+        return jsonify({'error': f'Failed to load course data: {str(e)}'}), 500
+    
+    return jsonify(roster_grades(roster, groups, modifications))
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    token = request.json.get('token')
+    canvas_url = request.json.get('canvasUrl', 'cuhsd.instructure.com')
+    course_id = request.json.get('courseId')
+    
+    if not token:
+        return jsonify({'error': 'Token required'}), 400
+    
+    scope = scope_key(token, canvas_url)
+    if course_id is not None:
+        removed = cache.invalidate(scope, resource=int(course_id))
+    else:
+        # Don't let a running prefetch fill the cache straight back up
+        prefetcher.cancel(scope)
+        removed = cache.invalidate(scope)
+    
+    return jsonify({'invalidated': removed})
+
+@app.route('/api/prefetch/cancel', methods=['POST'])
+def cancel_prefetch():
+    token = request.json.get('token')
+    canvas_url = request.json.get('canvasUrl', 'cuhsd.instructure.com')
+    
+    if not token:
+        return jsonify({'error': 'Token required'}), 400
+    
+    return jsonify({'cancelled': prefetcher.cancel(scope_key(token, canvas_url))})
+
 @app.route('/api/calculate-grade', methods=['POST'])
 def calculate_grade():
     data = request.json
-    assignments = data.get('assignments', [])
-    assignment_groups = data.get('assignment_groups', [])
     modifications = data.get('modifications', {})
     
     # Convert string keys to integers
     modifications = {int(k): v for k, v in modifications.items()}
     
-    grade = calculate_grade_logic(assignments, assignment_groups, modifications)
+    sid = data.get('session_id')
+    with tracing.span('grade'):
+        if sid:
+            found, grade = sessions.grade(sid, modifications)
+            if not found:
+                return jsonify({'error': SESSION_EXPIRED_ERROR}), 404
+        else:
+            grade = model_from_request(data).grade(modifications)
     return jsonify({'grade': grade})
 
+@app.route('/api/calculate-grade/batch', methods=['POST'])
+def calculate_grade_batch():
+    data = request.json
+    
+    scenarios = scenarios_from_request(data)
+    if scenarios is None:
+        return jsonify({'error': f'At most {MAX_SCENARIOS} scenarios per request'}), 400
+    
+    with tracing.span('grade'):
+        model = model_from_request(data)
+        if model is None:
+            return jsonify({'error': SESSION_EXPIRED_ERROR}), 404
+        result = {'grades': model.grade_many(scenarios)}
+    if data.get('grid'):
+        result['scenarios'] = scenarios
+    return jsonify(result)
+
+@app.route('/api/required-score', methods=['POST'])
+def required_score():
+    data = request.json
+    target = data.get('target')
+    indices = [int(i) for i in data.get('indices', [])]
+    modifications = {int(k): v for k, v in data.get('modifications', {}).items()}
+    
+    if target is None or not indices:
+        return jsonify({'error': 'target and indices required'}), 400
+    
+    model = model_from_request(data)
+    if model is None:
+        return jsonify({'error': SESSION_EXPIRED_ERROR}), 404
+    
+    unknown = [i for i in indices if i not in model.slots]
+    if unknown:
+        return jsonify({'error': f'Assignments {unknown} do not count toward the grade'}), 400
+    
+    with tracing.span('grade'):
+        result = required_scores(model, float(target), indices, modifications, data.get('max_percent', 100))
+    return jsonify(result)
+
+@app.route('/api/sensitivity', methods=['POST'])
+def sensitivity():
+    """Every assignment's grade at full credit and at zero, ranked by how far it moves the grade"""
+    data = request.json
+    modifications = {int(k): v for k, v in data.get('modifications', {}).items()}
+    
+    model = model_from_request(data)
+    if model is None:
+        return jsonify({'error': SESSION_EXPIRED_ERROR}), 404
+    
+    with tracing.span('grade'):
+        result = sensitivities(model, modifications)
+    return jsonify(result)
+
 @app.route('/api/upcoming-assignments', methods=['POST'])
 def get_upcoming_assignments():
     token = request.json.get('token')
@@ -177,169 +615,129 @@ def get_upcoming_assignments():
     if not token:
         return jsonify({'error': 'Token required'}), 400
     
-    BASE_URL = get_base_url(canvas_url)
-    headers = make_headers(token)
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
     
     try:
-        from datetime import datetime, timedelta
-        import concurrent.futures
-        
-        # Get all active courses
-        courses_url = f"{BASE_URL}/users/{USER_ID}/courses?enrollment_state=active&per_page=100"
-        courses_response = requests.get(courses_url, headers=headers)
-        courses_response.raise_for_status()
-        courses = courses_response.json()
-        
-        print(f"Found {len(courses)} courses")
-        
-        upcoming = []
-        from datetime import timezone
-        now = datetime.now(timezone.utc)
-        
-        def fetch_course_assignments(course):
-            course_id = course.get('id')
-            course_name = course.get('name', 'Unknown Course')
-            course_upcoming = []
-            
-            try:
-                # Get assignments for this course
-                assignments_url = f"{BASE_URL}/courses/{course_id}/assignments?per_page=50"
-                assignments_response = requests.get(assignments_url, headers=headers, timeout=5)
-                
-                if assignments_response.status_code == 200:
-                    assignments = assignments_response.json()
-                    print(f"Course {course_name}: {len(assignments)} assignments")
-                    
-                    for assignment in assignments:
-                        due_at = assignment.get('due_at')
-                        if due_at:
-                            try:
-                                due_date = datetime.fromisoformat(due_at.replace('Z', '+00:00'))
-                                # Only include future assignments (within next 60 days)
-                                if due_date > now and due_date < now + timedelta(days=60):
-                                    course_upcoming.append({
-                                        'course_name': course_name,
-                                        'assignment_name': assignment.get('name', 'Unnamed Assignment'),
-                                        'due_at': due_at,
-                                        'points_possible': assignment.get('points_possible', 0),
-                                        'html_url': assignment.get('html_url', '')
-                                    })
-                            except Exception as e:
-                                print(f"Error parsing assignment: {e}")
-                                pass
-            except:
-                pass
-            
-            return course_upcoming
-        
-        # Fetch assignments from all courses in parallel (max 5 at a time)
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            results = executor.map(fetch_course_assignments, courses)
-            for course_upcoming in results:
-                upcoming.extend(course_upcoming)
-        
-        # Sort by due date
-        upcoming.sort(key=lambda x: datetime.fromisoformat(x['due_at'].replace('Z', '+00:00')))
-        
-        print(f"Total upcoming assignments found: {len(upcoming)}")
-        
-        return jsonify(upcoming[:10])  # Return top 10 upcoming
+        upcoming = cached_fetch(
+            'upcoming', scope, 'upcoming',
+            lambda: fetch_upcoming(client, token, scope)
+        )
+        return jsonify(upcoming)
     except requests.exceptions.RequestException as e:
         return jsonify({'error': str(e)}), 500
 
-def calculate_grade_logic(assignments, assignment_groups, modifications=None):
-    group_map = {g['id']: g for g in assignment_groups}
-    grouped_assignments = {}
+def load_course(client, token, scope, course_id, graphql=False):
+    """(submissions, groups) for a course, through the cache"""
+    submissions = cached_fetch(
+        'submissions', scope, course_id,
+        submissions_fetch(client, token, scope, course_id, graphql)
+    )
+    groups = cached_fetch(
+        'groups', scope, course_id,
+        groups_fetch(client, token, scope, course_id, graphql)
+    )
+    return submissions, groups
+
+def load_course_model(client, token, scope, course_id, graphql=False):
+    """(session id, compiled model, groups) for a course, fetched through the cache into its grade session"""
+    submissions, groups = load_course(client, token, scope, course_id, graphql)
+    sid = session_id(scope, course_id)
+    sessions.put(sid, submissions=submissions, groups=groups)
+    return sid, sessions.model(sid) or compile_course(submissions, groups), groups
+
+def course_error_message(e):
+    if isinstance(e, InvalidCanvasResponse):
+        return INVALID_RESPONSE_ERROR
+    if isinstance(e, TimeoutError):
+        return str(e)
+    return f'Failed to load course data: {str(e)}'
+
+@app.route('/api/course/<int:course_id>/timeline', methods=['POST'])
+def get_timeline(course_id):
+    """The course grade after each graded submission: {start, dates, grades, indices} in graded_at order"""
+    token = request.json.get('token')
+    canvas_url = request.json.get('canvasUrl', 'cuhsd.instructure.com')
     
-    for i, s in enumerate(assignments):
-        assignment = s.get("assignment", {})
-        group_id = assignment.get("assignment_group_id")
-        
-        if assignment.get('omit_from_final_grade', False):
-            continue
-        
-        if group_id not in grouped_assignments:
-            grouped_assignments[group_id] = []
-        
-        grouped_assignments[group_id].append((i, s, assignment))
+    if not token:
+        return jsonify({'error': 'Token required'}), 400
     
-    total_weight = 0
-    weighted_grade = 0
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
     
-    for group_id, group_assignments in grouped_assignments.items():
-        group_info = group_map.get(group_id, {})
-        group_weight = group_info.get('group_weight', 0)
-        
-        drop_lowest = group_info.get('rules', {}).get('drop_lowest', 0)
-        drop_highest = group_info.get('rules', {}).get('drop_highest', 0)
-        never_drop = group_info.get('rules', {}).get('never_drop', [])
-        
-        all_assignments = []
-        for i, s, assignment in group_assignments:
-            points_possible = assignment.get("points_possible") or 0
-            points_earned = s.get("score")
-            assignment_id = assignment.get("id")
-            
-            if modifications and i in modifications:
-                points_earned = modifications[i]
-            
-            if points_possible and points_possible > 0 and points_earned is not None:
-                percentage = (points_earned / points_possible) * 100
-                all_assignments.append({
-                    'earned': points_earned,
-                    'possible': points_possible,
-                    'percentage': percentage,
-                    'id': assignment_id,
-                    'never_drop': assignment_id in never_drop
-                })
-        
-        if len(all_assignments) > 0:
-            never_drop_assignments = [a for a in all_assignments if a.get('never_drop', False)]
-            droppable = [a for a in all_assignments if not a.get('never_drop', False)]
-            droppable_sorted = sorted(droppable, key=lambda x: x['percentage'])
-            
-            if drop_lowest > 0 and len(droppable_sorted) > drop_lowest:
-                droppable_sorted = droppable_sorted[drop_lowest:]
-            
-            if drop_highest > 0 and len(droppable_sorted) > drop_highest:
-                droppable_sorted = droppable_sorted[:-drop_highest]
-            
-            final_assignments = never_drop_assignments + droppable_sorted
-            
-            group_earned = sum(a['earned'] for a in final_assignments)
-            group_possible = sum(a['possible'] for a in final_assignments)
-            
-            if group_possible > 0:
-                group_percentage = (group_earned / group_possible) * 100
-                weighted_grade += (group_percentage * group_weight / 100)
-                total_weight += group_weight
-    
-    if total_weight == 0:
-        all_graded = []
-        for group_id, group_assignments in grouped_assignments.items():
-            for i, s, assignment in group_assignments:
-                points_possible = assignment.get("points_possible", 0)
-                points_earned = s.get("score")
-                
-                if modifications and i in modifications:
-                    points_earned = modifications[i]
-                
-                if points_earned is not None and points_possible > 0:
-                    all_graded.append({'earned': points_earned, 'possible': points_possible})
-        
-        if len(all_graded) == 0:
-            return None
-        
-        total_earned = sum(a['earned'] for a in all_graded)
-        total_possible = sum(a['possible'] for a in all_graded)
-        return (total_earned / total_possible) * 100
+    try:
+        submissions, groups = load_course(client, token, scope, course_id, wants_graphql(request.json, snapshots))
+    except InvalidCanvasResponse:
+        return jsonify({'error': INVALID_RESPONSE_ERROR}), 500
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching the timeline for course {course_id}: {str(e)}")
+        return jsonify({'error': f'Failed to load course data: {str(e)}'}), 500
     
-    # Normalize the grade if weights don't add up to 100%
-    # Canvas does this automatically - scales the grade proportionally
-    if total_weight > 0 and total_weight != 100:
-        weighted_grade = (weighted_grade / total_weight) * 100
+    with tracing.span('grade'):
+        timeline = grade_timeline(compile_course(submissions, groups), submissions)
+    return jsonify(timeline)
+
+@app.route('/api/dashboard', methods=['POST'])
+def get_dashboard():
+    """NDJSON with one line per active course, in the order they finish loading.
+
+    A loaded course is {"course": {id, name, grade, current_score,
+    current_grade, groups, session_id}} where groups is the per-group
+    breakdown and session_id is ready for what-if calls. A course that
+    failed or timed out is {"course_id", "name", "error"}. The stream ends
+    with {"done": true, "count": loaded, "failed": n}.
+    """
+    token = request.json.get('token')
+    canvas_url = request.json.get('canvasUrl', 'cuhsd.instructure.com')
+    
+    if not token:
+        return jsonify({'error': 'Token required'}), 400
     
-    return weighted_grade
+    client = get_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+    
+    try:
+        courses = cached_fetch('courses', scope, 'courses', lambda: fetch_courses(client, token, scope))
+    except requests.exceptions.RequestException as e:
+        return jsonify({'error': str(e)}), 500
+    
+    graphql = wants_graphql(request.json, snapshots)
+    
+    def load(course):
+        sid, model, groups = load_course_model(client, token, scope, course['id'], graphql)
+        with tracing.span('grade'):
+            grades = course_grades(course, model, groups)
+        grades['session_id'] = sid
+        return grades
+    
+    def generate():
+        loaded = failed = 0
+        for course, grades, e in fan_out(courses, load):
+            if e is None:
+                loaded += 1
+                yield ndjson({'course': grades})
+                continue
+            failed += 1
+            print(f"Error loading course {course['id']} for the dashboard: {str(e)}")
+            yield ndjson({'course_id': course['id'], 'name': course['name'], 'error': course_error_message(e)})
+        yield ndjson({'done': True, 'count': loaded, 'failed': failed})
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(tracing.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    return jsonify({
+        'canvas_pools': client_stats(),
+        'cache': cache.stats(),
+        'sessions': sessions.stats(),
+        'single_flight': flights.stats(),
+        'prefetch': prefetcher.stats(),
+        'snapshots': snapshots.stats() if snapshots is not None else None
+    })
 
 if __name__ == '__main__':
     import os
@@ -0,0 +1,734 @@
+"""asyncio serving mode for the same /api routes as app.py.
+
+Run with SERVER_MODE=async (see gunicorn.conf.py) or `uvicorn asgi:app`.
+Canvas calls go through httpx, so a slow course only holds a coroutine
+instead of a whole sync worker. Responses are byte-for-byte what the Flask
+routes return.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import httpx
+import requests
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+import canvas_graphql
+import tracing
+
+from app import (
+    COURSES_PATH, INVALID_RESPONSE_ERROR, MAX_SCENARIOS, ROSTER_FORBIDDEN_ERROR,
+    ROSTER_UNAVAILABLE_ERROR, SESSION_EXPIRED_ERROR, SESSION_HEADER, USER_ID, cache,
+    course_assignments_path, course_error_message, groups_path, model_from_request,
+    ndjson, roster_assignments_path, roster_grades, roster_submissions_path,
+    scenarios_from_request, sessions, snapshots, submissions_path, summarize_courses
+)
+from async_canvas_client import async_client_stats, close_async_clients, get_async_client
+from cache import scope_key
+from canvas_graphql import GraphQLUnavailable, wants_graphql
+from canvas_client import InvalidCanvasResponse, get_client
+from compression import COMPRESSIBLE_TYPES, MIN_SIZE, StreamCompressor, choose_encoding, compress
+from dashboard import async_fan_out, course_grades
+from grade_engine import compile_course, grade_timeline, required_scores, sensitivities
+from grade_engine.roster import NUMPY_AVAILABLE
+from prefetch import AsyncPrefetcher
+from projection import project_assignments, project_groups, project_roster_submissions, project_submissions
+from sessions import session_id
+from single_flight import AsyncSingleFlight
+from snapshot_store import sync_course
+from upcoming import UpcomingFeed
+
+
+class FlaskJSONResponse(JSONResponse):
+    """Serialize exactly like Flask's jsonify so both serving modes return identical bodies"""
+
+    def render(self, content):
+        with tracing.span('json'):
+            return (json.dumps(content, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+flights = AsyncSingleFlight()
+prefetcher = AsyncPrefetcher()
+# The snapshot store syncs through the requests-based client, so its errors can show up here too
+CANVAS_ERRORS = (httpx.HTTPError, requests.exceptions.RequestException)
+
+
+def error(message, status_code):
+    return FlaskJSONResponse({'error': message}, status_code=status_code)
+
+
+def background(fetch):
+    """Wrap a coroutine function so the cache's refresh threads can run it on this event loop"""
+    loop = asyncio.get_running_loop()
+    return lambda: asyncio.run_coroutine_threadsafe(fetch(), loop).result()
+
+
+async def cached(kind, scope, resource, fetch):
+    """Same as app.cached_fetch: concurrent misses for one entry share a single fetch"""
+    async def fetch_once():
+        hit, value = cache.get(kind, scope, resource, refresh=background(fetch))
+        if hit:
+            return value
+        value = await fetch()
+        cache.set(kind, scope, resource, value)
+        return value
+
+    return await flights.do((kind, scope, resource), fetch_once)
+
+
+async def warm(kind, scope, resource, fetch):
+    """Same as app.warm_fetch"""
+    async def load():
+        value = cache.peek(kind, scope, resource)
+        if value is None:
+            value = await fetch()
+            cache.set(kind, scope, resource, value)
+        return value
+
+    return await flights.do((kind, scope, resource), load)
+
+
+async def fetch_course_list(client, token, scope):
+    async def fetch():
+        response = await client.get(COURSES_PATH, token, conditional=True)
+        response.raise_for_status()
+        return response.json()
+
+    return await flights.do(('course_list', scope), fetch)
+
+
+async def iter_submission_pages(client, canvas_url, token, course_id):
+    """Submission pages from Canvas, or one page from the snapshot store when it's on"""
+    if snapshots is None:
+        async for page in client.iter_pages(submissions_path(course_id), token, timeout=45):
+            yield project_submissions(page)
+        return
+
+    # SQLite and the snapshot sync block, so they run on the sync client in a worker thread
+    assignments, _, how = await asyncio.to_thread(
+        sync_course, snapshots, get_client(canvas_url), token, course_id,
+        submissions_path(course_id), groups_path(course_id)
+    )
+    print(f"Synced course {course_id} snapshot ({how})")
+    yield assignments
+
+
+async def fetch_submissions(client, canvas_url, token, course_id):
+    assignments = []
+    async for page in iter_submission_pages(client, canvas_url, token, course_id):
+        assignments.extend(page)
+    return assignments
+
+
+async def fetch_course_graphql(client, canvas_url, token, scope, course_id):
+    """Same as app.fetch_course_graphql"""
+    try:
+        submissions, groups = await canvas_graphql.fetch_course_async(client, token, course_id)
+    except GraphQLUnavailable as e:
+        print(f"GraphQL fetch failed for course {course_id}, falling back to REST: {e}")
+        return await fetch_submissions(client, canvas_url, token, course_id)
+    cache.set('groups', scope, course_id, groups)
+    print(f"Successfully fetched {len(submissions)} assignments for course {course_id} over GraphQL")
+    return submissions
+
+
+def submissions_fetch(client, canvas_url, token, scope, course_id, graphql=False):
+    """Same as app.submissions_fetch"""
+    if graphql:
+        return lambda: fetch_course_graphql(client, canvas_url, token, scope, course_id)
+
+    async def fetch():
+        assignments = await fetch_submissions(client, canvas_url, token, course_id)
+        print(f"Successfully fetched {len(assignments)} assignments for course {course_id}")
+        return assignments
+    return fetch
+
+
+def groups_fetch(client, canvas_url, token, scope, course_id, graphql=False):
+    """Same as app.groups_fetch"""
+    if not graphql:
+        return lambda: fetch_groups(client, token, course_id)
+
+    async def fetch():
+        await cached('submissions', scope, course_id, submissions_fetch(client, canvas_url, token, scope, course_id, True))
+        hit, groups = cache.get('groups', scope, course_id)
+        return groups if hit else await fetch_groups(client, token, course_id)
+    return fetch
+
+
+async def prefetch_course(client, canvas_url, token, scope, course_id, cancelled, graphql=False):
+    """Same as app.prefetch_course"""
+    if cache.peek('submissions', scope, course_id) is not None and cache.peek('groups', scope, course_id) is not None:
+        return 'cached'
+    await warm('submissions', scope, course_id, submissions_fetch(client, canvas_url, token, scope, course_id, graphql))
+    if cancelled.is_set():
+        return 'cancelled'
+    await warm('groups', scope, course_id, groups_fetch(client, canvas_url, token, scope, course_id, graphql))
+    return 'fetched'
+
+
+async def credentials(request):
+    data = await request.json()
+    return data, data.get('token'), data.get('canvasUrl', 'cuhsd.instructure.com')
+
+
+async def get_courses(request):
+    data, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+
+    async def fetch():
+        courses = summarize_courses(await fetch_course_list(client, token, scope))
+
+        # Get user info for logging; listing courses first lets a concurrent
+        # /api/upcoming-assignments call share the same Canvas request
+        try:
+            user_response = await client.get(f"users/{USER_ID}", token, timeout=5)
+            if user_response.status_code == 200:
+                user_data = user_response.json()
+                username = user_data.get('name', 'Unknown User')
+                user_id = user_data.get('id', 'Unknown ID')
+                print(f"\n{'='*60}")
+                print(f"USER LOGIN: {username} (ID: {user_id}) - {canvas_url}")
+                print(f"{'='*60}")
+        except Exception:
+            print(f"\nUSER LOGIN: Unable to fetch user info - {canvas_url}")
+
+        return courses
+
+    try:
+        courses = await cached('courses', scope, 'courses', fetch)
+    except httpx.HTTPError as e:
+        return error(str(e), 500)
+
+    if prefetcher.enabled and data.get('prefetch', True):
+        graphql = wants_graphql(data, snapshots)
+        prefetcher.schedule(
+            scope, courses,
+            lambda course_id, cancelled: prefetch_course(client, canvas_url, token, scope, course_id, cancelled, graphql)
+        )
+    return FlaskJSONResponse(courses)
+
+
+async def get_assignments(request):
+    course_id = request.path_params['course_id']
+    data, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+    sid = session_id(scope, course_id)
+
+    try:
+        # Streams follow REST's pages, whichever fetch path was asked for
+        if data.get('stream'):
+            return await stream_submissions(client, canvas_url, token, scope, course_id, sid)
+        assignments = await cached(
+            'submissions', scope, course_id,
+            submissions_fetch(client, canvas_url, token, scope, course_id, wants_graphql(data, snapshots))
+        )
+        sessions.put(sid, submissions=assignments)
+        return FlaskJSONResponse(assignments, headers={SESSION_HEADER: sid})
+    except InvalidCanvasResponse:
+        return error(INVALID_RESPONSE_ERROR, 500)
+    except CANVAS_ERRORS as e:
+        print(f"Error fetching assignments for course {course_id}: {str(e)}")
+        return error(f'Failed to load course data: {str(e)}', 500)
+
+
+async def stream_submissions(client, canvas_url, token, scope, course_id, sid):
+    """Same NDJSON contract as app.stream_submissions"""
+    hit, cached_assignments = cache.get(
+        'submissions', scope, course_id,
+        refresh=background(lambda: fetch_submissions(client, canvas_url, token, course_id))
+    )
+    if hit:
+        async def single_page():
+            yield cached_assignments
+        pages = single_page()
+    else:
+        pages = iter_submission_pages(client, canvas_url, token, course_id)
+    first = await anext(pages)
+
+    async def generate():
+        assignments = list(first)
+        page_number = 1
+        yield ndjson({'page': page_number, 'submissions': first})
+
+        try:
+            async for page in pages:
+                page_number += 1
+                assignments.extend(page)
+                yield ndjson({'page': page_number, 'submissions': page})
+        except InvalidCanvasResponse:
+            yield ndjson({'error': INVALID_RESPONSE_ERROR, 'page': page_number + 1})
+            return
+        except CANVAS_ERRORS as e:
+            print(f"Error streaming assignments for course {course_id}: {str(e)}")
+            yield ndjson({'error': f'Failed to load course data: {str(e)}', 'page': page_number + 1})
+            return
+
+        if not hit:
+            cache.set('submissions', scope, course_id, assignments)
+            print(f"Successfully fetched {len(assignments)} assignments for course {course_id}")
+        sessions.put(sid, submissions=assignments)
+        yield ndjson({'done': True, 'count': len(assignments)})
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson', headers={SESSION_HEADER: sid})
+
+
+async def fetch_groups(client, token, course_id):
+    response = await client.get(groups_path(course_id), token, conditional=True)
+    response.raise_for_status()
+    return project_groups(response.json())
+
+
+async def get_assignment_groups(request):
+    course_id = request.path_params['course_id']
+    data, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+
+    try:
+        groups = await cached(
+            'groups', scope, course_id,
+            groups_fetch(client, canvas_url, token, scope, course_id, wants_graphql(data, snapshots))
+        )
+        sid = session_id(scope, course_id)
+        sessions.put(sid, groups=groups)
+        return FlaskJSONResponse(groups, headers={SESSION_HEADER: sid})
+    except httpx.HTTPError as e:
+        return error(str(e), 500)
+
+
+async def fetch_roster(client, token, course_id):
+    """Same as app.fetch_roster; assignments and submissions are fetched side by side"""
+    assignments, submissions = await asyncio.gather(
+        client.get_all(roster_assignments_path(course_id), token, timeout=45),
+        client.get_all(roster_submissions_path(course_id), token, timeout=45)
+    )
+    print(f"Fetched {len(submissions)} roster submissions over {len(assignments)} assignments for course {course_id}")
+    return {'assignments': project_assignments(assignments), 'submissions': project_roster_submissions(submissions)}
+
+
+async def get_roster(request):
+    course_id = request.path_params['course_id']
+    data, token, canvas_url = await credentials(request)
+    modifications = {int(k): v for k, v in data.get('modifications', {}).items()}
+    if not token:
+        return error('Token required', 400)
+    if not NUMPY_AVAILABLE:
+        return error(ROSTER_UNAVAILABLE_ERROR, 501)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+
+    try:
+        roster, groups = await asyncio.gather(
+            cached('roster', scope, course_id, lambda: fetch_roster(client, token, course_id)),
+            cached('groups', scope, course_id, lambda: fetch_groups(client, token, course_id))
+        )
+    except InvalidCanvasResponse:
+        return error(INVALID_RESPONSE_ERROR, 500)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code in (401, 403):
+            return error(ROSTER_FORBIDDEN_ERROR, 403)
+        return error(f'Failed to load course data: {str(e)}', 500)
+    except httpx.HTTPError as e:
+        print(f"Error fetching the roster for course {course_id}: {str(e)}")
+        return error(f'Failed to load course data: {str(e)}', 500)
+
+    return FlaskJSONResponse(roster_grades(roster, groups, modifications))
+
+
+async def calculate_grade(request):
+    data = await request.json()
+    modifications = data.get('modifications', {})
+
+    # Convert string keys to integers
+    modifications = {int(k): v for k, v in modifications.items()}
+
+    sid = data.get('session_id')
+    with tracing.span('grade'):
+        if sid:
+            found, grade = sessions.grade(sid, modifications)
+            if not found:
+                return error(SESSION_EXPIRED_ERROR, 404)
+        else:
+            grade = model_from_request(data).grade(modifications)
+    return FlaskJSONResponse({'grade': grade})
+
+
+async def calculate_grade_batch(request):
+    data = await request.json()
+
+    scenarios = scenarios_from_request(data)
+    if scenarios is None:
+        return error(f'At most {MAX_SCENARIOS} scenarios per request', 400)
+
+    with tracing.span('grade'):
+        model = model_from_request(data)
+        if model is None:
+            return error(SESSION_EXPIRED_ERROR, 404)
+        result = {'grades': model.grade_many(scenarios)}
+    if data.get('grid'):
+        result['scenarios'] = scenarios
+    return FlaskJSONResponse(result)
+
+
+async def required_score(request):
+    data = await request.json()
+    target = data.get('target')
+    indices = [int(i) for i in data.get('indices', [])]
+    modifications = {int(k): v for k, v in data.get('modifications', {}).items()}
+
+    if target is None or not indices:
+        return error('target and indices required', 400)
+
+    model = model_from_request(data)
+    if model is None:
+        return error(SESSION_EXPIRED_ERROR, 404)
+
+    unknown = [i for i in indices if i not in model.slots]
+    if unknown:
+        return error(f'Assignments {unknown} do not count toward the grade', 400)
+
+    with tracing.span('grade'):
+        result = required_scores(model, float(target), indices, modifications, data.get('max_percent', 100))
+    return FlaskJSONResponse(result)
+
+
+async def sensitivity(request):
+    data = await request.json()
+    modifications = {int(k): v for k, v in data.get('modifications', {}).items()}
+
+    model = model_from_request(data)
+    if model is None:
+        return error(SESSION_EXPIRED_ERROR, 404)
+
+    with tracing.span('grade'):
+        result = sensitivities(model, modifications)
+    return FlaskJSONResponse(result)
+
+
+async def fetch_upcoming(client, token, scope):
+    """Same round-by-round top-K walk as app.fetch_upcoming"""
+    courses = await fetch_course_list(client, token, scope)
+
+    print(f"Found {len(courses)} courses")
+
+    feed = UpcomingFeed(datetime.now(timezone.utc))
+    cursors = {position: course_assignments_path(course.get('id')) for position, course in enumerate(courses)}
+
+    # No fan-out cap here: the client's rate limiter bounds concurrency per token
+    async def fetch_page(url):
+        try:
+            response = await client.get(url, token, timeout=5, conditional=True)
+            if response.status_code == 200:
+                return response.json(), response.links.get('next', {}).get('url')
+            print(f"Skipping upcoming page {client.url(url)}: HTTP {response.status_code}")
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Skipping upcoming page {client.url(url)}: {str(e)}")
+        return None, None
+
+    while cursors:
+        positions = list(cursors)
+        pages = await asyncio.gather(*(fetch_page(cursors[p]) for p in positions))
+
+        next_cursors = {}
+        for position, (assignments, next_url) in zip(positions, pages):
+            if assignments is None:
+                continue
+            course_name = courses[position].get('name', 'Unknown Course')
+            print(f"Course {course_name}: {len(assignments)} assignments")
+            if feed.add(position, course_name, assignments) and next_url:
+                next_cursors[position] = next_url
+        cursors = next_cursors
+
+    return feed.results()
+
+
+async def get_upcoming_assignments(request):
+    _, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+
+    try:
+        upcoming = await cached(
+            'upcoming', scope, 'upcoming',
+            lambda: fetch_upcoming(client, token, scope)
+        )
+        return FlaskJSONResponse(upcoming)
+    except httpx.HTTPError as e:
+        return error(str(e), 500)
+
+
+async def invalidate_cache(request):
+    data, token, canvas_url = await credentials(request)
+    course_id = data.get('courseId')
+    if not token:
+        return error('Token required', 400)
+
+    scope = scope_key(token, canvas_url)
+    if course_id is not None:
+        removed = cache.invalidate(scope, resource=int(course_id))
+    else:
+        # Don't let a running prefetch fill the cache straight back up
+        prefetcher.cancel(scope)
+        removed = cache.invalidate(scope)
+
+    return FlaskJSONResponse({'invalidated': removed})
+
+
+async def cancel_prefetch(request):
+    _, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    return FlaskJSONResponse({'cancelled': prefetcher.cancel(scope_key(token, canvas_url))})
+
+
+async def load_course(client, canvas_url, token, scope, course_id, graphql=False):
+    """Same as app.load_course; submissions and groups are fetched side by side"""
+    return await asyncio.gather(
+        cached('submissions', scope, course_id, submissions_fetch(client, canvas_url, token, scope, course_id, graphql)),
+        cached('groups', scope, course_id, groups_fetch(client, canvas_url, token, scope, course_id, graphql))
+    )
+
+
+async def load_course_model(client, canvas_url, token, scope, course_id, graphql=False):
+    """Same as app.load_course_model"""
+    submissions, groups = await load_course(client, canvas_url, token, scope, course_id, graphql)
+    sid = session_id(scope, course_id)
+    sessions.put(sid, submissions=submissions, groups=groups)
+    return sid, sessions.model(sid) or compile_course(submissions, groups), groups
+
+
+async def get_timeline(request):
+    course_id = request.path_params['course_id']
+    data, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+
+    try:
+        submissions, groups = await load_course(client, canvas_url, token, scope, course_id, wants_graphql(data, snapshots))
+    except InvalidCanvasResponse:
+        return error(INVALID_RESPONSE_ERROR, 500)
+    except CANVAS_ERRORS as e:
+        print(f"Error fetching the timeline for course {course_id}: {str(e)}")
+        return error(f'Failed to load course data: {str(e)}', 500)
+
+    with tracing.span('grade'):
+        timeline = grade_timeline(compile_course(submissions, groups), submissions)
+    return FlaskJSONResponse(timeline)
+
+
+async def get_dashboard(request):
+    """Same NDJSON contract as app.get_dashboard"""
+    data, token, canvas_url = await credentials(request)
+    if not token:
+        return error('Token required', 400)
+
+    client = get_async_client(canvas_url)
+    scope = scope_key(token, canvas_url)
+
+    async def fetch_courses():
+        return summarize_courses(await fetch_course_list(client, token, scope))
+
+    try:
+        courses = await cached('courses', scope, 'courses', fetch_courses)
+    except httpx.HTTPError as e:
+        return error(str(e), 500)
+
+    graphql = wants_graphql(data, snapshots)
+
+    async def load(course):
+        sid, model, groups = await load_course_model(client, canvas_url, token, scope, course['id'], graphql)
+        with tracing.span('grade'):
+            grades = course_grades(course, model, groups)
+        grades['session_id'] = sid
+        return grades
+
+    async def generate():
+        loaded = failed = 0
+        async for course, grades, e in async_fan_out(courses, load):
+            if e is None:
+                loaded += 1
+                yield ndjson({'course': grades})
+                continue
+            failed += 1
+            print(f"Error loading course {course['id']} for the dashboard: {str(e)}")
+            yield ndjson({'course_id': course['id'], 'name': course['name'], 'error': course_error_message(e)})
+        yield ndjson({'done': True, 'count': loaded, 'failed': failed})
+
+    return StreamingResponse(generate(), media_type='application/x-ndjson')
+
+
+async def get_metrics(request):
+    return Response(tracing.metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def get_stats(request):
+    return FlaskJSONResponse({
+        'canvas_pools': async_client_stats(),
+        'cache': cache.stats(),
+        'sessions': sessions.stats(),
+        'single_flight': flights.stats(),
+        'prefetch': prefetcher.stats(),
+        'snapshots': snapshots.stats() if snapshots is not None else None
+    })
+
+
+def matched_route(scope):
+    """The path template of the route a request will hit, or None"""
+    for route in scope['app'].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return None
+
+
+class TracingMiddleware:
+    """The ASGI twin of app.start_trace and app.finish_trace"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        trace = tracing.start(
+            scope['method'], tracing.route_label(matched_route(scope)),
+            Headers(scope=scope).get(tracing.REQUEST_ID_HEADER)
+        )
+        status = 500
+
+        async def send_traced(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                headers = MutableHeaders(raw=message['headers'])
+                headers[tracing.REQUEST_ID_HEADER] = trace.request_id
+                headers['Server-Timing'] = trace.server_timing()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            # The app returns once the whole body (streamed or not) has been sent
+            tracing.finish(trace, status)
+
+
+class CompressionMiddleware:
+    """The ASGI twin of app.compress_response: gzip or brotli JSON and NDJSON bodies.
+
+    A body sent in one message is compressed whole (if it's big enough); a
+    streamed one is compressed message by message with a flush after each.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('Accept-Encoding', ''))
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message['type'] == 'http.response.start':
+                # Hold the headers until the first body message shows whether it streams
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            if start is not None:
+                headers = MutableHeaders(raw=start['headers'])
+                media_type = headers.get('Content-Type', '').split(';')[0].strip()
+                if media_type in COMPRESSIBLE_TYPES and 'Content-Encoding' not in headers:
+                    headers.add_vary_header('Accept-Encoding')
+                    body = message.get('body', b'')
+                    if encoding is not None and message.get('more_body', False):
+                        compressor = StreamCompressor(encoding)
+                        del headers['Content-Length']
+                        headers['Content-Encoding'] = encoding
+                    elif encoding is not None and len(body) >= MIN_SIZE:
+                        body = compress(body, encoding)
+                        headers['Content-Encoding'] = encoding
+                        headers['Content-Length'] = str(len(body))
+                        message = {**message, 'body': body}
+                start['headers'] = headers.raw
+                await send(start)
+                start = None
+
+            if compressor is not None:
+                body = compressor.process(message.get('body', b''))
+                if not message.get('more_body', False):
+                    body += compressor.finish()
+                message = {**message, 'body': body}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await prefetcher.close()
+    await close_async_clients()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/courses', get_courses, methods=['POST']),
+        Route('/api/course/{course_id:int}/assignments', get_assignments, methods=['POST']),
+        Route('/api/course/{course_id:int}/groups', get_assignment_groups, methods=['POST']),
+        Route('/api/course/{course_id:int}/roster', get_roster, methods=['POST']),
+        Route('/api/course/{course_id:int}/timeline', get_timeline, methods=['POST']),
+        Route('/api/calculate-grade', calculate_grade, methods=['POST']),
+        Route('/api/calculate-grade/batch', calculate_grade_batch, methods=['POST']),
+        Route('/api/required-score', required_score, methods=['POST']),
+        Route('/api/sensitivity', sensitivity, methods=['POST']),
+        Route('/api/upcoming-assignments', get_upcoming_assignments, methods=['POST']),
+        Route('/api/dashboard', get_dashboard, methods=['POST']),
+        Route('/api/cache/invalidate', invalidate_cache, methods=['POST']),
+        Route('/api/prefetch/cancel', cancel_prefetch, methods=['POST']),
+        Route('/api/stats', get_stats, methods=['GET']),
+        Route('/metrics', get_metrics, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+            expose_headers=[SESSION_HEADER, tracing.REQUEST_ID_HEADER]
+        ),
+        Middleware(TracingMiddleware),
+        Middleware(CompressionMiddleware)
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,221 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import httpx
+
+from canvas_client import (
+    DEFAULT_TIMEOUT, MAX_HOSTS, PAGE_FANOUT, POOL_MAXSIZE,
+    InvalidCanvasResponse, ValidatorStore, canvas_host, make_headers,
+    numbered_page_urls, revalidation_stats
+)
+import tracing
+from rate_limit import THROTTLE_RETRIES, AsyncRateLimiter, is_throttled, token_key
+
+
+class AsyncCanvasClient:
+    """asyncio counterpart of CanvasClient: one pooled httpx client per Canvas host"""
+
+    def __init__(self, host, pool_maxsize=POOL_MAXSIZE, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.base_url = f"https://{host}/api/v1"
+        self.pool_maxsize = pool_maxsize
+        connect, read = timeout
+        self.timeout = httpx.Timeout(read, connect=connect)
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_maxsize, max_keepalive_connections=pool_maxsize),
+            timeout=self.timeout
+        )
+        self.limiter = AsyncRateLimiter()
+        self.validators = ValidatorStore()
+        self.request_count = 0
+        self.error_count = 0
+        self.sequential_pages = 0
+        self.parallel_pages = 0
+        self.conditional_count = 0
+        self.not_modified_count = 0
+        self.body_bytes = 0
+        self.bytes_saved = 0
+
+    def url(self, path):
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def get(self, path, token, timeout=None, conditional=False):
+        """Same rate-limit and revalidation handling as CanvasClient.get"""
+        key = token_key(token)
+        headers = make_headers(token)
+        stored = None
+        if conditional:
+            validators, stored = self.validators.request_headers((key, self.url(path)))
+            headers.update(validators)
+
+        started = time.perf_counter()
+        response, attempt = await self._send('GET', path, key, headers, timeout, started)
+
+        not_modified = response.status_code == 304 and stored is not None
+        self.body_bytes += len(response.content)
+        tracing.record_canvas_call(
+            self.url(path), response.status_code, len(response.content),
+            time.perf_counter() - started, attempt - 1, not_modified
+        )
+        if not conditional:
+            return response
+
+        self.conditional_count += 1
+        if not_modified:
+            self.not_modified_count += 1
+            self.bytes_saved += len(stored.body)
+            replayed = response.headers.copy()
+            replayed.update(stored.headers)
+            return httpx.Response(200, headers=replayed, content=stored.body, request=response.request)
+        if response.status_code == 200:
+            self.validators.remember((key, self.url(path)), response.headers, response.content)
+        return response
+
+    async def post(self, path, token, json, timeout=None):
+        """Same as CanvasClient.post"""
+        started = time.perf_counter()
+        response, attempt = await self._send('POST', path, token_key(token), make_headers(token), timeout, started, json=json)
+        self.body_bytes += len(response.content)
+        tracing.record_canvas_call(
+            self.url(path), response.status_code, len(response.content),
+            time.perf_counter() - started, attempt - 1
+        )
+        return response
+
+    async def _send(self, method, path, key, headers, timeout, started, **kwargs):
+        """Same as CanvasClient._send"""
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.limiter.acquire(key)
+            self.request_count += 1
+            try:
+                response = await self.http.request(
+                    method,
+                    self.url(path),
+                    headers=headers,
+                    timeout=self.timeout if timeout is None else timeout,
+                    **kwargs
+                )
+            except (httpx.HTTPError, asyncio.CancelledError) as e:
+                self.limiter.release(key)
+                if isinstance(e, httpx.HTTPError):
+                    self.error_count += 1
+                tracing.record_canvas_call(self.url(path), 'error', 0, time.perf_counter() - started, attempt - 1)
+                raise
+
+            throttled = response.status_code in (403, 429) and is_throttled(response.status_code, response.text)
+            self.limiter.release(key, response.headers, throttled)
+            if not throttled or attempt > THROTTLE_RETRIES:
+                return response, attempt
+            print(f"Canvas rate limit hit on {self.host}, backing off (attempt {attempt})")
+
+    async def get_json_page(self, path, token, timeout=None, retries=2, retry_delay=2):
+        """GET one JSON page, retrying timeouts and non-JSON answers; returns (data, response)"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await self.get(path, token, timeout=timeout, conditional=True)
+                response.raise_for_status()
+
+                content_type = response.headers.get('Content-Type', '')
+                if 'application/json' in content_type:
+                    return response.json(), response
+
+                print(f"Non-JSON response for {self.url(path)}: {content_type}")
+                print(f"Response preview: {response.text[:200]}")
+                if attempt >= retries:
+                    raise InvalidCanvasResponse(content_type)
+            except httpx.TimeoutException:
+                if attempt >= retries:
+                    raise
+                print(f"Timeout for {self.url(path)}, retrying...")
+            await asyncio.sleep(retry_delay)
+
+    async def iter_pages(self, path, token, timeout=None, fanout=PAGE_FANOUT):
+        """Yield each page of a paginated Canvas listing, in order"""
+        page, response = await self.get_json_page(path, token, timeout=timeout)
+        yield page
+
+        next_url = response.links.get('next', {}).get('url')
+        last_url = response.links.get('last', {}).get('url')
+        urls = numbered_page_urls(next_url, last_url)
+
+        if urls is None:
+            while next_url:
+                page, response = await self.get_json_page(next_url, token, timeout=timeout)
+                self.sequential_pages += 1
+                yield page
+                next_url = response.links.get('next', {}).get('url')
+            return
+
+        semaphore = asyncio.Semaphore(max(1, fanout))
+
+        async def fetch(url):
+            async with semaphore:
+                page, _ = await self.get_json_page(url, token, timeout=timeout)
+                return page
+
+        tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+        try:
+            for task in tasks:
+                page = await task
+                self.parallel_pages += 1
+                yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_all(self, path, token, timeout=None):
+        items = []
+        async for page in self.iter_pages(path, token, timeout=timeout):
+            items.extend(page)
+        return items
+
+    def stats(self):
+        return {
+            'host': self.host,
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'sequential_pages': self.sequential_pages,
+            'parallel_pages': self.parallel_pages,
+            'pool_maxsize': self.pool_maxsize,
+            'rate_limit': self.limiter.stats(),
+            'revalidation': revalidation_stats(self)
+        }
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+_clients = OrderedDict()
+
+
+def get_async_client(canvas_url):
+    """Return the shared async client for a Canvas host, creating it on first use"""
+    host = canvas_host(canvas_url)
+    client = _clients.get(host)
+    if client is not None:
+        _clients.move_to_end(host)
+        return client
+
+    client = AsyncCanvasClient(host)
+    _clients[host] = client
+    while len(_clients) > MAX_HOSTS:
+        _, evicted = _clients.popitem(last=False)
+        asyncio.ensure_future(evicted.aclose())
+    return client
+
+
+def async_client_stats():
+    return [c.stats() for c in _clients.values()]
+
+
+async def close_async_clients():
+    while _clients:
+        _, client = _clients.popitem(last=False)
+        await client.aclose()
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import tracing
+from canvas_client import canvas_host
+
+# How long each kind of Canvas response stays fresh, in seconds
+TTLS = {
+    'courses': int(os.environ.get('CACHE_TTL_COURSES', 300)),
+    'groups': int(os.environ.get('CACHE_TTL_GROUPS', 600)),
+    'submissions': int(os.environ.get('CACHE_TTL_SUBMISSIONS', 120)),
+    'upcoming': int(os.environ.get('CACHE_TTL_UPCOMING', 60)),
+    'roster': int(os.environ.get('CACHE_TTL_ROSTER', 120)),
+}
+# Upper bound on the estimated size of everything held in the cache
+MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Serve expired entries while a background fetch replaces them
+STALE_WHILE_REVALIDATE = os.environ.get('CACHE_STALE_WHILE_REVALIDATE', '').lower() in ('1', 'true', 'yes')
+# How long past its TTL each kind may still be served stale, in seconds
+STALE_TTLS = {
+    'courses': int(os.environ.get('CACHE_STALE_COURSES', 900)),
+    'groups': int(os.environ.get('CACHE_STALE_GROUPS', 3600)),
+    'submissions': int(os.environ.get('CACHE_STALE_SUBMISSIONS', 900)),
+    'upcoming': int(os.environ.get('CACHE_STALE_UPCOMING', 300)),
+    'roster': int(os.environ.get('CACHE_STALE_ROSTER', 900)),
+}
+# Background refreshes running at once
+REFRESH_WORKERS = 2
+
+
+def scope_key(token, canvas_url):
+    """Hash a token and Canvas host so cache entries are private to one user"""
+    raw = f"{canvas_host(canvas_url)}\n{token}".encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def estimate_size(value):
+    return len(json.dumps(value, separators=(',', ':')))
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires_at', 'stale_until')
+
+    def __init__(self, value, size, expires_at, stale_until):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class ResponseCache:
+    """In-process LRU cache for Canvas responses with a TTL per endpoint kind.
+    
+    In stale-while-revalidate mode an expired entry is still served for its
+    kind's stale window, and the lookup kicks off a background refresh.
+    """
+
+    def __init__(self, ttls=None, max_bytes=MAX_BYTES, stale_ttls=None, stale_while_revalidate=STALE_WHILE_REVALIDATE):
+        self.ttls = dict(TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_ttls = dict(STALE_TTLS if stale_ttls is None else stale_ttls) if stale_while_revalidate else {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = {kind: 0 for kind in self.ttls}
+        self._misses = {kind: 0 for kind in self.ttls}
+        self.evictions = 0
+        self.expirations = 0
+        self._refreshing = set()
+        self._refresher = None
+        self.stale_served = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, kind, scope, resource, refresh=None):
+        """Return (hit, value) for a cached response.
+        
+        An expired entry still inside its stale window counts as a hit when
+        a refresh callable is given; refresh() then runs in the background
+        and its result replaces the entry.
+        """
+        key = (kind, scope, resource)
+        stale = False
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and entry.expires_at <= now:
+                if now < entry.stale_until:
+                    # Keep it around for a caller that can refresh it
+                    stale = refresh is not None
+                    if not stale:
+                        entry = None
+                else:
+                    self._remove(key)
+                    self.expirations += 1
+                    entry = None
+
+            if entry is None:
+                self._misses[kind] = self._misses.get(kind, 0) + 1
+                tracing.record_cache_lookup(kind, 'miss')
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._hits[kind] = self._hits.get(kind, 0) + 1
+            start_refresh = False
+            if stale:
+                self.stale_served += 1
+                start_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+
+        tracing.record_cache_lookup(kind, 'stale' if stale else 'hit')
+        if start_refresh:
+            self._refresh_in_background(key, refresh)
+        return True, entry.value
+
+    def _refresh_in_background(self, key, refresh):
+        def run():
+            try:
+                value = refresh()
+                self.set(*key, value)
+                with self._lock:
+                    self.refreshes += 1
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                print(f"Background refresh of {key[0]} failed: {str(e)}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+        self._refresher.submit(run)
+
+    def set(self, kind, scope, resource, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        key = (kind, scope, resource)
+        expires_at = time.monotonic() + self.ttls[kind]
+        stale_until = expires_at + self.stale_ttls.get(kind, 0)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, expires_at, stale_until)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def peek(self, kind, scope, resource):
+        """The cached value if it hasn't expired, else None; not counted as a lookup"""
+        with self._lock:
+            entry = self._entries.get((kind, scope, resource))
+            if entry is None or entry.expires_at <= time.monotonic():
+                return None
+            return entry.value
+
+    def get_or_fetch(self, kind, scope, resource, fetch):
+        """Serve from cache, or call fetch() and remember what it returns"""
+        hit, value = self.get(kind, scope, resource, refresh=fetch)
+        if hit:
+            return value
+
+        value = fetch()
+        self.set(kind, scope, resource, value)
+        return value
+
+    def invalidate(self, scope, kind=None, resource=None):
+        """Drop a user's entries, optionally only one kind and/or resource"""
+        with self._lock:
+            doomed = [
+                key for key in self._entries
+                if key[1] == scope
+                and (kind is None or key[0] == kind)
+                and (resource is None or key[2] == resource)
+            ]
+            for key in doomed:
+                self._remove(key)
+        return len(doomed)
+
+    def stats(self):
+        with self._lock:
+            kinds = {}
+            for kind in self.ttls:
+                hits = self._hits.get(kind, 0)
+                misses = self._misses.get(kind, 0)
+                lookups = hits + misses
+                kinds[kind] = {
+                    'ttl': self.ttls[kind],
+                    'hits': hits,
+                    'misses': misses,
+                    'hit_rate': hits / lookups if lookups else None
+                }
+
+            hits = sum(self._hits.values())
+            lookups = hits + sum(self._misses.values())
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'stale_while_revalidate': self.stale_while_revalidate,
+                'stale_served': self.stale_served,
+                'refreshing': len(self._refreshing),
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'hit_rate': hits / lookups if lookups else None,
+                'kinds': kinds
+            }
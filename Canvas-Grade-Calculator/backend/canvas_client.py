@@ -0,0 +1,380 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+from rate_limit import THROTTLE_RETRIES, RateLimiter, is_throttled, token_key
+
+# Connections kept alive per Canvas host; callers past this limit wait for a free one
+POOL_MAXSIZE = int(os.environ.get('CANVAS_POOL_MAXSIZE', 16))
+# Number of distinct Canvas hosts we keep a pooled client for
+MAX_HOSTS = int(os.environ.get('CANVAS_MAX_HOSTS', 32))
+# (connect, read) timeout used when a caller doesn't pass its own
+DEFAULT_TIMEOUT = (5, 30)
+# Pages of one paginated listing fetched at the same time once the page count is known
+PAGE_FANOUT = int(os.environ.get('CANVAS_PAGE_FANOUT', 4))
+
+# Bytes of earlier response bodies kept per host so unchanged ones can be revalidated
+VALIDATOR_MAX_BYTES = int(os.environ.get('CANVAS_VALIDATOR_BYTES', 32 * 1024 * 1024))
+# Headers of the original 200 that a 304 answer gets back along with its body
+REPLAYED_HEADERS = ('Content-Type', 'Link')
+
+_PAGE_PARAM = re.compile(r'([?&]page=)(\d+)(?=&|$)')
+
+
+class InvalidCanvasResponse(Exception):
+    """Canvas answered with something other than JSON"""
+
+
+def make_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def canvas_host(canvas_url):
+    """Reduce a Canvas domain or URL to its bare host"""
+    clean_url = canvas_url.replace('https://', '').replace('http://', '').strip('/')
+    return clean_url.split('/')[0]
+
+
+def get_base_url(canvas_url):
+    """Construct base URL from canvas domain"""
+    return f"https://{canvas_host(canvas_url)}/api/v1"
+
+
+def numbered_page_urls(next_url, last_url):
+    """URLs for every page from next to last, or None when Canvas gave no page count"""
+    if not next_url or not last_url:
+        return None
+
+    next_match = _PAGE_PARAM.search(next_url)
+    last_match = _PAGE_PARAM.search(last_url)
+    if not next_match or not last_match:
+        # Bookmark-style cursors can only be walked one page at a time
+        return None
+
+    first = int(next_match.group(2))
+    last = int(last_match.group(2))
+    return [
+        _PAGE_PARAM.sub(lambda m: f"{m.group(1)}{n}", next_url, count=1)
+        for n in range(first, last + 1)
+    ]
+
+
+class _Validated:
+    __slots__ = ('etag', 'last_modified', 'headers', 'body')
+
+    def __init__(self, etag, last_modified, headers, body):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.headers = headers
+        self.body = body
+
+
+class ValidatorStore:
+    """ETag/Last-Modified validators and bodies of earlier 200 responses, per token and URL"""
+
+    def __init__(self, max_bytes=VALIDATOR_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+    def request_headers(self, key):
+        """Conditional headers for a request, plus the stored entry they refer to"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return {}, None
+            self._entries.move_to_end(key)
+
+        headers = {}
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers, entry
+
+    def remember(self, key, headers, body):
+        """Keep a 200's body if Canvas gave it a validator"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        if len(body) > self.max_bytes:
+            return
+
+        replayed = {name: headers[name] for name in REPLAYED_HEADERS if name in headers}
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = _Validated(etag, last_modified, replayed, body)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+
+def revalidation_stats(client):
+    """How often conditional requests came back 304 and the body bytes that saved"""
+    conditional = client.conditional_count
+    return {
+        'conditional_requests': conditional,
+        'not_modified': client.not_modified_count,
+        'hit_rate': client.not_modified_count / conditional if conditional else None,
+        'body_bytes': client.body_bytes,
+        'bytes_saved': client.bytes_saved,
+        'store': client.validators.stats()
+    }
+
+
+class CanvasClient:
+    """Keep-alive HTTP client for a single Canvas host"""
+
+    def __init__(self, host, pool_maxsize=POOL_MAXSIZE, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.base_url = f"https://{host}/api/v1"
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+
+        self.session = requests.Session()
+        # The session is shared by every user of this host, so never let
+        # Canvas session cookies from one user ride along on another's request
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        # Shared by every caller on this host so per-token limits hold across requests
+        self.limiter = RateLimiter()
+        self.validators = ValidatorStore()
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.sequential_pages = 0
+        self.parallel_pages = 0
+        self.conditional_count = 0
+        self.not_modified_count = 0
+        self.body_bytes = 0
+        self.bytes_saved = 0
+
+    def url(self, path):
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, token, timeout=None, conditional=False, **kwargs):
+        """GET a Canvas API path (or absolute pagination URL) with the user's token.
+        
+        Waits for the token's rate-limit budget first, and retries with
+        backoff when Canvas says the token is throttled. With conditional=True
+        the request carries the validators of the last 200 for this URL, and
+        a 304 comes back as that 200's body.
+        """
+        key = token_key(token)
+        headers = make_headers(token)
+        stored = None
+        if conditional:
+            validators, stored = self.validators.request_headers((key, self.url(path)))
+            headers.update(validators)
+        
+        started = time.perf_counter()
+        response, attempt = self._send('GET', path, key, headers, timeout, started, **kwargs)
+        
+        not_modified = response.status_code == 304 and stored is not None
+        with self._lock:
+            self.body_bytes += len(response.content)
+            if conditional:
+                self.conditional_count += 1
+                if not_modified:
+                    self.not_modified_count += 1
+                    self.bytes_saved += len(stored.body)
+        tracing.record_canvas_call(
+            self.url(path), response.status_code, len(response.content),
+            time.perf_counter() - started, attempt - 1, not_modified
+        )
+        
+        if not conditional:
+            return response
+        if not_modified:
+            response.status_code = 200
+            response.reason = 'OK'
+            response.headers.update(stored.headers)
+            response._content = stored.body
+        elif response.status_code == 200:
+            self.validators.remember((key, self.url(path)), response.headers, response.content)
+        return response
+
+    def post(self, path, token, json, timeout=None):
+        """POST a JSON body to a Canvas path or absolute URL, under the same rate limiting as get()"""
+        headers = make_headers(token)
+        started = time.perf_counter()
+        response, attempt = self._send('POST', path, token_key(token), headers, timeout, started, json=json)
+        with self._lock:
+            self.body_bytes += len(response.content)
+        tracing.record_canvas_call(
+            self.url(path), response.status_code, len(response.content),
+            time.perf_counter() - started, attempt - 1
+        )
+        return response
+
+    def _send(self, method, path, key, headers, timeout, started, **kwargs):
+        """One call within the token's budget, retried with backoff while Canvas says it's throttled; returns (response, attempts)"""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire(key)
+            with self._lock:
+                self.request_count += 1
+            try:
+                response = self.session.request(
+                    method,
+                    self.url(path),
+                    headers=headers,
+                    timeout=timeout or self.timeout,
+                    **kwargs
+                )
+            except requests.exceptions.RequestException:
+                self.limiter.release(key)
+                with self._lock:
+                    self.error_count += 1
+                tracing.record_canvas_call(self.url(path), 'error', 0, time.perf_counter() - started, attempt - 1)
+                raise
+            
+            throttled = response.status_code in (403, 429) and is_throttled(response.status_code, response.text)
+            self.limiter.release(key, response.headers, throttled)
+            if not throttled or attempt > THROTTLE_RETRIES:
+                return response, attempt
+            print(f"Canvas rate limit hit on {self.host}, backing off (attempt {attempt})")
+
+    def get_json_page(self, path, token, timeout=None, retries=2, retry_delay=2):
+        """GET one JSON page, retrying timeouts and non-JSON answers; returns (data, response)"""
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = self.get(path, token, timeout=timeout, conditional=True)
+                response.raise_for_status()
+
+                # Check if response is JSON
+                content_type = response.headers.get('Content-Type', '')
+                if 'application/json' in content_type:
+                    return response.json(), response
+
+                print(f"Non-JSON response for {self.url(path)}: {content_type}")
+                print(f"Response preview: {response.text[:200]}")
+                if attempt >= retries:
+                    raise InvalidCanvasResponse(content_type)
+            except requests.exceptions.Timeout:
+                if attempt >= retries:
+                    raise
+                print(f"Timeout for {self.url(path)}, retrying...")
+            time.sleep(retry_delay)
+
+    def iter_pages(self, path, token, timeout=None, fanout=PAGE_FANOUT):
+        """Yield each page of a paginated Canvas listing, in order"""
+        page, response = self.get_json_page(path, token, timeout=timeout)
+        yield page
+
+        next_url = response.links.get('next', {}).get('url')
+        last_url = response.links.get('last', {}).get('url')
+        urls = numbered_page_urls(next_url, last_url)
+
+        if urls is None:
+            # Page count unknown: follow rel="next" cursors one at a time
+            while next_url:
+                page, response = self.get_json_page(next_url, token, timeout=timeout)
+                with self._lock:
+                    self.sequential_pages += 1
+                yield page
+                next_url = response.links.get('next', {}).get('url')
+            return
+
+        # Page count known from rel="last": fetch the rest concurrently and
+        # hand them back in page order so callers see the sequential result
+        with ThreadPoolExecutor(max_workers=max(1, min(fanout, len(urls)))) as executor:
+            fetch = tracing.propagate(self.get_json_page)
+            futures = [executor.submit(fetch, url, token, timeout) for url in urls]
+            try:
+                for future in futures:
+                    page, _ = future.result()
+                    with self._lock:
+                        self.parallel_pages += 1
+                    yield page
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def get_all(self, path, token, timeout=None):
+        """Fetch every page of a paginated Canvas listing into one list"""
+        items = []
+        for page in self.iter_pages(path, token, timeout=timeout):
+            items.extend(page)
+        return items
+
+    def stats(self):
+        """Pool usage for this host: a hit reuses a kept-alive connection, a miss opens a new one"""
+        opened = 0
+        served = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+
+        return {
+            'host': self.host,
+            'requests': self.request_count,
+            'errors': self.error_count,
+            'sequential_pages': self.sequential_pages,
+            'parallel_pages': self.parallel_pages,
+            'pool_hits': max(served - opened, 0),
+            'pool_misses': opened,
+            'pool_maxsize': self.pool_maxsize,
+            'rate_limit': self.limiter.stats(),
+            'revalidation': revalidation_stats(self)
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def get_client(canvas_url):
+    """Return the shared pooled client for a Canvas host, creating it on first use"""
+    host = canvas_host(canvas_url)
+    with _clients_lock:
+        client = _clients.get(host)
+        if client is not None:
+            _clients.move_to_end(host)
+            return client
+
+        client = CanvasClient(host)
+        _clients[host] = client
+        # Bound the number of hosts so arbitrary canvasUrl values can't grow this forever
+        while len(_clients) > MAX_HOSTS:
+            _, evicted = _clients.popitem(last=False)
+            evicted.close()
+        return client
+
+
+def client_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return [c.stats() for c in clients]
@@ -0,0 +1,197 @@
+"""Load a course's submissions and assignment groups through Canvas's GraphQL API.
+
+One cursor-paginated query returns the groups (weights and drop rules)
+and every assignment with the user's own submission, asking only for the
+fields the grade engine and the frontend read. The result is converted
+to the same projected shapes the REST path produces, so the cache,
+sessions and grade engine can't tell which path loaded a course. Any
+failure raises GraphQLUnavailable so the caller can fall back to REST.
+"""
+import os
+from datetime import datetime, timezone
+
+import httpx
+import requests
+
+from projection import project_groups, project_submissions
+
+# How courses are loaded when a request doesn't say: 'rest' or 'graphql'
+DEFAULT_FETCH = os.environ.get('CANVAS_FETCH', 'rest').lower()
+# Assignments per GraphQL page; each carries the user's submission
+PAGE_SIZE = int(os.environ.get('CANVAS_GRAPHQL_PAGE_SIZE', 100))
+
+COURSE_QUERY = """
+query CourseGrades($courseId: ID!, $first: Int!, $after: String, $withGroups: Boolean!) {
+  course(id: $courseId) {
+    assignmentGroupsConnection @include(if: $withGroups) {
+      nodes {
+        _id
+        name
+        position
+        groupWeight
+        rules { dropLowest dropHighest neverDrop { _id } }
+      }
+    }
+    assignmentsConnection(first: $first, after: $after) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        _id
+        name
+        assignmentGroupId
+        pointsPossible
+        omitFromFinalGrade
+        dueAt
+        htmlUrl
+        submissionsConnection(filter: {states: [unsubmitted, submitted, pending_review, graded]}) {
+          nodes { score excused missing gradedAt }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+class GraphQLUnavailable(Exception):
+    """The GraphQL fetch failed; the REST path should be used instead"""
+
+
+def wants_graphql(data, snapshots=None):
+    """Whether a request asked for the GraphQL path ("fetch": "graphql"), or CANVAS_FETCH does.
+
+    The snapshot store syncs deltas over REST, so it always wins.
+    """
+    if snapshots is not None:
+        return False
+    return (data.get('fetch') or DEFAULT_FETCH).lower() == 'graphql'
+
+
+def graphql_url(client):
+    """Canvas serves GraphQL at /api/graphql next to the /api/v1 REST root"""
+    root = client.base_url.rstrip('/')
+    if root.endswith('/v1'):
+        root = root[:-len('/v1')]
+    return f"{root}/graphql"
+
+
+def _id(value):
+    return int(value) if isinstance(value, str) and value.isdigit() else value
+
+
+def _utc(value):
+    """GraphQL timestamps carry the user's offset; REST gives UTC with a Z, which sorts as text"""
+    if not value:
+        return value
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _group(node):
+    rules = node.get('rules') or {}
+    converted = {}
+    if rules.get('dropLowest'):
+        converted['drop_lowest'] = rules['dropLowest']
+    if rules.get('dropHighest'):
+        converted['drop_highest'] = rules['dropHighest']
+    if rules.get('neverDrop'):
+        converted['never_drop'] = [_id(a['_id']) for a in rules['neverDrop']]
+    return {
+        'id': _id(node['_id']),
+        'name': node.get('name'),
+        'position': node.get('position'),
+        'group_weight': node.get('groupWeight'),
+        'rules': converted
+    }
+
+
+def _submissions(node):
+    """REST-shaped submissions for one assignment node; none when the user has no submission for it"""
+    assignment = {
+        'id': _id(node['_id']),
+        'name': node.get('name'),
+        'assignment_group_id': _id(node.get('assignmentGroupId')),
+        'points_possible': node.get('pointsPossible'),
+        'omit_from_final_grade': node.get('omitFromFinalGrade'),
+        'due_at': _utc(node.get('dueAt')),
+        'html_url': node.get('htmlUrl')
+    }
+    return [
+        {
+            'assignment_id': assignment['id'],
+            'score': submission.get('score'),
+            'excused': submission.get('excused'),
+            'missing': submission.get('missing'),
+            'graded_at': _utc(submission.get('gradedAt')),
+            'assignment': assignment
+        }
+        for submission in ((node.get('submissionsConnection') or {}).get('nodes') or [])
+    ]
+
+
+def page_variables(course_id, cursor):
+    return {'courseId': str(course_id), 'first': PAGE_SIZE, 'after': cursor, 'withGroups': cursor is None}
+
+
+def read_page(response):
+    """(submissions, groups or None, next cursor or None) from one GraphQL response"""
+    if response.status_code != 200:
+        raise GraphQLUnavailable(f'HTTP {response.status_code}')
+    try:
+        body = response.json()
+    except ValueError:
+        raise GraphQLUnavailable('response was not JSON')
+    if body.get('errors'):
+        raise GraphQLUnavailable('; '.join(e.get('message', '?') for e in body['errors']))
+
+    course = (body.get('data') or {}).get('course')
+    if course is None:
+        raise GraphQLUnavailable('course not found')
+
+    try:
+        groups = None
+        if 'assignmentGroupsConnection' in course:
+            groups = [_group(node) for node in course['assignmentGroupsConnection']['nodes']]
+        connection = course['assignmentsConnection']
+        submissions = [s for node in connection['nodes'] for s in _submissions(node)]
+        page_info = connection['pageInfo']
+    except (KeyError, TypeError, ValueError) as e:
+        raise GraphQLUnavailable(f'unexpected response shape: {e!r}')
+    return submissions, groups, page_info['endCursor'] if page_info.get('hasNextPage') else None
+
+
+def fetch_course(client, token, course_id, timeout=45):
+    """(submissions, groups) for the user's course in projected REST shapes, walking the GraphQL cursor"""
+    submissions = []
+    groups = None
+    cursor = None
+    while True:
+        try:
+            response = client.post(graphql_url(client), token, {
+                'query': COURSE_QUERY, 'variables': page_variables(course_id, cursor)
+            }, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            raise GraphQLUnavailable(str(e))
+        page, page_groups, cursor = read_page(response)
+        submissions.extend(page)
+        groups = page_groups if groups is None else groups
+        if cursor is None:
+            return project_submissions(submissions), project_groups(groups or [])
+
+
+async def fetch_course_async(client, token, course_id, timeout=45):
+    """fetch_course on the asyncio client"""
+    submissions = []
+    groups = None
+    cursor = None
+    while True:
+        try:
+            response = await client.post(graphql_url(client), token, {
+                'query': COURSE_QUERY, 'variables': page_variables(course_id, cursor)
+            }, timeout=timeout)
+        except httpx.HTTPError as e:
+            raise GraphQLUnavailable(str(e))
+        page, page_groups, cursor = read_page(response)
+        submissions.extend(page)
+        groups = page_groups if groups is None else groups
+        if cursor is None:
+            return project_submissions(submissions), project_groups(groups or [])
@@ -0,0 +1,106 @@
+"""Grades for every active course in one call.
+
+Courses are loaded on a bounded pool (threads for Flask, a semaphore for
+the ASGI app) and reported as each one finishes, so one slow course only
+delays its own line of the response.
+"""
+import asyncio
+import concurrent.futures
+import os
+import time
+
+import tracing
+
+# Courses loaded at once for one dashboard request; each still goes through the token's rate limiter
+DASHBOARD_CONCURRENCY = int(os.environ.get('DASHBOARD_CONCURRENCY', 4))
+# Seconds one course may take from when its load starts before it's reported as timed out
+COURSE_TIMEOUT = float(os.environ.get('DASHBOARD_COURSE_TIMEOUT', 30))
+
+
+def course_timeout(timeout):
+    return TimeoutError(f'Course took longer than {timeout:g}s to load')
+
+
+def course_grades(course, model, groups):
+    """A course's computed grade and per-group breakdown from its compiled grade model"""
+    totals = model.breakdown()
+    breakdown = []
+    for group in groups:
+        result = totals.get(group.get('id'))
+        earned, possible = result if result is not None else (None, None)
+        breakdown.append({
+            'id': group.get('id'),
+            'name': group.get('name'),
+            'weight': group.get('group_weight') or 0,
+            'earned': earned,
+            'possible': possible,
+            'percentage': (earned / possible) * 100 if possible else None
+        })
+
+    return {
+        'id': course.get('id'),
+        'name': course.get('name'),
+        'grade': model.grade(),
+        'current_score': course.get('current_score'),
+        'current_grade': course.get('current_grade'),
+        'groups': breakdown
+    }
+
+
+def fan_out(items, work, max_workers=DASHBOARD_CONCURRENCY, timeout=COURSE_TIMEOUT):
+    """Run work(item) for every item on a bounded thread pool, yielding (item, result, error) as each finishes.
+
+    An item still running timeout seconds after it started is yielded with
+    a TimeoutError; its thread is left to finish in the background, so what
+    it fetched still lands in the cache. Closing the generator cancels the
+    items that haven't started.
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    started = {}
+
+    def run(position):
+        started[position] = time.monotonic()
+        return work(items[position])
+
+    run = tracing.propagate(run)
+    pending = {executor.submit(run, position): position for position in range(len(items))}
+    try:
+        while pending:
+            deadlines = [started[p] + timeout for p in pending.values() if p in started]
+            wait = max(0, min(deadlines) - time.monotonic()) if deadlines else timeout
+            done, _ = concurrent.futures.wait(pending, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                position = pending.pop(future)
+                error = future.exception()
+                yield items[position], None if error else future.result(), error
+
+            now = time.monotonic()
+            for future, position in list(pending.items()):
+                if position in started and now - started[position] >= timeout:
+                    del pending[future]
+                    yield items[position], None, course_timeout(timeout)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def async_fan_out(items, work, max_workers=DASHBOARD_CONCURRENCY, timeout=COURSE_TIMEOUT):
+    """fan_out for coroutines: at most max_workers of work(item) run at once, each cancelled after timeout"""
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(item):
+        async with semaphore:
+            try:
+                return item, await asyncio.wait_for(work(item), timeout), None
+            except asyncio.TimeoutError:
+                return item, None, course_timeout(timeout)
+            except Exception as e:
+                return item, None, e
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,30 @@
+"""Canvas course grades, shared by the API (app.py, asgi.py) and the CLI (main.py).
+
+compile_course() is the fast path: groups are compiled once into parallel
+arrays, and CompiledCourse.grade(), grade_many() and IncrementalGrade
+evaluate what-if scenarios without building per-assignment dicts.
+compile_roster() grades every student in a course at once with NumPy, and
+grade_timeline() replays a course's grades in graded_at order in one pass.
+sensitivities() ranks assignments by how far full credit versus a zero
+would move the grade.
+reference_grade() is the slow path that states the rules plainly; run
+`python -m grade_engine.oracle` from backend/ to check the others agree.
+"""
+from .model import CompiledCourse, CompiledGroup, IncrementalGrade, compile_course
+from .reference import reference_grade
+from .roster import CompiledRoster, RosterGrades, compile_roster
+from .sensitivity import sensitivities
+from .solver import required_scores
+from .timeline import grade_timeline
+
+
+def calculate_grade(assignments, assignment_groups, modifications=None, normalize=True):
+    """Grade a Canvas payload once through the fast path"""
+    return compile_course(assignments, assignment_groups, normalize).grade(modifications)
+
+
+__all__ = [
+    'CompiledCourse', 'CompiledGroup', 'CompiledRoster', 'IncrementalGrade', 'RosterGrades',
+    'calculate_grade', 'compile_course', 'compile_roster', 'grade_timeline', 'reference_grade',
+    'required_scores', 'sensitivities'
+]
@@ -0,0 +1,348 @@
+from array import array
+from bisect import bisect_left, insort
+from operator import itemgetter
+
+# Marks an ungraded slot in a group's score array
+UNGRADED = float('nan')
+
+_by_percentage = itemgetter(0)
+
+
+def _as_score(value):
+    return UNGRADED if value is None else value
+
+
+class CompiledGroup:
+    """One assignment group reduced to parallel arrays of its gradable assignments"""
+
+    __slots__ = (
+        'group_id', 'weight', 'drop_lowest', 'drop_highest',
+        'indices', 'scores', 'possible', 'never_drop'
+    )
+
+    def __init__(self, group_id, weight, drop_lowest, drop_highest):
+        self.group_id = group_id
+        self.weight = weight
+        self.drop_lowest = drop_lowest
+        self.drop_highest = drop_highest
+        # Position of each slot in the original submissions list
+        self.indices = array('q')
+        self.scores = array('d')
+        self.possible = array('d')
+        self.never_drop = bytearray()
+
+    def add(self, index, score, possible, never_drop):
+        self.indices.append(index)
+        self.scores.append(_as_score(score))
+        self.possible.append(possible)
+        self.never_drop.append(1 if never_drop else 0)
+
+    def counted(self, overrides=None):
+        """The (earned, possible) pairs that count after drop rules, in summation order"""
+        never_drop = []
+        droppable = []
+        scores = self.scores
+        possible = self.possible
+        flags = self.never_drop
+
+        for slot in range(len(scores)):
+            earned = scores[slot]
+            if overrides and slot in overrides:
+                earned = _as_score(overrides[slot])
+            if earned != earned:
+                continue
+
+            if flags[slot]:
+                never_drop.append((earned, possible[slot]))
+            else:
+                droppable.append(((earned / possible[slot]) * 100, earned, possible[slot]))
+
+        droppable.sort(key=_by_percentage)
+        if self.drop_lowest > 0 and len(droppable) > self.drop_lowest:
+            droppable = droppable[self.drop_lowest:]
+        if self.drop_highest > 0 and len(droppable) > self.drop_highest:
+            droppable = droppable[:-self.drop_highest]
+
+        return never_drop + [(earned, points) for _, earned, points in droppable]
+
+    def graded(self, overrides=None):
+        """Every graded (earned, possible) pair, ignoring drop rules"""
+        result = []
+        scores = self.scores
+        for slot in range(len(scores)):
+            earned = scores[slot]
+            if overrides and slot in overrides:
+                earned = _as_score(overrides[slot])
+            if earned == earned:
+                result.append((earned, self.possible[slot]))
+        return result
+
+
+class CompiledCourse:
+    """Canvas submissions and assignment groups compiled once for repeated grade evaluation.
+
+    grade() returns exactly what reference_grade returns for the same
+    payload and modifications, without rebuilding dicts on every call. With
+    normalize=False the weighted grade is not rescaled when group weights
+    don't add up to 100.
+    """
+
+    __slots__ = ('groups', 'slots', 'normalize')
+
+    def __init__(self, groups, slots, normalize=True):
+        self.groups = groups
+        # Original submission index -> (group position, slot within group)
+        self.slots = slots
+        self.normalize = normalize
+
+    def split_modifications(self, modifications):
+        """Route {submission index: score} to {group position: {slot: score}}"""
+        overrides = {}
+        if not modifications:
+            return overrides
+        for index, value in modifications.items():
+            location = self.slots.get(index)
+            if location is not None:
+                overrides.setdefault(location[0], {})[location[1]] = value
+        return overrides
+
+    def group_totals(self, position, overrides=None):
+        """(earned, possible) for one group after drop rules, or None when nothing in it is graded"""
+        counted = self.groups[position].counted(overrides)
+        if not counted:
+            return None
+        return sum(a[0] for a in counted), sum(a[1] for a in counted)
+
+    def combine(self, totals, graded):
+        """Weighted course grade from per-group totals; graded() is only called for the unweighted fallback"""
+        total_weight = 0
+        weighted_grade = 0
+        for group, result in zip(self.groups, totals):
+            if result is None:
+                continue
+
+            group_earned, group_possible = result
+            if group_possible > 0:
+                group_percentage = (group_earned / group_possible) * 100
+                weighted_grade += (group_percentage * group.weight / 100)
+                total_weight += group.weight
+
+        if total_weight == 0:
+            all_graded = [pair for pairs in graded() for pair in pairs]
+            if len(all_graded) == 0:
+                return None
+
+            total_earned = sum(a[0] for a in all_graded)
+            total_possible = sum(a[1] for a in all_graded)
+            return (total_earned / total_possible) * 100
+
+        # Normalize the grade if weights don't add up to 100%
+        if self.normalize and total_weight > 0 and total_weight != 100:
+            weighted_grade = (weighted_grade / total_weight) * 100
+
+        return weighted_grade
+
+    def grade(self, modifications=None):
+        overrides = self.split_modifications(modifications)
+        totals = [self.group_totals(p, overrides.get(p)) for p in range(len(self.groups))]
+        return self.combine(
+            totals,
+            lambda: [g.graded(overrides.get(p)) for p, g in enumerate(self.groups)]
+        )
+
+    def breakdown(self, modifications=None):
+        """{group id: (earned, possible) after drop rules, or None} for every group with gradable assignments"""
+        overrides = self.split_modifications(modifications)
+        return {
+            group.group_id: self.group_totals(p, overrides.get(p))
+            for p, group in enumerate(self.groups)
+        }
+
+    def grade_many(self, scenarios):
+        """Grade every modification set in scenarios, sharing work between them.
+
+        Groups a scenario doesn't touch reuse the unmodified totals, and a
+        group modified the same way by several scenarios is evaluated once.
+        Each result equals grade(scenario).
+        """
+        count = len(self.groups)
+        baseline = [self.group_totals(p) for p in range(count)]
+        baseline_graded = []
+        memo = {}
+
+        def graded_for(overrides):
+            if not baseline_graded:
+                baseline_graded.extend(g.graded() for g in self.groups)
+            return [
+                self.groups[p].graded(overrides[p]) if p in overrides else baseline_graded[p]
+                for p in range(count)
+            ]
+
+        grades = []
+        for modifications in scenarios:
+            overrides = self.split_modifications(modifications)
+            totals = baseline
+            if overrides:
+                totals = list(baseline)
+                for position, group_overrides in overrides.items():
+                    key = (position, tuple(sorted(group_overrides.items())))
+                    if key not in memo:
+                        memo[key] = self.group_totals(position, group_overrides)
+                    totals[position] = memo[key]
+            grades.append(self.combine(totals, lambda: graded_for(overrides)))
+        return grades
+
+
+def compile_course(assignments, assignment_groups, normalize=True):
+    """Build a CompiledCourse from raw Canvas submissions and assignment groups"""
+    group_map = {g['id']: g for g in assignment_groups}
+    compiled = {}
+    never_drop_ids = {}
+    slots = {}
+
+    for i, s in enumerate(assignments):
+        assignment = s.get("assignment", {})
+        if assignment.get('omit_from_final_grade', False):
+            continue
+
+        group_id = assignment.get("assignment_group_id")
+        group = compiled.get(group_id)
+        if group is None:
+            group_info = group_map.get(group_id, {})
+            rules = group_info.get('rules') or {}
+            group = CompiledGroup(
+                group_id,
+                group_info.get('group_weight') or 0,
+                rules.get('drop_lowest') or 0,
+                rules.get('drop_highest') or 0
+            )
+            compiled[group_id] = group
+            never_drop_ids[group_id] = rules.get('never_drop') or []
+
+        # Assignments worth no points can never count toward the grade
+        points_possible = assignment.get("points_possible") or 0
+        if points_possible <= 0:
+            continue
+
+        slots[i] = (group_id, len(group.indices))
+        group.add(i, s.get("score"), points_possible, assignment.get("id") in never_drop_ids[group_id])
+
+    groups = [g for g in compiled.values() if len(g.indices)]
+    positions = {g.group_id: position for position, g in enumerate(groups)}
+    slots = {i: (positions[group_id], slot) for i, (group_id, slot) in slots.items()}
+    return CompiledCourse(groups, slots, normalize)
+
+
+class _GroupState:
+    """Running state of one group: graded slots, never-drop slots and drop candidates in order"""
+
+    __slots__ = ('group', 'values', 'never_drop', 'candidates', 'totals')
+
+    def __init__(self, group):
+        self.group = group
+        # (earned, possible) per slot, None while ungraded
+        self.values = [None] * len(group.scores)
+        # (slot, earned, possible), kept in slot order
+        self.never_drop = []
+        # (percentage, slot, earned, possible); sorting on slot second keeps
+        # ties in the same order as the stable sort in CompiledGroup.counted
+        self.candidates = []
+        for slot, earned in enumerate(group.scores):
+            if earned == earned:
+                self._insert(slot, earned)
+        self.totals = self._totals()
+
+    def _insert(self, slot, earned):
+        possible = self.group.possible[slot]
+        self.values[slot] = (earned, possible)
+        if self.group.never_drop[slot]:
+            insort(self.never_drop, (slot, earned, possible))
+        else:
+            insort(self.candidates, ((earned / possible) * 100, slot, earned, possible))
+
+    def _remove(self, slot):
+        earned, possible = self.values[slot]
+        self.values[slot] = None
+        if self.group.never_drop[slot]:
+            entries, entry = self.never_drop, (slot, earned, possible)
+        else:
+            entries, entry = self.candidates, ((earned / possible) * 100, slot, earned, possible)
+        del entries[bisect_left(entries, entry)]
+
+    def set(self, slot, earned):
+        if self.values[slot] is not None:
+            self._remove(slot)
+        if earned is not None and earned == earned:
+            self._insert(slot, earned)
+        self.totals = self._totals()
+
+    def _totals(self):
+        candidates = self.candidates
+        drop_lowest = self.group.drop_lowest
+        drop_highest = self.group.drop_highest
+
+        start = drop_lowest if drop_lowest > 0 and len(candidates) > drop_lowest else 0
+        end = len(candidates)
+        if drop_highest > 0 and end - start > drop_highest:
+            end -= drop_highest
+
+        counted = [(earned, possible) for _, earned, possible in self.never_drop]
+        counted.extend((earned, possible) for _, _, earned, possible in candidates[start:end])
+        if not counted:
+            return None
+        return sum(a[0] for a in counted), sum(a[1] for a in counted)
+
+    def graded(self):
+        return [value for value in self.values if value is not None]
+
+
+class IncrementalGrade:
+    """What-if evaluator that only re-evaluates the group containing each edited score.
+
+    Each group keeps its drop candidates ordered by percentage, so an edit is
+    a remove and an ordered insert rather than a re-sort of the group. grade()
+    always equals model.grade(current modifications).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.states = [_GroupState(group) for group in model.groups]
+        self.modifications = {}
+
+    def set_score(self, index, score):
+        """Override the score of one submission; None marks it ungraded"""
+        self.modifications[index] = score
+        self._refresh(index)
+
+    def reset_score(self, index):
+        """Drop the override on one submission, going back to its Canvas score"""
+        self.modifications.pop(index, None)
+        self._refresh(index)
+
+    def apply(self, modifications):
+        """Move to a whole new modification set, touching only the submissions that changed"""
+        for index in list(self.modifications):
+            if index not in modifications:
+                del self.modifications[index]
+                self._refresh(index)
+        for index, score in modifications.items():
+            if index not in self.modifications or self.modifications[index] != score:
+                self.modifications[index] = score
+                self._refresh(index)
+
+    def _refresh(self, index):
+        location = self.model.slots.get(index)
+        if location is None:
+            return
+        position, slot = location
+        if index in self.modifications:
+            score = self.modifications[index]
+        else:
+            score = self.model.groups[position].scores[slot]
+        self.states[position].set(slot, score)
+
+    def grade(self):
+        return self.model.combine(
+            [state.totals for state in self.states],
+            lambda: [state.graded() for state in self.states]
+        )
@@ -0,0 +1,215 @@
+"""Randomized differential check of the fast grade paths against reference_grade.
+
+    cd backend && python -m grade_engine.oracle --cases 5000 --seed 1
+
+Each case is a random course (drop rules, never_drop lists, omitted and
+zero-point assignments, zero, null and uneven group weights, null rules,
+assignments outside any group) plus random what-if modifications. The
+compiled model, grade_many() and IncrementalGrade must all return exactly
+what reference_grade returns, with and without normalization. When numpy is
+installed the course is also given a random roster of students, whose
+compile_roster() grades must match reference_grade per student to within
+TOLERANCE. grade_timeline() must match reference_grade on every graded
+prefix to within TOLERANCE too, and so must every full-credit and zero
+grade from sensitivities(). Exits 1 and prints the first failing cases if any differ.
+"""
+import argparse
+import json
+import random
+import sys
+
+from .model import IncrementalGrade, compile_course
+from .reference import reference_grade
+from .roster import compile_roster, np
+from .sensitivity import sensitivities
+from .timeline import grade_timeline
+
+# compile_roster, grade_timeline and sensitivities sum in a different order than reference_grade
+TOLERANCE = 1e-9
+
+
+def random_course(rng):
+    """(submissions, assignment groups) shaped like Canvas's payloads"""
+    count = rng.randint(0, 40)
+    group_ids = list(range(100, 100 + rng.randint(1, 5)))
+    weights = rng.choice([
+        [0] * len(group_ids),
+        [rng.choice([0, 10, 25, 40, 100, None]) for _ in group_ids],
+        [rng.randint(0, 50) for _ in group_ids]
+    ])
+
+    submissions = []
+    for i in range(count):
+        points = rng.choice([10, 20, 5, 0, None, 7.5, 100, 3])
+        score = rng.choice([None, rng.randint(0, 25), rng.uniform(0, 20), 0, round(rng.uniform(0, 10), 1)])
+        group_id = rng.choice(group_ids + [None, 999]) if rng.random() < 0.1 else rng.choice(group_ids)
+        submissions.append({
+            'score': score,
+            'assignment': {
+                'id': 1000 + i,
+                'name': f'Assignment {i}',
+                'points_possible': points,
+                'assignment_group_id': group_id,
+                'omit_from_final_grade': rng.random() < 0.1
+            }
+        })
+
+    groups = []
+    for group_id, weight in zip(group_ids, weights):
+        rules = {}
+        if rng.random() < 0.5:
+            rules['drop_lowest'] = rng.randint(0, 3)
+        if rng.random() < 0.3:
+            rules['drop_highest'] = rng.randint(0, 2)
+        if rng.random() < 0.3:
+            rules['never_drop'] = [1000 + rng.randrange(max(count, 1)) for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.05:
+            rules = None
+        groups.append({'id': group_id, 'name': f'Group {group_id}', 'group_weight': weight, 'rules': rules})
+    return submissions, groups
+
+
+def random_modifications(rng, count):
+    return {
+        rng.randrange(max(count, 1)): rng.choice([None, rng.uniform(0, 15), rng.randint(0, 10), 0])
+        for _ in range(rng.randint(0, 4))
+    }
+
+
+def check(submissions, groups, scenarios, normalize):
+    """Descriptions of every way the fast paths disagree with the reference"""
+    failures = []
+    expected = [reference_grade(submissions, groups, m, normalize) for m in scenarios]
+    model = compile_course(submissions, groups, normalize)
+
+    for modifications, want in zip(scenarios, expected):
+        got = model.grade(modifications)
+        if got != want:
+            failures.append(f'grade({modifications}) = {got}, reference {want}')
+
+    batch = model.grade_many(scenarios)
+    if batch != expected:
+        failures.append(f'grade_many = {batch}, reference {expected}')
+
+    # Walk the same scenarios one after another, as a what-if session would
+    evaluator = IncrementalGrade(model)
+    for modifications, want in zip(scenarios, expected):
+        evaluator.apply(modifications)
+        got = evaluator.grade()
+        if got != want:
+            failures.append(f'IncrementalGrade after {modifications} = {got}, reference {want}')
+    return failures
+
+
+def random_roster(rng, submissions):
+    """Flat student_ids[]=all submissions for a few students over the course's assignments"""
+    roster = []
+    for user_id in rng.sample(range(1, 200), rng.randint(1, 6)):
+        for s in submissions:
+            if rng.random() < 0.1:
+                continue
+            score = rng.choice([None, rng.randint(0, 25), rng.uniform(0, 20), 0, s['score']])
+            roster.append({'user_id': user_id, 'assignment_id': s['assignment']['id'], 'score': score})
+    return roster
+
+
+def close(got, want):
+    return (got is None) == (want is None) and (want is None or abs(got - want) <= TOLERANCE)
+
+
+def check_timeline(rng, submissions, groups, normalize):
+    """Every timeline point that differs from reference_grade on the submissions graded by then"""
+    dated = [dict(s, graded_at=rng.choice([None, f'2024-01-{rng.randint(1, 9):02d}'])) for s in submissions]
+    timeline = grade_timeline(compile_course(dated, groups, normalize), dated)
+
+    seen = {i for i, s in enumerate(dated) if not s['graded_at']}
+    prefixes = [('start', timeline['start'])] + list(zip(timeline['indices'], timeline['grades']))
+    failures = []
+    for indices, got in prefixes:
+        if indices != 'start':
+            seen.update(indices)
+        ungraded = {i: None for i in range(len(dated)) if i not in seen}
+        want = reference_grade(dated, groups, ungraded, normalize)
+        if not close(got, want):
+            failures.append(f'timeline after {indices} = {got}, reference {want}')
+    return failures
+
+
+def check_sensitivities(submissions, groups, modifications, normalize):
+    """Every full-credit or zero grade from sensitivities() that differs from reference_grade"""
+    failures = []
+    result = sensitivities(compile_course(submissions, groups, normalize), modifications)
+    want = reference_grade(submissions, groups, modifications, normalize)
+    if not close(result['grade'], want):
+        failures.append(f'sensitivity baseline with {modifications} = {result["grade"]}, reference {want}')
+
+    for entry in result['assignments']:
+        index = entry['index']
+        possible = submissions[index]['assignment']['points_possible']
+        for key, score in (('full', possible), ('zero', 0)):
+            want = reference_grade(submissions, groups, {**modifications, index: score}, normalize)
+            if not close(entry[key], want):
+                failures.append(f'sensitivity {key} for {index} with {modifications} = {entry[key]}, reference {want}')
+    return failures
+
+
+def check_roster(submissions, groups, roster, modifications, normalize):
+    """Every student whose roster grade differs from reference_grade on their own submissions"""
+    failures = []
+    assignments = [s['assignment'] for s in submissions]
+    result = compile_roster(assignments, roster, groups, normalize).grades(modifications).as_list()
+
+    for row in result:
+        scores = {s['assignment_id']: s['score'] for s in roster if s['user_id'] == row['user_id']}
+        scores.update(modifications)
+        own = [{'score': scores.get(a['id']), 'assignment': a} for a in assignments]
+        want = reference_grade(own, groups, None, normalize)
+        got = row['grade']
+        if not close(got, want):
+            failures.append(f'roster grade for {row["user_id"]} with {modifications} = {got}, reference {want}')
+    return failures
+
+
+def run(cases, seed, show=3):
+    rng = random.Random(seed)
+    failed = 0
+    for case in range(cases):
+        submissions, groups = random_course(rng)
+        scenarios = [{}] + [random_modifications(rng, len(submissions)) for _ in range(rng.randint(1, 5))]
+        for normalize in (True, False):
+            failures = check(submissions, groups, scenarios, normalize)
+            failures += check_timeline(rng, submissions, groups, normalize)
+            failures += check_sensitivities(submissions, groups, scenarios[-1], normalize)
+            if np is not None:
+                roster = random_roster(rng, submissions)
+                modifications = {
+                    submissions[i]['assignment']['id']: score
+                    for i, score in random_modifications(rng, len(submissions)).items()
+                    if i < len(submissions)
+                }
+                failures += check_roster(submissions, groups, roster, modifications, normalize)
+            if not failures:
+                continue
+            failed += 1
+            if failed <= show:
+                print(f'Case {case} (normalize={normalize}):')
+                for failure in failures:
+                    print(f'  {failure}')
+                print(f'  groups: {json.dumps(groups)}')
+                print(f'  submissions: {json.dumps(submissions)}')
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Differential check of the fast grade paths against the reference')
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failed = run(args.cases, args.seed)
+    print(f'{args.cases} cases, {failed} failing')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
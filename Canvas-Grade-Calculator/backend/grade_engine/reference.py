@@ -0,0 +1,101 @@
+def reference_grade(assignments, assignment_groups, modifications=None, normalize=True):
+    """Course grade computed straight from the Canvas payload, one dict per assignment.
+
+    This is the slow, readable statement of the grading rules that the
+    compiled model must reproduce exactly; oracle.py checks that it does.
+    Missing or null points, weights and rules all count as zero or empty.
+    """
+    group_map = {g['id']: g for g in assignment_groups}
+    grouped_assignments = {}
+
+    for i, s in enumerate(assignments):
+        assignment = s.get("assignment", {})
+        group_id = assignment.get("assignment_group_id")
+
+        if assignment.get('omit_from_final_grade', False):
+            continue
+
+        if group_id not in grouped_assignments:
+            grouped_assignments[group_id] = []
+
+        grouped_assignments[group_id].append((i, s, assignment))
+
+    total_weight = 0
+    weighted_grade = 0
+
+    for group_id, group_assignments in grouped_assignments.items():
+        group_info = group_map.get(group_id, {})
+        group_weight = group_info.get('group_weight') or 0
+        rules = group_info.get('rules') or {}
+
+        drop_lowest = rules.get('drop_lowest') or 0
+        drop_highest = rules.get('drop_highest') or 0
+        never_drop = rules.get('never_drop') or []
+
+        all_assignments = []
+        for i, s, assignment in group_assignments:
+            points_possible = assignment.get("points_possible") or 0
+            points_earned = s.get("score")
+            assignment_id = assignment.get("id")
+
+            if modifications and i in modifications:
+                points_earned = modifications[i]
+
+            if points_possible > 0 and points_earned is not None:
+                percentage = (points_earned / points_possible) * 100
+                all_assignments.append({
+                    'earned': points_earned,
+                    'possible': points_possible,
+                    'percentage': percentage,
+                    'id': assignment_id,
+                    'never_drop': assignment_id in never_drop
+                })
+
+        if len(all_assignments) > 0:
+            never_drop_assignments = [a for a in all_assignments if a.get('never_drop', False)]
+            droppable = [a for a in all_assignments if not a.get('never_drop', False)]
+            droppable_sorted = sorted(droppable, key=lambda x: x['percentage'])
+
+            if drop_lowest > 0 and len(droppable_sorted) > drop_lowest:
+                droppable_sorted = droppable_sorted[drop_lowest:]
+
+            if drop_highest > 0 and len(droppable_sorted) > drop_highest:
+                droppable_sorted = droppable_sorted[:-drop_highest]
+
+            final_assignments = never_drop_assignments + droppable_sorted
+
+            group_earned = sum(a['earned'] for a in final_assignments)
+            group_possible = sum(a['possible'] for a in final_assignments)
+
+            if group_possible > 0:
+                group_percentage = (group_earned / group_possible) * 100
+                weighted_grade += (group_percentage * group_weight / 100)
+                total_weight += group_weight
+
+    # No weighted group has graded work: fall back to total points
+    if total_weight == 0:
+        all_graded = []
+        for group_id, group_assignments in grouped_assignments.items():
+            for i, s, assignment in group_assignments:
+                points_possible = assignment.get("points_possible") or 0
+                points_earned = s.get("score")
+
+                if modifications and i in modifications:
+                    points_earned = modifications[i]
+
+                if points_earned is not None and points_possible > 0:
+                    all_graded.append({'earned': points_earned, 'possible': points_possible})
+
+        if len(all_graded) == 0:
+            return None
+
+        total_earned = sum(a['earned'] for a in all_graded)
+        total_possible = sum(a['possible'] for a in all_graded)
+        return (total_earned / total_possible) * 100
+
+    # Normalize the grade if weights don't add up to 100%
+    # Canvas does this automatically - scales the grade proportionally
+    if normalize and total_weight > 0 and total_weight != 100:
+        weighted_grade = (weighted_grade / total_weight) * 100
+
+    return weighted_grade
@@ -0,0 +1,215 @@
+"""Grades for every student in a course at once, as NumPy array operations.
+
+A course's submissions for all students are packed into a students x
+assignments score matrix (NaN where ungraded), and the same rules as
+reference_grade run over whole columns: each group's drop rules rank every
+student's scores with one stable argsort instead of a sort per student.
+numpy is optional; compile_roster raises RuntimeError when it's missing.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUMPY_AVAILABLE = np is not None
+# Width of each bucket in RosterGrades.summary()'s histogram, in percent
+HISTOGRAM_STEP = 10
+
+
+class RosterGroup:
+    """The columns of one assignment group and its rules"""
+
+    __slots__ = ('group_id', 'weight', 'drop_lowest', 'drop_highest', 'columns', 'never_drop')
+
+    def __init__(self, group_id, weight, drop_lowest, drop_highest):
+        self.group_id = group_id
+        self.weight = weight
+        self.drop_lowest = drop_lowest
+        self.drop_highest = drop_highest
+        self.columns = []
+        self.never_drop = []
+
+    def totals(self, scores, possible):
+        """(earned, possible) per student after drop rules, both 0 where nothing counts"""
+        columns = np.array(self.columns)
+        values = scores[:, columns]
+        points = possible[columns]
+        graded = ~np.isnan(values)
+        flags = np.array(self.never_drop, dtype=bool)
+
+        kept = graded & flags
+        droppable = ~flags
+        if (self.drop_lowest > 0 or self.drop_highest > 0) and droppable.any():
+            kept[:, droppable] = self._after_drops(values[:, droppable], points[droppable])
+        else:
+            kept |= graded & droppable
+
+        earned = np.where(kept, values, 0).sum(axis=1)
+        return earned, kept @ points
+
+    def _after_drops(self, values, points):
+        """Which droppable scores each student keeps once drop_lowest/drop_highest are applied"""
+        percentages = values / points * 100
+        # Stable, with NaN last: equal percentages keep column order, as sorted() does
+        order = np.argsort(percentages, axis=1, kind='stable')
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(order.shape[1])[None, :], axis=1)
+
+        count = (~np.isnan(values)).sum(axis=1)
+        start = np.zeros_like(count)
+        if self.drop_lowest > 0:
+            start = np.where(count > self.drop_lowest, self.drop_lowest, 0)
+        end = count
+        if self.drop_highest > 0:
+            end = np.where(count - start > self.drop_highest, count - self.drop_highest, count)
+        return (ranks >= start[:, None]) & (ranks < end[:, None])
+
+
+class RosterGrades:
+    """Course grades for every student in a roster; grades[i] belongs to students[i]"""
+
+    def __init__(self, students, grades):
+        self.students = students
+        self.grades = grades
+
+    def as_list(self):
+        """[{"user_id", "grade"}] with None for students with nothing graded"""
+        return [
+            {'user_id': student, 'grade': None if np.isnan(grade) else float(grade)}
+            for student, grade in zip(self.students, self.grades)
+        ]
+
+    def summary(self):
+        """Class distribution of the grades students actually have"""
+        graded = self.grades[~np.isnan(self.grades)]
+        if graded.size == 0:
+            return {'graded': 0, 'ungraded': len(self.students)}
+
+        top = max(100, int(np.ceil(graded.max() / HISTOGRAM_STEP)) * HISTOGRAM_STEP)
+        edges = np.arange(0, top + HISTOGRAM_STEP, HISTOGRAM_STEP)
+        counts, _ = np.histogram(np.clip(graded, 0, top), bins=edges)
+        return {
+            'graded': int(graded.size),
+            'ungraded': int(len(self.students) - graded.size),
+            'mean': float(graded.mean()),
+            'median': float(np.median(graded)),
+            'stdev': float(graded.std()),
+            'min': float(graded.min()),
+            'max': float(graded.max()),
+            'histogram': [
+                {'from': int(low), 'to': int(low + HISTOGRAM_STEP), 'count': int(count)}
+                for low, count in zip(edges[:-1], counts)
+            ]
+        }
+
+
+class CompiledRoster:
+    """A course's scores for all students packed into a students x assignments matrix.
+
+    grades() returns, for each student, what reference_grade returns for
+    that student's submissions, up to floating-point summation order.
+    """
+
+    def __init__(self, students, assignment_ids, scores, possible, groups, normalize=True):
+        self.students = students
+        # Assignment id -> column, for gradable assignments only
+        self.columns = {assignment_id: column for column, assignment_id in enumerate(assignment_ids)}
+        self.scores = scores
+        self.possible = possible
+        self.groups = groups
+        self.normalize = normalize
+
+    def apply(self, modifications):
+        """The score matrix with {assignment id: score} set for every student; None marks it ungraded"""
+        if not modifications:
+            return self.scores
+        scores = self.scores.copy()
+        for assignment_id, score in modifications.items():
+            column = self.columns.get(assignment_id)
+            if column is not None:
+                scores[:, column] = np.nan if score is None else score
+        return scores
+
+    def grades(self, modifications=None):
+        """RosterGrades for every student, with class-wide what-if modifications applied"""
+        scores = self.apply(modifications)
+        count = len(self.students)
+        weighted = np.zeros(count)
+        total_weight = np.zeros(count)
+
+        for group in self.groups:
+            earned, possible = group.totals(scores, self.possible)
+            counts = possible > 0
+            percentage = np.divide(earned, possible, out=np.zeros(count), where=counts) * 100
+            weighted += np.where(counts, percentage * group.weight / 100, 0)
+            total_weight += np.where(counts, group.weight, 0)
+
+        # No weighted group has graded work: fall back to total points
+        graded = ~np.isnan(scores)
+        all_earned = np.where(graded, scores, 0).sum(axis=1)
+        all_possible = graded @ self.possible
+        fallback = np.divide(all_earned, all_possible, out=np.full(count, np.nan), where=all_possible > 0) * 100
+
+        if self.normalize:
+            rescale = (total_weight > 0) & (total_weight != 100)
+            scaled = np.divide(weighted, total_weight, out=np.zeros(count), where=rescale) * 100
+            weighted = np.where(rescale, scaled, weighted)
+        return RosterGrades(self.students, np.where(total_weight == 0, fallback, weighted))
+
+
+def compile_roster(assignments, submissions, assignment_groups, normalize=True):
+    """Build a CompiledRoster from Canvas assignments, every student's submissions and assignment groups.
+
+    submissions is the flat student_ids[]=all listing: one
+    {"user_id", "assignment_id", "score"} per student and assignment.
+    Students are ordered by user id.
+    """
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError('Roster grades need numpy installed')
+
+    group_map = {g['id']: g for g in assignment_groups}
+    groups = {}
+    assignment_ids = []
+    possible = []
+
+    for assignment in assignments:
+        if assignment.get('omit_from_final_grade', False):
+            continue
+        # Assignments worth no points can never count toward the grade
+        points_possible = assignment.get('points_possible') or 0
+        if points_possible <= 0:
+            continue
+
+        group_id = assignment.get('assignment_group_id')
+        group_info = group_map.get(group_id, {})
+        rules = group_info.get('rules') or {}
+        group = groups.get(group_id)
+        if group is None:
+            group = RosterGroup(
+                group_id,
+                group_info.get('group_weight') or 0,
+                rules.get('drop_lowest') or 0,
+                rules.get('drop_highest') or 0
+            )
+            groups[group_id] = group
+
+        group.columns.append(len(assignment_ids))
+        group.never_drop.append(assignment.get('id') in (rules.get('never_drop') or []))
+        assignment_ids.append(assignment.get('id'))
+        possible.append(points_possible)
+
+    students = sorted({s.get('user_id') for s in submissions if s.get('user_id') is not None})
+    rows = {student: row for row, student in enumerate(students)}
+    columns = {assignment_id: column for column, assignment_id in enumerate(assignment_ids)}
+
+    scores = np.full((len(students), len(assignment_ids)), np.nan)
+    for s in submissions:
+        row = rows.get(s.get('user_id'))
+        column = columns.get(s.get('assignment_id'))
+        if row is not None and column is not None and s.get('score') is not None:
+            scores[row, column] = s['score']
+
+    return CompiledRoster(
+        students, assignment_ids, scores, np.array(possible, dtype=float),
+        list(groups.values()), normalize
+    )
@@ -0,0 +1,121 @@
+"""How far full credit versus a zero on each assignment would move the course grade.
+
+Every group's drop candidates are sorted once, as IncrementalGrade keeps
+them. Changing one score then only moves entries across the drop cut at
+either end of its group, so each what-if costs the drop counts plus a
+combine over the groups instead of a full recomputation.
+"""
+from bisect import insort
+
+from .model import IncrementalGrade
+
+
+def _ends(candidates, removed, added, low, high):
+    """The lowest `low` and highest `high` entries of candidates once removed is taken out and added put in"""
+    head = []
+    for entry in candidates:
+        if len(head) >= low:
+            break
+        if entry != removed:
+            head.append(entry)
+    tail = []
+    for entry in reversed(candidates):
+        if len(tail) >= high:
+            break
+        if entry != removed:
+            tail.insert(0, entry)
+    insort(head, added)
+    insort(tail, added)
+    return head[:low], tail[len(tail) - high:] if high else []
+
+
+class _GroupSums:
+    """One group's baseline totals, ready to answer single-score what-ifs"""
+
+    def __init__(self, state):
+        group = state.group
+        self.state = state
+        self.drop_lowest = group.drop_lowest
+        self.drop_highest = group.drop_highest
+        self.fixed_earned = sum(earned for _, earned, _ in state.never_drop)
+        self.fixed_possible = sum(possible for _, _, possible in state.never_drop)
+        self.earned = sum(entry[2] for entry in state.candidates)
+        self.possible = sum(entry[3] for entry in state.candidates)
+
+    def totals_with(self, slot, earned):
+        """(earned, possible) for the group with one slot's score replaced"""
+        state = self.state
+        group = state.group
+        possible = group.possible[slot]
+        current = state.values[slot]
+
+        if group.never_drop[slot]:
+            fixed_earned = self.fixed_earned + earned - (current[0] if current else 0)
+            fixed_possible = self.fixed_possible + possible - (current[1] if current else 0)
+            kept = state.totals
+            if kept is None:
+                return fixed_earned, fixed_possible
+            # Drop boundaries don't move, so the candidates that count stay the same
+            return kept[0] - self.fixed_earned + fixed_earned, kept[1] - self.fixed_possible + fixed_possible
+
+        removed = ((current[0] / current[1]) * 100, slot, current[0], current[1]) if current else None
+        added = ((earned / possible) * 100, slot, earned, possible)
+        count = len(state.candidates) + (0 if current else 1)
+
+        start = self.drop_lowest if self.drop_lowest > 0 and count > self.drop_lowest else 0
+        end = count
+        if self.drop_highest > 0 and end - start > self.drop_highest:
+            end -= self.drop_highest
+
+        lowest, highest = _ends(state.candidates, removed, added, start, count - end)
+        total_earned = self.fixed_earned + self.earned + earned - (current[0] if current else 0)
+        total_possible = self.fixed_possible + self.possible + possible - (current[1] if current else 0)
+        for _, _, dropped_earned, dropped_possible in lowest + highest:
+            total_earned -= dropped_earned
+            total_possible -= dropped_possible
+        return total_earned, total_possible
+
+
+def sensitivities(model, modifications=None):
+    """Each gradable assignment's grade at full credit and at zero, most influential first.
+
+    Returns {'grade', 'assignments'} where assignments is a list of
+    {'index', 'full', 'zero', 'impact'}, impact being full - zero in
+    percentage points, sorted by impact then submission index. Other
+    scores stay as they are with modifications applied. Grades agree with
+    model.grade() for the same change up to floating-point summation order.
+    """
+    evaluator = IncrementalGrade(model)
+    evaluator.apply(dict(modifications or {}))
+    states = evaluator.states
+    sums = [_GroupSums(state) for state in states]
+    baseline = [state.totals for state in states]
+
+    all_earned = 0
+    all_possible = 0
+    graded_count = 0
+    for state in states:
+        for earned, possible in state.graded():
+            all_earned += earned
+            all_possible += possible
+            graded_count += 1
+
+    def grade_with(position, slot, earned):
+        current = states[position].values[slot]
+        totals = list(baseline)
+        totals[position] = sums[position].totals_with(slot, earned)
+        fallback = [[(
+            all_earned + earned - (current[0] if current else 0),
+            all_possible + model.groups[position].possible[slot] - (current[1] if current else 0)
+        )]]
+        return model.combine(totals, lambda: fallback)
+
+    ranked = []
+    for index, (position, slot) in model.slots.items():
+        full = grade_with(position, slot, model.groups[position].possible[slot])
+        zero = grade_with(position, slot, 0)
+        ranked.append({'index': index, 'full': full, 'zero': zero, 'impact': full - zero})
+    ranked.sort(key=lambda entry: (-entry['impact'], entry['index']))
+
+    grade = model.combine(baseline, lambda: [[(all_earned, all_possible)]] if graded_count else [])
+    return {'grade': grade, 'assignments': ranked}
@@ -0,0 +1,82 @@
+from .model import IncrementalGrade
+
+# Bisection stops once the bracket is narrower than this, in percent of points possible
+TOLERANCE = 1e-9
+
+
+def _breakpoints(model, evaluator, chosen, max_percent):
+    """Percentages where a chosen assignment changes places with another drop candidate.
+
+    Between two breakpoints the set of assignments kept by drop rules is
+    fixed, so the course grade moves monotonically with the chosen scores.
+    """
+    points = {0.0, float(max_percent)}
+    positions = {model.slots[index][0] for index in chosen}
+    chosen_slots = {model.slots[index] for index in chosen}
+
+    for position in positions:
+        group = model.groups[position]
+        if group.drop_lowest <= 0 and group.drop_highest <= 0:
+            continue
+        state = evaluator.states[position]
+        for percentage, slot, _, _ in state.candidates:
+            if (position, slot) not in chosen_slots and 0 < percentage < max_percent:
+                points.add(percentage)
+
+    return sorted(points)
+
+
+def required_scores(model, target, indices, modifications=None, max_percent=100):
+    """Smallest common percentage on the chosen assignments that reaches a target grade.
+
+    Every chosen submission index gets the same percentage of its points
+    possible. Drop rules make the grade non-monotone in that percentage, so
+    the range is split at every point where a chosen assignment would swap
+    places with another drop candidate; within each piece the grade only
+    rises, so the first piece that reaches the target is bisected. Chosen
+    assignments in the same group tie on percentage, and which of them a
+    drop rule removes is left to the order the group already uses.
+
+    Returns {'reachable', 'percent', 'scores', 'grade'}. When the target
+    can't be reached, percent is max_percent and grade is what it yields.
+    """
+    evaluator = IncrementalGrade(model)
+    evaluator.apply(dict(modifications or {}))
+    possible = {
+        index: model.groups[model.slots[index][0]].possible[model.slots[index][1]]
+        for index in indices
+    }
+
+    def grade_at(percent):
+        for index in indices:
+            evaluator.set_score(index, percent * possible[index] / 100)
+        return evaluator.grade()
+
+    def reaches(percent):
+        grade = grade_at(percent)
+        return grade is not None and grade >= target
+
+    def result(reachable, percent):
+        return {
+            'reachable': reachable,
+            'percent': percent,
+            'scores': {index: percent * possible[index] / 100 for index in indices},
+            'grade': grade_at(percent)
+        }
+
+    points = _breakpoints(model, evaluator, indices, max_percent)
+    for low, high in zip(points, points[1:]):
+        if reaches(low):
+            return result(True, low)
+        if not reaches(high):
+            continue
+
+        while high - low > TOLERANCE:
+            middle = (low + high) / 2
+            if reaches(middle):
+                high = middle
+            else:
+                low = middle
+        return result(True, high)
+
+    return result(reaches(points[-1]), points[-1])
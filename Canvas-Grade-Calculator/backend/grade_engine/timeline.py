@@ -0,0 +1,110 @@
+"""How a course grade moved as each submission was graded, in one pass.
+
+Submissions are replayed in graded_at order into running per-group sums.
+Drop candidates stay in a sorted list, so applying drop_lowest and
+drop_highest only subtracts the few entries at either end instead of
+re-sorting and re-summing the group after every grade.
+"""
+from bisect import insort
+
+
+class _RunningGroup:
+    """Running totals of one group's graded slots as grades arrive"""
+
+    __slots__ = ('group', 'fixed_earned', 'fixed_possible', 'candidates', 'earned', 'possible')
+
+    def __init__(self, group):
+        self.group = group
+        # Never-drop slots always count
+        self.fixed_earned = 0
+        self.fixed_possible = 0
+        # (percentage, slot, earned, possible), ordered like _GroupState's candidates
+        self.candidates = []
+        self.earned = 0
+        self.possible = 0
+
+    def add(self, slot, earned):
+        possible = self.group.possible[slot]
+        if self.group.never_drop[slot]:
+            self.fixed_earned += earned
+            self.fixed_possible += possible
+            return
+        insort(self.candidates, ((earned / possible) * 100, slot, earned, possible))
+        self.earned += earned
+        self.possible += possible
+
+    def totals(self):
+        """(earned, possible) after drop rules, or None while nothing is graded"""
+        candidates = self.candidates
+        if not candidates and not self.fixed_possible:
+            return None
+
+        drop_lowest = self.group.drop_lowest
+        drop_highest = self.group.drop_highest
+        start = drop_lowest if drop_lowest > 0 and len(candidates) > drop_lowest else 0
+        end = len(candidates)
+        if drop_highest > 0 and end - start > drop_highest:
+            end -= drop_highest
+
+        earned = self.fixed_earned + self.earned
+        possible = self.fixed_possible + self.possible
+        for _, _, dropped_earned, dropped_possible in candidates[:start] + candidates[end:]:
+            earned -= dropped_earned
+            possible -= dropped_possible
+        return earned, possible
+
+
+def grade_timeline(model, submissions):
+    """The grade after every graded_at moment, as chart-ready parallel lists.
+
+    model is compile_course(submissions, groups). Returns {"start", "dates",
+    "grades", "indices"}: start is the grade from scores that have no
+    graded_at, and each point is the grade once everything graded at that
+    timestamp is in, with the submission indices graded then. Each grade
+    agrees with reference_grade on the scores graded by then, up to
+    floating-point summation order.
+    """
+    states = [_RunningGroup(group) for group in model.groups]
+    all_earned = 0
+    all_possible = 0
+    count = 0
+
+    def grade():
+        graded = lambda: [[(all_earned, all_possible)]] if count else []
+        return model.combine([state.totals() for state in states], graded)
+
+    undated = []
+    dated = []
+    for index, (position, slot) in model.slots.items():
+        earned = model.groups[position].scores[slot]
+        if earned != earned:
+            continue
+        graded_at = submissions[index].get('graded_at')
+        if graded_at:
+            dated.append((graded_at, index, position, slot, earned))
+        else:
+            undated.append((position, slot, earned))
+    dated.sort()
+
+    for position, slot, earned in undated:
+        states[position].add(slot, earned)
+        all_earned += earned
+        all_possible += model.groups[position].possible[slot]
+        count += 1
+
+    timeline = {'start': grade(), 'dates': [], 'grades': [], 'indices': []}
+    for step, (graded_at, index, position, slot, earned) in enumerate(dated):
+        states[position].add(slot, earned)
+        all_earned += earned
+        all_possible += model.groups[position].possible[slot]
+        count += 1
+
+        if timeline['dates'] and timeline['dates'][-1] == graded_at:
+            timeline['indices'][-1].append(index)
+        else:
+            timeline['dates'].append(graded_at)
+            timeline['indices'].append([index])
+        # Everything graded at one timestamp collapses into a single point
+        if step + 1 == len(dated) or dated[step + 1][0] != graded_at:
+            timeline['grades'].append(grade())
+    return timeline
@@ -0,0 +1,9 @@
+import os
+
+# SERVER_MODE=async serves the asyncio routes in asgi.py on uvicorn workers;
+# anything else keeps the original Flask app on sync workers
+if os.environ.get('SERVER_MODE') == 'async':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'app:app'
@@ -0,0 +1,200 @@
+"""Warm the response cache with a user's courses right after their course list is served.
+
+Opening a course right after logging in otherwise waits on a cold
+submissions crawl. When PREFETCH is on, serving /api/courses queues the
+user's likeliest courses (graded ones first) and a bounded pool loads
+their submissions and groups into the cache, so the later
+/api/course/<id>/assignments call is a cache hit.
+
+Each user has at most one batch at a time, loading its courses one after
+another, so a user holds at most one worker. A new batch for the same
+user, an explicit cancel or a full cache invalidation cancels the old
+one: it stops before its next course or fetch, and whatever was already
+in flight still lands in the cache.
+"""
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+import tracing
+
+# Prefetch course data after /api/courses; off unless set
+PREFETCH = os.environ.get('PREFETCH', '').lower() in ('1', 'true', 'yes')
+# Users' batches loading at once (threads for Flask, a semaphore for the ASGI app)
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+# Courses prefetched per course listing
+PREFETCH_PER_USER = int(os.environ.get('PREFETCH_PER_USER', 5))
+# Batches waiting or running at once; further logins skip prefetching until the queue drains
+PREFETCH_MAX_PENDING = int(os.environ.get('PREFETCH_MAX_PENDING', 100))
+
+tracing.metrics.describe('prefetch_batches_total', 'Course prefetch batches by result (scheduled or dropped)')
+tracing.metrics.describe('prefetch_courses_total', 'Prefetched courses by result (fetched, cached, failed or cancelled)')
+tracing.metrics.describe('prefetch_course_duration_seconds', 'Time to prefetch one course')
+
+
+def prefetch_order(courses, limit):
+    """Ids of the courses most likely to be opened next: ones with a grade first, then listing order"""
+    ranked = sorted(courses, key=lambda course: course.get('current_score') is None)
+    return [course['id'] for course in ranked if course.get('id') is not None][:limit]
+
+
+def record(result, started=None):
+    tracing.metrics.inc('prefetch_courses_total', result=result)
+    if started is not None:
+        tracing.metrics.observe('prefetch_course_duration_seconds', time.monotonic() - started)
+
+
+class Prefetcher:
+    """Per-user prefetch batches on a shared thread pool.
+
+    load(course_id, cancelled) warms one course and returns 'fetched' or
+    'cached', or 'cancelled' if it saw cancelled set partway through.
+    """
+
+    def __init__(self, enabled=PREFETCH, workers=PREFETCH_WORKERS, per_user=PREFETCH_PER_USER,
+                 max_pending=PREFETCH_MAX_PENDING):
+        self.enabled = enabled
+        self.workers = workers
+        self.per_user = per_user
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        # Scope -> the cancel flag of that user's current batch
+        self._batches = {}
+        self._executor = None
+        self.scheduled = 0
+        self.dropped = 0
+        self.cancelled = 0
+
+    def _claim(self, scope, courses):
+        """(course ids, cancel flag) for a new batch, or None when there's nothing to do or no room"""
+        course_ids = prefetch_order(courses, self.per_user)
+        if not course_ids:
+            return None
+        with self._lock:
+            previous = self._batches.get(scope)
+            if previous is None and len(self._batches) >= self.max_pending:
+                self.dropped += 1
+                tracing.metrics.inc('prefetch_batches_total', result='dropped')
+                return None
+            if previous is not None:
+                previous.set()
+                self.cancelled += 1
+            cancelled = self._batches[scope] = threading.Event()
+            self.scheduled += 1
+        tracing.metrics.inc('prefetch_batches_total', result='scheduled')
+        return course_ids, cancelled
+
+    def _release(self, scope, cancelled):
+        with self._lock:
+            if self._batches.get(scope) is cancelled:
+                del self._batches[scope]
+
+    def schedule(self, scope, courses, load):
+        """Queue a batch for the user's likeliest courses, replacing any batch they already have.
+
+        courses is the summarized course list. Returns how many courses were queued.
+        """
+        claimed = self._claim(scope, courses)
+        if claimed is None:
+            return 0
+        course_ids, cancelled = claimed
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='prefetch'
+                )
+        self._executor.submit(self._run, scope, course_ids, load, cancelled)
+        return len(course_ids)
+
+    def _run(self, scope, course_ids, load, cancelled):
+        try:
+            for position, course_id in enumerate(course_ids):
+                if cancelled.is_set():
+                    for _ in course_ids[position:]:
+                        record('cancelled')
+                    return
+                started = time.monotonic()
+                try:
+                    result = load(course_id, cancelled)
+                except Exception as e:
+                    print(f"Prefetch of course {course_id} failed: {str(e)}")
+                    result = 'failed'
+                record(result, started)
+        finally:
+            self._release(scope, cancelled)
+
+    def cancel(self, scope):
+        """Stop the user's batch before its next course or fetch; True if one was pending"""
+        with self._lock:
+            cancelled = self._batches.pop(scope, None)
+            if cancelled is None:
+                return False
+            cancelled.set()
+            self.cancelled += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'workers': self.workers,
+                'per_user': self.per_user,
+                'pending': len(self._batches),
+                'scheduled': self.scheduled,
+                'dropped': self.dropped,
+                'cancelled': self.cancelled
+            }
+
+
+class AsyncPrefetcher(Prefetcher):
+    """Prefetcher for the ASGI app: batches are tasks, and load is a coroutine function"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._semaphore = None
+        self._tasks = set()
+
+    def schedule(self, scope, courses, load):
+        claimed = self._claim(scope, courses)
+        if claimed is None:
+            return 0
+        course_ids, cancelled = claimed
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        task = asyncio.ensure_future(self._run(scope, course_ids, load, cancelled))
+        # The loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return len(course_ids)
+
+    async def _run(self, scope, course_ids, load, cancelled):
+        # The task copied the request's context; its Canvas calls aren't part of that request
+        tracing.detach()
+        try:
+            async with self._semaphore:
+                for position, course_id in enumerate(course_ids):
+                    if cancelled.is_set():
+                        for _ in course_ids[position:]:
+                            record('cancelled')
+                        return
+                    started = time.monotonic()
+                    try:
+                        result = await load(course_id, cancelled)
+                    except Exception as e:
+                        print(f"Prefetch of course {course_id} failed: {str(e)}")
+                        result = 'failed'
+                    record(result, started)
+        finally:
+            self._release(scope, cancelled)
+
+    async def close(self):
+        """Cancel every batch and wait for them to stop, before the Canvas clients close"""
+        with self._lock:
+            for cancelled in self._batches.values():
+                cancelled.set()
+            self._batches.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
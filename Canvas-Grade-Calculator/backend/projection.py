@@ -0,0 +1,50 @@
+"""Cut Canvas objects down to the fields the grade engine and the frontend read.
+
+Canvas submissions with include[]=assignment carry the whole assignment,
+HTML description and rubric included; none of that is used after the fetch.
+"""
+
+# Submission fields kept, alongside the trimmed assignment
+SUBMISSION_FIELDS = ('assignment_id', 'score', 'excused', 'missing', 'graded_at')
+ASSIGNMENT_FIELDS = (
+    'id', 'name', 'assignment_group_id', 'points_possible',
+    'omit_from_final_grade', 'due_at', 'html_url'
+)
+# A roster listing has one submission per student and assignment, so only the grade inputs are kept
+ROSTER_SUBMISSION_FIELDS = ('user_id', 'assignment_id', 'score')
+GROUP_FIELDS = ('id', 'name', 'position', 'group_weight', 'rules')
+RULE_FIELDS = ('drop_lowest', 'drop_highest', 'never_drop')
+
+
+def _pick(obj, fields):
+    return {field: obj[field] for field in fields if field in obj}
+
+
+def project_submission(submission):
+    projected = _pick(submission, SUBMISSION_FIELDS)
+    if 'assignment' in submission:
+        projected['assignment'] = _pick(submission['assignment'] or {}, ASSIGNMENT_FIELDS)
+    return projected
+
+
+def project_submissions(submissions):
+    return [project_submission(s) for s in submissions]
+
+
+def project_assignments(assignments):
+    return [_pick(a, ASSIGNMENT_FIELDS) for a in assignments]
+
+
+def project_roster_submissions(submissions):
+    return [_pick(s, ROSTER_SUBMISSION_FIELDS) for s in submissions]
+
+
+def project_groups(groups):
+    """Assignment groups without their assignment lists, rules reduced to what grading uses"""
+    projected = []
+    for group in groups:
+        trimmed = _pick(group, GROUP_FIELDS)
+        if group.get('rules'):
+            trimmed['rules'] = _pick(group['rules'], RULE_FIELDS)
+        projected.append(trimmed)
+    return projected
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+# Most Canvas calls one token may have in flight at once
+MAX_CONCURRENCY = int(os.environ.get('CANVAS_TOKEN_CONCURRENCY', 8))
+# Distinct tokens tracked per Canvas host; idle ones are forgotten first
+MAX_TOKENS = int(os.environ.get('CANVAS_MAX_TOKENS', 1000))
+# Seconds to wait after the first throttled response; doubles on each one after
+BACKOFF_BASE = float(os.environ.get('CANVAS_BACKOFF_BASE', 1.0))
+BACKOFF_MAX = 30.0
+# Times a throttled call is retried after backing off before its 403/429 is returned
+THROTTLE_RETRIES = int(os.environ.get('CANVAS_THROTTLE_RETRIES', 3))
+# Canvas's quota starts at 700 units; keep this many in-flight costs of headroom
+HEADROOM = 2
+# Units of quota Canvas gives back per second, used to pace a nearly spent token
+REFILL_RATE = float(os.environ.get('CANVAS_QUOTA_REFILL', 10))
+
+
+def token_key(token):
+    """Key a token's budget by its hash so raw tokens are never held here"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def is_throttled(status_code, text):
+    """Canvas answers an exhausted quota with 403 "Rate Limit Exceeded" (or 429)"""
+    if status_code == 429:
+        return True
+    return status_code == 403 and 'rate limit exceeded' in text.lower()
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Budget:
+    """One token's share of Canvas: how many calls may run now and when it may call again"""
+
+    __slots__ = ('limit', 'in_flight', 'waiting', 'remaining', 'cost', 'blocked_until', 'strikes')
+
+    def __init__(self, max_concurrency):
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self.remaining = None
+        # Running average of X-Request-Cost
+        self.cost = None
+        self.blocked_until = 0
+        self.strikes = 0
+
+    def delay(self, now):
+        """Seconds until another call may start, 0 if one may start now, None if it must wait for a release"""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= self.limit:
+            return None
+        return 0
+
+    def update(self, headers, throttled, max_concurrency, now):
+        remaining = _header_float(headers, 'X-Rate-Limit-Remaining')
+        cost = _header_float(headers, 'X-Request-Cost')
+        if cost is not None:
+            self.cost = cost if self.cost is None else 0.8 * self.cost + 0.2 * cost
+        if remaining is not None:
+            self.remaining = remaining
+
+        if throttled:
+            self.strikes += 1
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.strikes - 1))
+            # Full jitter so a burst of throttled calls doesn't retry in lockstep
+            self.blocked_until = max(self.blocked_until, now + random.uniform(backoff / 2, backoff))
+            self.limit = max(1, self.limit // 2)
+            return
+
+        self.strikes = 0
+        if remaining is not None and self.cost:
+            # Allow as many calls as the remaining quota covers with headroom to spare
+            self.limit = max(1, min(max_concurrency, int(remaining / (self.cost * HEADROOM))))
+            shortfall = self.cost * HEADROOM - remaining
+            if shortfall > 0:
+                # Nearly out: wait for the quota to refill rather than run into a 403
+                self.blocked_until = max(self.blocked_until, now + shortfall / REFILL_RATE)
+        elif self.limit < max_concurrency:
+            self.limit += 1
+
+
+class RateLimiter:
+    """Per-token concurrency gate for one Canvas host, sized from Canvas's rate-limit headers"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_tokens=MAX_TOKENS):
+        self.max_concurrency = max_concurrency
+        self.max_tokens = max_tokens
+        self._budgets = OrderedDict()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.throttled = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait = 0.0
+
+    def _budget(self, key):
+        budget = self._budgets.get(key)
+        if budget is None:
+            budget = _Budget(self.max_concurrency)
+            self._budgets[key] = budget
+            self._forget_idle()
+        self._budgets.move_to_end(key)
+        return budget
+
+    def _forget_idle(self):
+        if len(self._budgets) <= self.max_tokens:
+            return
+        now = time.monotonic()
+        for key in list(self._budgets):
+            budget = self._budgets[key]
+            if budget.in_flight == 0 and budget.waiting == 0 and budget.blocked_until <= now:
+                del self._budgets[key]
+                if len(self._budgets) <= self.max_tokens:
+                    return
+
+    def _record_wait(self, waited):
+        self.waits += 1
+        self.wait_seconds += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self, key):
+        """Block until the token may start another call"""
+        started = time.monotonic()
+        with self._changed:
+            budget = self._budget(key)
+            budget.waiting += 1
+            queued = False
+            try:
+                while True:
+                    delay = budget.delay(time.monotonic())
+                    if delay == 0:
+                        break
+                    queued = True
+                    self._changed.wait(delay)
+            finally:
+                budget.waiting -= 1
+            budget.in_flight += 1
+            if queued:
+                self._record_wait(time.monotonic() - started)
+
+    def release(self, key, headers=None, throttled=False):
+        """Finish a call, resizing the token's budget from the response headers if there was one"""
+        with self._changed:
+            budget = self._budget(key)
+            budget.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+            if headers is not None:
+                budget.update(headers, throttled, self.max_concurrency, time.monotonic())
+            self._changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            budgets = list(self._budgets.values())
+            return {
+                'tokens': len(budgets),
+                'in_flight': sum(b.in_flight for b in budgets),
+                'queue_depth': sum(b.waiting for b in budgets),
+                'backing_off': sum(1 for b in budgets if b.blocked_until > time.monotonic()),
+                'throttled': self.throttled,
+                # Calls that had to queue, and how long they queued for
+                'waits': self.waits,
+                'wait_seconds': self.wait_seconds,
+                'avg_wait': self.wait_seconds / self.waits if self.waits else None,
+                'max_wait': self.max_wait,
+                'max_concurrency': self.max_concurrency
+            }
+
+
+class AsyncRateLimiter(RateLimiter):
+    """RateLimiter for coroutines on one event loop; waiters poll their budget instead of blocking a thread"""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_tokens=MAX_TOKENS):
+        super().__init__(max_concurrency, max_tokens)
+        self._released = None
+
+    async def acquire(self, key):
+        if self._released is None:
+            self._released = asyncio.Event()
+        started = time.monotonic()
+        budget = self._budget(key)
+        budget.waiting += 1
+        queued = False
+        try:
+            while True:
+                delay = budget.delay(time.monotonic())
+                if delay == 0:
+                    break
+                queued = True
+                self._released.clear()
+                try:
+                    await asyncio.wait_for(self._released.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            budget.waiting -= 1
+        budget.in_flight += 1
+        if queued:
+            self._record_wait(time.monotonic() - started)
+
+    def release(self, key, headers=None, throttled=False):
+        budget = self._budget(key)
+        budget.in_flight -= 1
+        if throttled:
+            self.throttled += 1
+        if headers is not None:
+            budget.update(headers, throttled, self.max_concurrency, time.monotonic())
+        if self._released is not None:
+            self._released.set()
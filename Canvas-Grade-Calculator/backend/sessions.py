@@ -0,0 +1,116 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from grade_engine import IncrementalGrade, compile_course
+
+# Seconds a course session survives without being touched
+SESSION_TTL = int(os.environ.get('GRADE_SESSION_TTL', 1800))
+# Most course sessions held at once; the least recently used go first
+MAX_SESSIONS = int(os.environ.get('GRADE_SESSION_MAX', 500))
+
+
+def session_id(scope, course_id):
+    """Stable session handle for one user's course.
+
+    /assignments and /groups are separate requests, so both derive the same
+    id from the user's cache scope instead of sharing server-side state.
+    """
+    return hashlib.sha256(f"{scope}:{course_id}".encode()).hexdigest()[:32]
+
+
+class _Session:
+    __slots__ = ('submissions', 'groups', 'model', 'evaluator', 'lock', 'expires_at')
+
+    def __init__(self):
+        self.submissions = None
+        self.groups = None
+        self.model = None
+        self.evaluator = None
+        # Serializes what-if edits against this session's evaluator
+        self.lock = threading.Lock()
+        self.expires_at = 0
+
+
+class GradeSessions:
+    """Bounded, expiring store of course payloads for what-if calculations"""
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, sid, submissions=None, groups=None):
+        """Record the submissions and/or assignment groups served for a session"""
+        with self._lock:
+            session = self._sessions.pop(sid, None) or _Session()
+            if submissions is not None:
+                session.submissions = submissions
+                session.model = None
+                session.evaluator = None
+            if groups is not None:
+                session.groups = groups
+                session.model = None
+                session.evaluator = None
+            session.expires_at = time.monotonic() + self.ttl
+            self._sessions[sid] = session
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def model(self, sid):
+        """The compiled grade model for a session, or None if it is unknown, expired or incomplete"""
+        _, model = self._live(sid)
+        return model
+
+    def grade(self, sid, modifications):
+        """Grade a session's course under modifications; returns (found, grade).
+
+        Callers send their whole modification set each time; the session's
+        incremental evaluator only re-evaluates groups whose scores changed
+        since the previous call.
+        """
+        session, model = self._live(sid)
+        if session is None:
+            return False, None
+
+        with session.lock:
+            if session.evaluator is None or session.evaluator.model is not model:
+                session.evaluator = IncrementalGrade(model)
+            session.evaluator.apply(modifications)
+            return True, session.evaluator.grade()
+
+    def _live(self, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is not None and session.expires_at <= time.monotonic():
+                del self._sessions[sid]
+                session = None
+            if session is None or session.submissions is None or session.groups is None:
+                self.misses += 1
+                return None, None
+
+            self.hits += 1
+            session.expires_at = time.monotonic() + self.ttl
+            self._sessions.move_to_end(sid)
+            if session.model is None:
+                session.model = compile_course(session.submissions, session.groups)
+            return session, session.model
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
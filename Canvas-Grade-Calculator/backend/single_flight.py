@@ -0,0 +1,103 @@
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class SingleFlight:
+    """Share one in-flight Canvas fetch between concurrent callers asking for the same key.
+
+    Keys are tuples whose first item names the kind of fetch, so the
+    counters can say what was coalesced. Nothing is remembered once a call
+    finishes; that is the response cache's job.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = {}
+
+    def join(self, key):
+        """Return (call, leader); the leader must eventually finish() the call"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced[key[0]] = self.coalesced.get(key[0], 0) + 1
+                return call, False
+
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def finish(self, key, call, value=None, error=None):
+        """Hand the leader's result to every waiter; later calls for the same call are ignored"""
+        with self._lock:
+            if call.done.is_set():
+                return
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.value = value
+            call.error = error
+            call.done.set()
+
+    def do(self, key, fetch):
+        """Return fetch(), or the result of an identical fetch already under way"""
+        call, leader = self.join(key)
+        if not leader:
+            return call.wait()
+
+        try:
+            value = fetch()
+        except Exception as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._calls),
+                'leaders': self.leaders,
+                'coalesced': sum(self.coalesced.values()),
+                'kinds': dict(self.coalesced)
+            }
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for coroutines running on one event loop"""
+
+    async def do(self, key, fetch):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced[key[0]] = self.coalesced.get(key[0], 0) + 1
+        else:
+            task = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self._calls[key] = task
+            self.leaders += 1
+
+        # Shielded so one cancelled caller doesn't cancel the fetch the others share
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the error as seen even if every caller went away
+            task.exception()
@@ -0,0 +1,217 @@
+"""On-disk snapshots of course submissions and assignment groups.
+
+A snapshot lets the CLI and the API start from the last sync and ask Canvas
+only for submissions graded since then. Set SNAPSHOT_DB to a file path to
+turn it on; rows are keyed by Canvas host, a hash of the user's token and
+course, so the database never holds a token.
+"""
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+from projection import project_groups, project_submissions
+from rate_limit import token_key
+
+SNAPSHOT_DB = os.environ.get('SNAPSHOT_DB')
+# Bytes of the database SQLite may read through a memory map instead of read() calls
+MMAP_SIZE = int(os.environ.get('SNAPSHOT_MMAP_SIZE', 256 * 1024 * 1024))
+# A snapshot older than this is refetched in full instead of patched
+MAX_AGE = timedelta(seconds=int(os.environ.get('SNAPSHOT_MAX_AGE', 7 * 24 * 3600)))
+# Overlap between syncs so a grade posted while we were syncing isn't missed
+SYNC_OVERLAP = timedelta(minutes=5)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    host TEXT NOT NULL,
+    user_key TEXT NOT NULL,
+    course_id INTEGER NOT NULL,
+    fetched_at TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    groups TEXT NOT NULL,
+    PRIMARY KEY (host, user_key, course_id)
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    host TEXT NOT NULL,
+    user_key TEXT NOT NULL,
+    course_id INTEGER NOT NULL,
+    assignment_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (host, user_key, course_id, assignment_id)
+);
+"""
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _assignment_id(submission):
+    return submission.get('assignment_id') or submission.get('assignment', {}).get('id')
+
+
+class Snapshot:
+    __slots__ = ('submissions', 'groups', 'fetched_at', 'synced_at')
+
+    def __init__(self, submissions, groups, fetched_at, synced_at):
+        self.submissions = submissions
+        self.groups = groups
+        # When the last full fetch happened, and when the last delta sync started
+        self.fetched_at = fetched_at
+        self.synced_at = synced_at
+
+
+class SnapshotStore:
+    """SQLite-backed course snapshots, read through mmap"""
+
+    def __init__(self, path, mmap_size=MMAP_SIZE):
+        self.path = path
+        self.mmap_size = mmap_size
+        # sqlite3 connections can't be shared between threads, so each gets its own
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.delta_submissions = 0
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.db = db
+        return db
+
+    def load(self, host, user_key, course_id):
+        """The stored Snapshot for a course, or None"""
+        db = self._connect()
+        row = db.execute(
+            'SELECT fetched_at, synced_at, groups FROM courses WHERE host = ? AND user_key = ? AND course_id = ?',
+            (host, user_key, course_id)
+        ).fetchone()
+        if row is None:
+            return None
+
+        bodies = db.execute(
+            'SELECT body FROM submissions WHERE host = ? AND user_key = ? AND course_id = ? ORDER BY position',
+            (host, user_key, course_id)
+        ).fetchall()
+        with self._lock:
+            self.loads += 1
+        return Snapshot(
+            [json.loads(body) for body, in bodies],
+            json.loads(row[2]),
+            datetime.fromisoformat(row[0]),
+            datetime.fromisoformat(row[1])
+        )
+
+    def save(self, host, user_key, course_id, submissions, groups, fetched_at, synced_at):
+        """Replace a course's snapshot with a full fetch"""
+        key = (host, user_key, course_id)
+        with self._connect() as db:
+            db.execute('DELETE FROM submissions WHERE host = ? AND user_key = ? AND course_id = ?', key)
+            db.executemany(
+                'INSERT OR REPLACE INTO submissions VALUES (?, ?, ?, ?, ?, ?)',
+                [key + (_assignment_id(s), position, _dumps(s)) for position, s in enumerate(submissions)]
+            )
+            db.execute(
+                'INSERT OR REPLACE INTO courses VALUES (?, ?, ?, ?, ?, ?)',
+                key + (fetched_at.isoformat(), synced_at.isoformat(), _dumps(groups))
+            )
+        with self._lock:
+            self.full_syncs += 1
+
+    def patch(self, host, user_key, course_id, changed, groups, synced_at):
+        """Overwrite the submissions Canvas says changed, keeping their place in the list"""
+        key = (host, user_key, course_id)
+        with self._connect() as db:
+            db.executemany(
+                'UPDATE submissions SET body = ? WHERE host = ? AND user_key = ? AND course_id = ? AND assignment_id = ?',
+                [(_dumps(s),) + key + (_assignment_id(s),) for s in changed]
+            )
+            db.execute(
+                'UPDATE courses SET synced_at = ?, groups = ? WHERE host = ? AND user_key = ? AND course_id = ?',
+                (synced_at.isoformat(), _dumps(groups)) + key
+            )
+        with self._lock:
+            self.delta_syncs += 1
+            self.delta_submissions += len(changed)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'path': self.path,
+                'loads': self.loads,
+                'full_syncs': self.full_syncs,
+                'delta_syncs': self.delta_syncs,
+                'delta_submissions': self.delta_submissions
+            }
+        # Recent writes sit in the write-ahead log until SQLite checkpoints them
+        files = [self.path, self.path + '-wal']
+        stats['bytes'] = sum(os.path.getsize(f) for f in files if os.path.exists(f))
+        return stats
+
+
+def assignment_points(groups):
+    """{assignment id: points possible} for the assignments listed under the groups"""
+    return {
+        a.get('id'): a.get('points_possible')
+        for g in groups for a in g.get('assignments') or []
+    }
+
+
+def snapshot_points(submissions):
+    return {
+        _assignment_id(s): s.get('assignment', {}).get('points_possible')
+        for s in submissions
+    }
+
+
+def sync_course(store, client, token, course_id, submissions_path, groups_path):
+    """Bring a course's snapshot up to date and return (submissions, groups, how).
+
+    Assignment groups are small and always refetched. If the assignments they
+    list (and their points) still match the snapshot, only submissions graded
+    since the last sync are fetched and patched in; anything else (a first
+    sync, a new or changed assignment, an old snapshot) is a full fetch.
+    how is 'full' or 'delta'. Everything is stored and returned projected.
+    """
+    host = client.host
+    user_key = token_key(token)
+    started = datetime.now(timezone.utc)
+
+    response = client.get(groups_path, token, conditional=True)
+    response.raise_for_status()
+    listed = response.json()
+    groups = project_groups(listed)
+
+    snapshot = store.load(host, user_key, course_id)
+    if (
+        snapshot is not None
+        and started - snapshot.fetched_at < MAX_AGE
+        and assignment_points(listed) == snapshot_points(snapshot.submissions)
+    ):
+        since = (snapshot.synced_at - SYNC_OVERLAP).strftime('%Y-%m-%dT%H:%M:%SZ')
+        changed = project_submissions(client.get_all(f"{submissions_path}&graded_since={since}", token, timeout=45))
+        positions = {_assignment_id(s): i for i, s in enumerate(snapshot.submissions)}
+        if all(_assignment_id(s) in positions for s in changed):
+            submissions = list(snapshot.submissions)
+            for s in changed:
+                submissions[positions[_assignment_id(s)]] = s
+            store.patch(host, user_key, course_id, changed, groups, started)
+            return submissions, groups, 'delta'
+
+    submissions = project_submissions(client.get_all(submissions_path, token, timeout=45))
+    store.save(host, user_key, course_id, submissions, groups, started, started)
+    return submissions, groups, 'full'
+
+
+def open_store(path=SNAPSHOT_DB):
+    """The configured SnapshotStore, or None when snapshots are off"""
+    return SnapshotStore(path) if path else None
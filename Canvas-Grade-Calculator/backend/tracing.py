@@ -0,0 +1,253 @@
+"""Per-request traces, Server-Timing headers and Prometheus-style metrics.
+
+Each API request gets a Trace in a context variable. Canvas calls, cache
+lookups, grade calculations and JSON encoding add spans to it wherever they
+happen, including worker threads started through propagate(). At the end
+of the request the trace becomes a Server-Timing header, one JSON log line
+and observations in the histograms served at /metrics.
+
+Nothing here records a token or a query string: Canvas calls are kept by
+URL template, e.g. courses/:id/students/submissions.
+"""
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Print one JSON line per request; set TRACE_LOG=0 to turn it off
+TRACE_LOG = os.environ.get('TRACE_LOG', '1').lower() not in ('0', 'false', 'no')
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Spans kept individually per trace; past this they only count toward the totals
+MAX_SPANS = 200
+
+# A caller's request id is only echoed back if it can't smuggle anything into a log line
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+_API_PREFIX = '/api/v1/'
+# Flask's <int:course_id> and Starlette's {course_id:int} both become {course_id}
+_ROUTE_PARAM = re.compile(r'<(?:\w+:)?(\w+)>|\{(\w+)(?::\w+)?\}')
+
+_current = contextvars.ContextVar('trace', default=None)
+
+
+def url_template(url):
+    """A Canvas URL reduced to its path with numeric ids replaced, e.g. courses/:id/assignment_groups"""
+    path = _ID_SEGMENT.sub('/:id', urlsplit(url).path)
+    return path[len(_API_PREFIX):] if path.startswith(_API_PREFIX) else path
+
+
+def route_label(rule):
+    return _ROUTE_PARAM.sub(r'{\1\2}', rule) if rule else 'unmatched'
+
+
+class Trace:
+    """Spans recorded while serving one request"""
+
+    def __init__(self, method, route, request_id=None):
+        self.method = method
+        self.route = route
+        if not request_id or not _REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.spans = []
+        # Span name -> [count, seconds]
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, duration, **attrs):
+        with self._lock:
+            total = self.totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += duration
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append({'name': name, 'duration_ms': round(duration * 1000, 3), **attrs})
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Server-Timing header value: one metric per span name plus the total so far"""
+        with self._lock:
+            totals = sorted(self.totals.items())
+        parts = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (count, seconds) in totals]
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(parts)
+
+    def summary(self, status):
+        with self._lock:
+            return {
+                'request_id': self.request_id,
+                'method': self.method,
+                'route': self.route,
+                'status': status,
+                'duration_ms': round(self.elapsed() * 1000, 3),
+                'totals': {
+                    name: {'count': count, 'duration_ms': round(seconds * 1000, 3)}
+                    for name, (count, seconds) in self.totals.items()
+                },
+                'spans': list(self.spans)
+            }
+
+
+class _Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+def _labels(labels, extra=None):
+    items = sorted(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+
+class Metrics:
+    """Histograms and counters keyed by name and labels, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram.counts[i] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+            seen = set()
+            for (name, labels), histogram in histograms:
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append(f'# HELP {name} {self._help[name]}')
+                    lines.append(f'# TYPE {name} histogram')
+                for bound, count in zip(self.buckets, histogram.counts):
+                    lines.append(f'{name}_bucket{_labels(labels, ("le", f"{bound:g}"))} {count}')
+                lines.append(f'{name}_bucket{_labels(labels, ("le", "+Inf"))} {histogram.count}')
+                lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+            for (name, labels), value in counters:
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append(f'# HELP {name} {self._help[name]}')
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('http_request_duration_seconds', 'API request latency by route and status')
+metrics.describe('canvas_request_duration_seconds', 'Canvas API call latency by URL template and status')
+metrics.describe('canvas_response_bytes_total', 'Canvas response body bytes received by URL template')
+metrics.describe('canvas_throttle_retries_total', 'Canvas calls retried after a rate-limit answer')
+metrics.describe('cache_lookups_total', 'Response cache lookups by kind and result')
+metrics.describe('span_duration_seconds', 'Time spent in grade calculation and JSON encoding')
+
+
+def start(method, route, request_id=None):
+    """Begin tracing the current request; returns the Trace"""
+    trace = Trace(method, route, request_id)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    return _current.get()
+
+
+def finish(trace, status):
+    """Record a finished request in the metrics and, unless TRACE_LOG=0, the log"""
+    metrics.observe('http_request_duration_seconds', trace.elapsed(), route=trace.route, status=str(status))
+    if TRACE_LOG:
+        print(json.dumps(trace.summary(status), separators=(',', ':')))
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time a block of work as a span on the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        metrics.observe('span_duration_seconds', duration, span=name)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(name, duration, **attrs)
+
+
+def record_canvas_call(url, status, size, duration, retries=0, not_modified=False):
+    """A finished Canvas call; status is the HTTP status or 'error' when no response came back"""
+    template = url_template(url)
+    metrics.observe('canvas_request_duration_seconds', duration, template=template, status=str(status))
+    metrics.inc('canvas_response_bytes_total', size, template=template)
+    if retries:
+        metrics.inc('canvas_throttle_retries_total', retries, template=template)
+    trace = _current.get()
+    if trace is not None:
+        trace.add(
+            'canvas', duration, template=template, status=status, bytes=size,
+            retries=retries, not_modified=not_modified
+        )
+
+
+def record_cache_lookup(kind, result):
+    """result is 'hit', 'stale' or 'miss'"""
+    metrics.inc('cache_lookups_total', kind=kind, result=result)
+    trace = _current.get()
+    if trace is not None:
+        trace.add('cache', 0.0, kind=kind, result=result)
+
+
+def propagate(fn):
+    """Wrap fn so that calls on other threads record into the caller's trace"""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A Context can only be entered by one thread at a time, so each call gets a copy
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def detach():
+    """Stop recording into the current trace for the rest of this thread or asyncio task"""
+    _current.set(None)
@@ -0,0 +1,81 @@
+import heapq
+from datetime import datetime, timedelta
+
+# Assignments returned by /api/upcoming-assignments
+UPCOMING_LIMIT = 10
+# How far ahead an assignment can be due and still count as upcoming
+UPCOMING_DAYS = 60
+
+
+def parse_due(due_at):
+    return datetime.fromisoformat(due_at.replace('Z', '+00:00'))
+
+
+class UpcomingFeed:
+    """Soonest-due assignments across courses, fed one page of a course at a time.
+
+    Pages must come from a due_at-ordered listing, so once a course's last
+    item is due after the current last place, nothing further in that course
+    can make the list. Ties keep the old ordering: course order, then the
+    order Canvas listed the assignments in.
+    """
+
+    def __init__(self, now, limit=UPCOMING_LIMIT, days=UPCOMING_DAYS):
+        self.now = now
+        self.until = now + timedelta(days=days)
+        self.limit = limit
+        # Max-heap of the best items so far as (negated sort key, item)
+        self._heap = []
+        self._seen = {}
+        self.found = 0
+
+    def _worst(self):
+        key = self._heap[0][0]
+        return tuple(-part for part in key)
+
+    def add(self, position, course_name, assignments):
+        """Offer one page of a course; returns whether its next page could still make the list"""
+        last_key = None
+        for assignment in assignments:
+            seq = self._seen.get(position, 0)
+            self._seen[position] = seq + 1
+
+            due_at = assignment.get('due_at')
+            if not due_at:
+                continue
+            try:
+                due_date = parse_due(due_at)
+            except Exception as e:
+                print(f"Error parsing assignment: {e}")
+                continue
+
+            last_key = (due_date.timestamp(), position, seq)
+            if due_date <= self.now:
+                continue
+            if due_date >= self.until:
+                return False
+
+            self.found += 1
+            item = {
+                'course_name': course_name,
+                'assignment_name': assignment.get('name', 'Unnamed Assignment'),
+                'due_at': due_at,
+                'points_possible': assignment.get('points_possible', 0),
+                'html_url': assignment.get('html_url', '')
+            }
+            entry = (tuple(-part for part in last_key), item)
+            if len(self._heap) < self.limit:
+                heapq.heappush(self._heap, entry)
+            elif last_key < self._worst():
+                heapq.heapreplace(self._heap, entry)
+            else:
+                # Everything after this in the course is due no sooner
+                return False
+
+        if not assignments:
+            return False
+        return last_key is None or len(self._heap) < self.limit or last_key < self._worst()
+
+    def results(self):
+        print(f"Total upcoming assignments found: {self.found}")
+        return [item for _, item in sorted(self._heap, reverse=True)]
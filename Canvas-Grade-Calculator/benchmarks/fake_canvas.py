@@ -0,0 +1,384 @@
+"""A local stand-in for the parts of the Canvas API the backend calls.
+
+Serves generated courses over real HTTP with Canvas's pagination (Link
+headers, numbered or bookmark cursors, a per_page cap), ETag revalidation
+and X-Rate-Limit-Remaining / X-Request-Cost headers backed by a leaky
+bucket, so throttling behaves like the real thing. POST /api/graphql
+answers the backend's CourseGrades query from the same courses, with
+cursor pagination and timestamps in a local offset as Canvas sends them. Every request is counted
+by kind so a benchmark can report upstream calls per route.
+"""
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Canvas's defaults: a 700-unit quota per token that refills at about 10 units a second
+QUOTA = 700.0
+REFILL_RATE = 10.0
+# Canvas never returns more than this many items per page whatever per_page says
+MAX_PER_PAGE = 100
+
+GRAPHQL_PATH = '/api/graphql'
+# GraphQL answers in the user's time zone rather than UTC
+GRAPHQL_OFFSET = timezone(timedelta(hours=-7))
+
+_COURSE_PATH = re.compile(r'^/api/v1/courses/(\d+)/(students/submissions|assignment_groups|assignments)$')
+
+
+def make_course(course_id, submissions, groups=4, seed=0):
+    """A course with that many submissions spread over weighted groups, like a real Canvas payload"""
+    rng = random.Random(f'{seed}:{course_id}')
+    now = datetime.now(timezone.utc)
+    group_list = []
+    for g in range(groups):
+        group_list.append({
+            'id': course_id * 100 + g,
+            'name': f'Group {g + 1}',
+            'position': g + 1,
+            'group_weight': 100 / groups,
+            'rules': {'drop_lowest': 1} if g == 0 else {},
+            'assignments': []
+        })
+
+    subs = []
+    for i in range(submissions):
+        group = group_list[i % groups]
+        assignment_id = course_id * 100000 + i
+        points = rng.choice([0, 5, 10, 20, 50, 100])
+        due = now + timedelta(days=rng.randint(-120, 90), hours=rng.randint(0, 23))
+        graded = due < now and rng.random() < 0.9
+        assignment = {
+            'id': assignment_id,
+            'name': f'Assignment {i + 1}',
+            'assignment_group_id': group['id'],
+            'points_possible': points,
+            'omit_from_final_grade': rng.random() < 0.02,
+            'due_at': due.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'html_url': f'https://canvas.example/courses/{course_id}/assignments/{assignment_id}',
+            # The heavy fields Canvas sends that the backend projects away
+            'description': '<p>' + 'Complete the reading and answer every question. ' * rng.randint(5, 40) + '</p>',
+            'rubric': [
+                {'id': f'r{k}', 'description': f'Criterion {k}', 'points': 5,
+                 'ratings': [{'description': f'Level {p}', 'points': p} for p in range(5)]}
+                for k in range(rng.randint(0, 4))
+            ],
+            'submission_types': ['online_upload'],
+            'lock_info': {'can_view': True}
+        }
+        group['assignments'].append({key: assignment[key] for key in ('id', 'name', 'points_possible')})
+        subs.append({
+            'id': assignment_id,
+            'assignment_id': assignment_id,
+            'score': round(rng.uniform(0.4, 1.0) * points, 1) if graded and points else None,
+            'excused': False,
+            'missing': not graded and due < now,
+            'graded_at': (due + timedelta(days=2)).strftime('%Y-%m-%dT%H:%M:%SZ') if graded else None,
+            'workflow_state': 'graded' if graded else 'unsubmitted',
+            'preview_url': f'https://canvas.example/courses/{course_id}/assignments/{assignment_id}/submissions/1?preview=1',
+            'assignment': assignment
+        })
+    return {'id': course_id, 'name': f'Course {course_id}', 'submissions': subs, 'groups': group_list}
+
+
+class _Bucket:
+    """Canvas's per-token leaky bucket: each request costs units, the quota refills over time"""
+
+    def __init__(self):
+        self.remaining = QUOTA
+        self.updated = time.monotonic()
+
+    def spend(self, cost):
+        now = time.monotonic()
+        self.remaining = min(QUOTA, self.remaining + (now - self.updated) * REFILL_RATE)
+        self.updated = now
+        if self.remaining < cost:
+            return False
+        self.remaining -= cost
+        return True
+
+
+class FakeCanvas:
+    """A threaded fake Canvas server; start() returns its /api/v1 base URL"""
+
+    def __init__(self, courses, latency=0.0, numbered_pages=True, rate_limit=True, etags=True, graphql=True):
+        self.courses = {course['id']: course for course in courses}
+        # Seconds added to every response, standing in for Canvas's own processing time
+        self.latency = latency
+        self.numbered_pages = numbered_pages
+        self.rate_limit = rate_limit
+        self.etags = etags
+        # With graphql=False /api/graphql is a 404, as on an instance that has it turned off
+        self.graphql = graphql
+        self.calls = Counter()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; with Nagle on, keep-alive
+            # responses would wait out the client's delayed ACK (~40ms) every time
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                fake._handle(self)
+
+            def do_POST(self):
+                fake._handle_graphql(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self._server.server_port}/api/v1'
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+
+    def reset_quota(self):
+        """Give every token its full rate-limit quota back"""
+        with self._lock:
+            self._buckets.clear()
+
+    def counts(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            self.calls['total'] += 1
+
+    def _spend(self, token, cost):
+        with self._lock:
+            bucket = self._buckets.setdefault(token, _Bucket())
+            return bucket.spend(cost), bucket.remaining
+
+    def _route(self, path, query):
+        """(kind, items or object, paginated) for a request path, or None for a 404"""
+        if path == '/api/v1/users/self':
+            return 'user', {'id': 1, 'name': 'Benchmark Student'}, False
+        if path == '/api/v1/users/self/courses':
+            courses = [
+                {
+                    'id': course['id'],
+                    'name': course['name'],
+                    'enrollments': [{'type': 'student', 'computed_current_score': 90.0, 'computed_current_grade': 'A-'}]
+                }
+                for course in self.courses.values()
+            ]
+            return 'courses', courses, True
+
+        match = _COURSE_PATH.match(path)
+        if not match or int(match.group(1)) not in self.courses:
+            return None
+        course = self.courses[int(match.group(1))]
+        resource = match.group(2)
+
+        if resource == 'assignment_groups':
+            groups = course['groups']
+            if 'assignments' not in query.get('include[]', []):
+                groups = [{k: v for k, v in g.items() if k != 'assignments'} for g in groups]
+            return 'groups', groups, False
+        if resource == 'assignments':
+            assignments = [s['assignment'] for s in course['submissions']]
+            if query.get('bucket') == ['future']:
+                now = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                assignments = [a for a in assignments if a['due_at'] > now]
+            if query.get('order_by') == ['due_at']:
+                assignments = sorted(assignments, key=lambda a: a['due_at'])
+            return 'assignments', assignments, True
+
+        submissions = course['submissions']
+        if 'graded_since' in query:
+            since = query['graded_since'][0]
+            submissions = [s for s in submissions if s['graded_at'] and s['graded_at'] >= since]
+        return 'submissions', submissions, True
+
+    def _handle(self, handler):
+        url = urlsplit(handler.path)
+        query = parse_qs(url.query)
+        token = handler.headers.get('Authorization', '')
+        if self.latency:
+            time.sleep(self.latency)
+
+        route = self._route(url.path, query)
+        if route is None:
+            self._count('not_found')
+            return self._send(handler, 404, b'{"errors":[{"message":"The specified resource does not exist."}]}')
+        kind, items, paginated = route
+        self._count(kind)
+
+        headers = {}
+        if paginated:
+            per_page = min(MAX_PER_PAGE, int(query.get('per_page', ['10'])[0]))
+            page = int(query.get('page', ['1'])[0].replace('bm:', '') or 1)
+            pages = max(1, -(-len(items) // per_page))
+            body_items = items[(page - 1) * per_page:page * per_page]
+            headers['Link'] = self._links(handler, url, page, pages)
+            cost = 1.0 + len(body_items) * 0.02
+        else:
+            body_items = items
+            cost = 1.0
+        body = json.dumps(body_items).encode()
+
+        if self.rate_limit:
+            allowed, remaining = self._spend(token, cost)
+            if not allowed:
+                self._count('throttled')
+                return self._send(handler, 403, b'403 Forbidden (Rate Limit Exceeded)', {
+                    'X-Rate-Limit-Remaining': f'{remaining:.1f}', 'X-Request-Cost': f'{cost:.3f}'
+                }, content_type='text/plain')
+            headers['X-Rate-Limit-Remaining'] = f'{remaining:.1f}'
+            headers['X-Request-Cost'] = f'{cost:.3f}'
+
+        if self.etags:
+            etag = 'W/"%s"' % hashlib.md5(body).hexdigest()
+            headers['ETag'] = etag
+            if handler.headers.get('If-None-Match') == etag:
+                self._count('not_modified')
+                return self._send(handler, 304, b'', headers)
+
+        self._send(handler, 200, body, headers)
+
+    def _handle_graphql(self, handler):
+        body = handler.rfile.read(int(handler.headers.get('Content-Length', 0)))
+        if self.latency:
+            time.sleep(self.latency)
+        if urlsplit(handler.path).path != GRAPHQL_PATH or not self.graphql:
+            self._count('not_found')
+            return self._send(handler, 404, b'{"errors":[{"message":"The specified resource does not exist."}]}')
+        self._count('graphql')
+
+        request = json.loads(body or b'{}')
+        if 'query CourseGrades' not in request.get('query', ''):
+            return self._send(handler, 200, b'{"errors":[{"message":"Only the CourseGrades query is served here"}]}')
+        variables = request.get('variables') or {}
+        course = self.courses.get(int(variables.get('courseId') or 0))
+        result, nodes = (None, 0) if course is None else self._course_node(course, variables)
+        cost = 1.0 + nodes * 0.02
+
+        headers = {}
+        if self.rate_limit:
+            allowed, remaining = self._spend(handler.headers.get('Authorization', ''), cost)
+            if not allowed:
+                self._count('throttled')
+                return self._send(handler, 403, b'403 Forbidden (Rate Limit Exceeded)', {
+                    'X-Rate-Limit-Remaining': f'{remaining:.1f}', 'X-Request-Cost': f'{cost:.3f}'
+                }, content_type='text/plain')
+            headers['X-Rate-Limit-Remaining'] = f'{remaining:.1f}'
+            headers['X-Request-Cost'] = f'{cost:.3f}'
+        self._send(handler, 200, json.dumps({'data': {'course': result}}).encode(), headers)
+
+    def _course_node(self, course, variables):
+        """The CourseGrades query's course object for one page, and how many assignments it holds"""
+        first = min(MAX_PER_PAGE, int(variables.get('first') or MAX_PER_PAGE))
+        after = variables.get('after')
+        start = int(base64.b64decode(after)) if after else 0
+        page = course['submissions'][start:start + first]
+        end = start + len(page)
+
+        node = {
+            'assignmentsConnection': {
+                'pageInfo': {
+                    'hasNextPage': end < len(course['submissions']),
+                    'endCursor': base64.b64encode(str(end).encode()).decode()
+                },
+                'nodes': [_assignment_node(submission) for submission in page]
+            }
+        }
+        if variables.get('withGroups'):
+            node['assignmentGroupsConnection'] = {'nodes': [_group_node(group) for group in course['groups']]}
+        return node, len(page)
+
+    def _links(self, handler, url, page, pages):
+        base = f'http://{handler.headers["Host"]}{url.path}?'
+        params = [p for p in url.query.split('&') if p and not p.startswith('page=')]
+        prefix = '' if self.numbered_pages else 'bm:'
+
+        def link(number, rel):
+            return f'<{base}{"&".join(params + [f"page={prefix}{number}"])}>; rel="{rel}"'
+
+        links = [link(page, 'current')]
+        if page < pages:
+            links.append(link(page + 1, 'next'))
+        links.append(link(1, 'first'))
+        # Bookmark pagination gives no last page, so callers must walk it one page at a time
+        if self.numbered_pages:
+            links.append(link(pages, 'last'))
+        return ','.join(links)
+
+    def _send(self, handler, status, body, headers=None, content_type='application/json; charset=utf-8'):
+        handler.send_response(status)
+        if status != 304:
+            handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def _local_time(value):
+    if value is None:
+        return None
+    parsed = datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    return parsed.astimezone(GRAPHQL_OFFSET).isoformat()
+
+
+def _assignment_node(submission):
+    assignment = submission['assignment']
+    return {
+        '_id': str(assignment['id']),
+        'name': assignment['name'],
+        'assignmentGroupId': str(assignment['assignment_group_id']),
+        'pointsPossible': assignment['points_possible'],
+        'omitFromFinalGrade': assignment['omit_from_final_grade'],
+        'dueAt': _local_time(assignment['due_at']),
+        'htmlUrl': assignment['html_url'],
+        'submissionsConnection': {'nodes': [{
+            'score': submission['score'],
+            'excused': submission['excused'],
+            'missing': submission['missing'],
+            'gradedAt': _local_time(submission['graded_at'])
+        }]}
+    }
+
+
+def _group_node(group):
+    rules = group['rules'] or {}
+    return {
+        '_id': str(group['id']),
+        'name': group['name'],
+        'position': group['position'],
+        'groupWeight': group['group_weight'],
+        'rules': {
+            'dropLowest': rules.get('drop_lowest'),
+            'dropHighest': rules.get('drop_highest'),
+            'neverDrop': [{'_id': str(i)} for i in rules['never_drop']] if rules.get('never_drop') else None
+        }
+    }
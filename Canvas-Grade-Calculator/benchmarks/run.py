@@ -0,0 +1,324 @@
+"""Benchmark the backend against a local fake Canvas and print the results as JSON.
+
+    python benchmarks/run.py --out results.json
+    python benchmarks/run.py --sizes 10,100 --baseline results.json
+
+For each course size the real Flask routes in backend/app.py are driven
+in-process (cold: response cache cleared before each request; warm:
+served from the cache) while their Canvas calls go over HTTP to
+fake_canvas.FakeCanvas. The grade engine's reference and compiled paths and
+main.calculate_grade are timed on the same payloads. The GraphQL fetch
+path ("fetch": "graphql") is checked against the REST one on every size,
+and the exit status is 1 if they return different bodies. With --baseline,
+p50 latencies are compared with an earlier run and the exit status is 1 if
+any got more than --threshold slower.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, ROOT)
+
+# Snapshots would turn repeat fetches into delta syncs; measure the plain paths
+os.environ.pop('SNAPSHOT_DB', None)
+
+import app  # noqa: E402
+import main  # noqa: E402
+from canvas_client import get_client  # noqa: E402
+from grade_engine import compile_course, reference_grade  # noqa: E402
+from fake_canvas import FakeCanvas, make_course  # noqa: E402
+
+TOKEN = 'benchmark-token'
+# Small courses alongside the measured one, so course-wide routes have something to fan out over
+EXTRA_COURSES = 5
+EXTRA_COURSE_SIZE = 40
+
+
+def summarize(samples):
+    """Latency percentiles in milliseconds"""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'mean': statistics.fmean(ordered) * 1000,
+        'min': ordered[0] * 1000,
+        'max': ordered[-1] * 1000
+    }
+
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Bench:
+    def __init__(self, fake, canvas_url, iterations, concurrency):
+        self.fake = fake
+        self.canvas_url = canvas_url
+        self.scope = app.scope_key(TOKEN, canvas_url)
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.client = app.app.test_client()
+
+    def payload(self, **extra):
+        return {'token': TOKEN, 'canvasUrl': self.canvas_url, **extra}
+
+    def request(self, client, path, payload):
+        response = client.post(path, json=payload)
+        # Reading the body drains streamed responses too
+        response.get_data()
+        return response
+
+    def route(self, name, path, payload, cold):
+        """Latency and upstream calls per request for one route"""
+        samples = []
+        errors = 0
+        self.request(self.client, path, payload)
+        self.fake.reset_counts()
+        for _ in range(self.iterations):
+            # Every request starts with a full Canvas quota, as a user's first visit would,
+            # so one route's fetches don't throttle the next one's
+            self.fake.reset_quota()
+            if cold:
+                app.cache.invalidate(self.scope)
+            started = time.perf_counter()
+            response = self.request(self.client, path, payload)
+            samples.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+        return {
+            'name': f'route:{name}',
+            'mode': 'cold' if cold else 'warm',
+            'iterations': self.iterations,
+            'latency_ms': summarize(samples),
+            'upstream_calls': {kind: n / self.iterations for kind, n in self.fake.counts().items()},
+            'errors': errors
+        }
+
+    def throughput(self, name, path, payload):
+        """Warm requests per second with `concurrency` clients hammering one route"""
+        per_thread = max(1, self.iterations)
+        errors = []
+
+        def worker():
+            client = app.app.test_client()
+            for _ in range(per_thread):
+                if self.request(client, path, payload).status_code != 200:
+                    errors.append(1)
+
+        self.request(self.client, path, payload)
+        self.fake.reset_quota()
+        threads = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        requests = per_thread * self.concurrency
+        return {
+            'name': f'throughput:{name}',
+            'mode': 'warm',
+            'concurrency': self.concurrency,
+            'requests': requests,
+            'requests_per_s': requests / elapsed,
+            'errors': len(errors)
+        }
+
+
+def check_graphql(bench, course_id):
+    """Whether the GraphQL path returns byte-for-byte the REST path's submissions and groups"""
+    bodies = {}
+    for fetch in ('rest', 'graphql'):
+        app.cache.invalidate(bench.scope)
+        bench.fake.reset_quota()
+        bodies[fetch] = [
+            bench.client.post(f'/api/course/{course_id}/{resource}', json=bench.payload(fetch=fetch)).get_data()
+            for resource in ('assignments', 'groups')
+        ]
+    return {'name': 'check:graphql_matches_rest', 'mode': 'check', 'ok': bodies['rest'] == bodies['graphql']}
+
+
+def micro(name, fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {'name': f'micro:{name}', 'mode': 'cpu', 'iterations': iterations, 'latency_ms': summarize(samples)}
+
+
+def bench_size(size, args):
+    courses = [make_course(1, size, seed=args.seed)]
+    courses += [make_course(i + 2, EXTRA_COURSE_SIZE, seed=args.seed) for i in range(EXTRA_COURSES)]
+    fake = FakeCanvas(
+        courses,
+        latency=args.latency_ms / 1000,
+        numbered_pages=not args.bookmark_pages,
+        rate_limit=not args.no_rate_limit
+    )
+    base_url = fake.start()
+    canvas_url = base_url.split('//')[1].split('/')[0]
+    # The backend only speaks https to Canvas; point this host's pooled client at the plain-http fake
+    get_client(canvas_url).base_url = base_url
+
+    try:
+        bench = Bench(fake, canvas_url, args.iterations, args.concurrency)
+        course_id = courses[0]['id']
+        routes = [
+            ('/api/courses', '/api/courses', bench.payload()),
+            ('/api/course/{id}/assignments', f'/api/course/{course_id}/assignments', bench.payload()),
+            ('/api/course/{id}/assignments?stream', f'/api/course/{course_id}/assignments', bench.payload(stream=True)),
+            ('/api/course/{id}/groups', f'/api/course/{course_id}/groups', bench.payload()),
+            ('/api/course/{id}/assignments?graphql', f'/api/course/{course_id}/assignments', bench.payload(fetch='graphql')),
+            ('/api/upcoming-assignments', '/api/upcoming-assignments', bench.payload()),
+            ('/api/dashboard', '/api/dashboard', bench.payload())
+        ]
+
+        results = []
+        for name, path, payload in routes:
+            results.append(bench.route(name, path, payload, cold=True))
+            results.append(bench.route(name, path, payload, cold=False))
+
+        results.append(check_graphql(bench, course_id))
+
+        assignments_response = bench.client.post(f'/api/course/{course_id}/assignments', json=bench.payload())
+        assignments = assignments_response.get_json()
+        groups = bench.client.post(f'/api/course/{course_id}/groups', json=bench.payload()).get_json()
+        sid = assignments_response.headers[app.SESSION_HEADER]
+        graded = [i for i, s in enumerate(assignments) if s.get('score') is not None]
+        modifications = {str(i): 0 for i in graded[:5]}
+
+        grade_routes = [
+            ('/api/calculate-grade (payload)', {
+                'assignments': assignments, 'assignmentGroups': groups, 'modifications': modifications
+            }),
+            ('/api/calculate-grade (session)', {'session_id': sid, 'modifications': modifications})
+        ]
+        for name, payload in grade_routes:
+            results.append(bench.route(name, '/api/calculate-grade', payload, cold=False))
+        results.append(bench.throughput('/api/calculate-grade (session)', '/api/calculate-grade', grade_routes[1][1]))
+        results.append(bench.throughput('/api/course/{id}/assignments', f'/api/course/{course_id}/assignments', bench.payload()))
+
+        int_modifications = {int(k): v for k, v in modifications.items()}
+        model = compile_course(assignments, groups)
+        results += [
+            micro('grade_engine.reference_grade', lambda: reference_grade(assignments, groups, int_modifications), args.micro_iterations),
+            micro('main.calculate_grade', lambda: main.calculate_grade(assignments, groups, int_modifications), args.micro_iterations),
+            micro('grade_engine.compile_course', lambda: compile_course(assignments, groups), args.micro_iterations),
+            micro('CompiledCourse.grade', lambda: model.grade(int_modifications), args.micro_iterations)
+        ]
+    finally:
+        fake.stop()
+
+    # ru_maxrss only ever grows, so run sizes smallest first to read this per size
+    results.append({'name': 'memory:peak_rss', 'mode': 'process', 'peak_rss_kb': peak_rss_kb()})
+    for result in results:
+        result['size'] = size
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print p50 changes against a baseline run; returns the results that regressed"""
+    def key(result):
+        return result['name'], result['size'], result['mode']
+
+    before = {key(r): r for r in baseline['results'] if 'latency_ms' in r}
+    regressions = []
+    for result in results:
+        old = before.get(key(result))
+        if old is None or 'latency_ms' not in result:
+            continue
+        old_p50 = old['latency_ms']['p50']
+        new_p50 = result['latency_ms']['p50']
+        change = (new_p50 - old_p50) / old_p50 if old_p50 else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(result)
+        print(f"{result['name']} [{result['mode']}, {result['size']}]: {old_p50:.2f}ms -> {new_p50:.2f}ms ({change:+.0%}){flag}", file=sys.stderr)
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Benchmark the backend against a local fake Canvas')
+    parser.add_argument('--sizes', default='10,100,1000,5000', help='Comma-separated submissions per measured course')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Latency the fake Canvas adds to every response')
+    parser.add_argument('--iterations', type=int, default=20, help='Requests per route and mode')
+    parser.add_argument('--micro-iterations', type=int, default=50, help='Calls per grade-engine micro-benchmark')
+    parser.add_argument('--concurrency', type=int, default=4, help='Clients in the throughput runs')
+    parser.add_argument('--bookmark-pages', action='store_true', help='Paginate with bookmark cursors and no last link')
+    parser.add_argument('--no-rate-limit', action='store_true', help='Leave out the rate-limit headers and throttling')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Write the JSON here instead of stdout')
+    parser.add_argument('--baseline', help='Earlier results to compare p50 latencies with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Fractional p50 slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    results = []
+    # The routes log every fetch; keep that out of the JSON
+    with contextlib.redirect_stdout(io.StringIO()):
+        for size in (int(s) for s in args.sizes.split(',')):
+            results += bench_size(size, args)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'config': {k: v for k, v in vars(args).items() if k not in ('out', 'baseline')},
+        'peak_rss_kb': peak_rss_kb(),
+        'results': results
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    mismatched = [r for r in results if r['mode'] == 'check' and not r['ok']]
+    for result in mismatched:
+        print(f"{result['name']} failed for size {result['size']}", file=sys.stderr)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+    if regressions or mismatched:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -76,6 +76,42 @@ function SortableCourseCard({ course, onClick }) {
   )
 }
 
+// Read the NDJSON submissions stream, reporting the running count after each page
+async function readSubmissionStream(response, onPage) {
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffered = ''
+  let submissions = []
+  let finished = false
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffered += decoder.decode(value, { stream: true })
+    const lines = buffered.split('\n')
+    buffered = lines.pop()
+
+    for (const line of lines) {
+      if (!line.trim()) continue
+      const message = JSON.parse(line)
+      if (message.error) {
+        throw new Error(message.error)
+      }
+      if (message.done) {
+        finished = true
+        continue
+      }
+      submissions = submissions.concat(message.submissions)
+      onPage(submissions.length)
+    }
+  }
+
+  if (!finished) {
+    throw new Error('Course data was cut off. Please try refreshing.')
+  }
+  return submissions
+}
+
 function App() {
   const [token, setToken] = useState(() => {
     return localStorage.getItem('canvasToken') || ''
@@ -99,6 +135,8 @@ function App() {
   const [hypotheticalAssignments, setHypotheticalAssignments] = useState({})
   const [showSlowLoadingMessage, setShowSlowLoadingMessage] = useState(false)
   const [loadingProgress, setLoadingProgress] = useState(0)
+  const [courseLoadCount, setCourseLoadCount] = useState(0)
+  const [gradeSession, setGradeSession] = useState(null)
   const [isInitialLoad, setIsInitialLoad] = useState(true)
   const [showBgCustomizer, setShowBgCustomizer] = useState(false)
   const [hiddenCourses, setHiddenCourses] = useState(() => {
@@ -342,6 +380,8 @@ function App() {
     setDroppedAssignments({})
     setProjectedGrade(null)
     setHypotheticalAssignments({})
+    setCourseLoadCount(0)
+    setGradeSession(null)
     setSelectedCourse({ id: courseId, name: 'Loading...', loading: true })
     
     // Push to browser history (unless navigating via back/forward)
@@ -358,7 +398,7 @@ function App() {
         fetch(`/api/course/${courseId}/assignments`, {
           method: 'POST',
           headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ token, canvasUrl })
+          body: JSON.stringify({ token, canvasUrl, stream: true })
         }),
         fetch(`/api/course/${courseId}/groups`, {
           method: 'POST',
@@ -373,28 +413,26 @@ function App() {
       
       let assignmentsData, groupsData
       try {
-        assignmentsData = await assignmentsRes.json()
+        assignmentsData = await readSubmissionStream(assignmentsRes, setCourseLoadCount)
         groupsData = await groupsRes.json()
       } catch (jsonError) {
+        if (!(jsonError instanceof SyntaxError)) {
+          throw jsonError
+        }
         console.error('JSON parse error:', jsonError)
         throw new Error('Invalid response from Canvas API. Your session may have expired.')
       }
       
+      // Both responses carry the same handle once the server holds the whole course
+      const sessionId = assignmentsRes.headers.get('X-Grade-Session')
+      const courseSession = sessionId && sessionId === groupsRes.headers.get('X-Grade-Session') ? sessionId : null
+      
       setAssignments(assignmentsData)
       setAssignmentGroups(groupsData)
+      setGradeSession(courseSession)
       setSelectedCourse(courses.find(c => c.id === courseId))
       
-      const gradeRes = await fetch('/api/calculate-grade', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          assignments: assignmentsData,
-          assignment_groups: groupsData,
-          modifications: {}
-        })
-      })
-      
-      const gradeData = await gradeRes.json()
+      const gradeData = await requestGrade(courseSession, assignmentsData, groupsData, {})
       setCurrentGrade(gradeData.grade)
     } catch (err) {
       setError(err.message)
@@ -403,6 +441,33 @@ function App() {
     }
   }
 
+  // Ask the server for a grade, sending only the session handle and modifications when we have one
+  const requestGrade = async (sessionId, courseAssignments, courseGroups, mods) => {
+    if (sessionId) {
+      const response = await fetch('/api/calculate-grade', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ session_id: sessionId, modifications: mods })
+      })
+      // 404 means the session expired or lives on another server; resend the course
+      if (response.status !== 404) {
+        return response.json()
+      }
+      setGradeSession(null)
+    }
+    
+    const response = await fetch('/api/calculate-grade', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({
+        assignments: courseAssignments,
+        assignment_groups: courseGroups,
+        modifications: mods
+      })
+    })
+    return response.json()
+  }
+
   const handleModification = (index, value) => {
     const newMods = { ...modifications }
     if (value === '' || value === null) {
@@ -471,17 +536,15 @@ function App() {
         })
       })
       
-      const response = await fetch('/api/calculate-grade', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          assignments: allAssignments,
-          assignment_groups: assignmentGroups,
-          modifications
-        })
-      })
-      
-      const data = await response.json()
+      // The server's session only knows the course as loaded, so dropped or
+      // hypothetical assignments still need the full payload
+      const unchangedCourse = Object.keys(droppedAssignments).length === 0 && allAssignments.length === assignments.length
+      const data = await requestGrade(
+        unchangedCourse ? gradeSession : null,
+        allAssignments,
+        assignmentGroups,
+        modifications
+      )
       setProjectedGrade(data.grade)
     } catch (err) {
       setError(err.message)
@@ -923,7 +986,9 @@ function App() {
       {loading && (
         <div className="loading-overlay">
           <div className="loading-spinner"></div>
-          <div className="loading-text">Loading course data...</div>
+          <div className="loading-text">
+            Loading course data...{courseLoadCount > 0 && ` (${courseLoadCount} assignments)`}
+          </div>
           <div className="loading-watermark">Made by Sahaj Khandelwal</div>
         </div>
       )}
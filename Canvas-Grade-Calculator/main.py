@@ -1,11 +1,22 @@
-import requests
+import os
+import sys
+
+# Share the backend's Canvas client layer with the CLI
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from canvas_client import get_client
+from canvas_graphql import GraphQLUnavailable, fetch_course, wants_graphql
+from grade_engine import IncrementalGrade, compile_course, grade_timeline, required_scores
+from snapshot_store import open_store, sync_course
 
 BASE_URL = "https://cuhsd.instructure.com/api/v1"
 USER_ID = "self"
 
-# Global variables for API token and headers
+# Global variable for API token
 API_TOKEN = None
-headers = None
+client = get_client(BASE_URL)
+# Set SNAPSHOT_DB to a file path to keep courses on disk between runs
+snapshots = open_store()
 
 def get_all_courses():
     """Get all active courses with grades"""
@@ -13,7 +24,7 @@ def get_all_courses():
         f"{BASE_URL}/users/{USER_ID}/courses"
         "?enrollment_state=active&include[]=enrollments&include[]=total_scores"
     )
-    response = requests.get(courses_url, headers=headers)
+    response = client.get(courses_url, API_TOKEN)
     courses = response.json()
     
     print("\n=== YOUR COURSES ===")
@@ -36,33 +47,45 @@ def get_all_courses():
         else:
             print("No grade available yet.")
 
+def groups_url(course_id):
+    return (
+        f"{BASE_URL}/courses/{course_id}/assignment_groups?include[]=assignments"
+        "&exclude_response_fields[]=description&exclude_response_fields[]=rubric"
+    )
+
 def get_assignment_groups(course_id):
     """Get assignment groups with their weights and rules"""
-    url = f"{BASE_URL}/courses/{course_id}/assignment_groups?include[]=assignments"
-    response = requests.get(url, headers=headers)
+    response = client.get(groups_url(course_id), API_TOKEN)
     return response.json()
 
+def submissions_url(course_id):
+    return f"{BASE_URL}/courses/{course_id}/students/submissions?student_ids[]={USER_ID}&include[]=assignment&per_page=100"
+
 def get_assignments(course_id):
     """Get all assignments and submissions for a course"""
-    url = f"{BASE_URL}/courses/{course_id}/students/submissions?student_ids[]={USER_ID}&include[]=assignment&per_page=100"
-    assignments = []
+    return client.get_all(submissions_url(course_id), API_TOKEN)
+
+def load_course(course_id):
+    """Submissions and assignment groups, synced through the snapshot store when it's enabled.
     
-    while url:
-        response = requests.get(url, headers=headers)
-        submissions = response.json()
-        assignments.extend(submissions)
-        
-        if 'link' in response.headers:
-            links = response.headers['link'].split(',')
-            next_url = None
-            for link in links:
-                if 'rel="next"' in link:
-                    next_url = link[link.find('<')+1 : link.find('>')]
-            url = next_url
-        else:
-            url = None
+    With CANVAS_FETCH=graphql (and no snapshot store) both come from one
+    GraphQL query, falling back to REST if that fails.
+    """
+    if wants_graphql({}, snapshots):
+        try:
+            return fetch_course(client, API_TOKEN, course_id)
+        except GraphQLUnavailable as e:
+            print(f"GraphQL fetch failed ({e}), using REST")
     
-    return assignments
+    if snapshots is None:
+        return get_assignments(course_id), get_assignment_groups(course_id)
+    
+    assignments, assignment_groups, how = sync_course(
+        snapshots, client, API_TOKEN, course_id,
+        submissions_url(course_id), groups_url(course_id)
+    )
+    print(f"Loaded course from snapshot ({how} sync)")
+    return assignments, assignment_groups
 
 def display_assignments(assignments, assignment_groups):
     """Display all assignments with their scores, grouped by assignment group"""
@@ -98,135 +121,47 @@ def display_assignments(assignments, assignment_groups):
 
 def calculate_grade(assignments, assignment_groups, modifications=None, debug=False):
     """Calculate grade based on assignment group weighting with Canvas rules"""
-    # Create a mapping of group_id to group info
+    model = compile_course(assignments, assignment_groups)
+    if debug:
+        print_grade_breakdown(model, assignment_groups, modifications)
+    return model.grade(modifications)
+
+def print_grade_breakdown(model, assignment_groups, modifications=None):
+    """Print how each group contributes to the grade"""
     group_map = {g['id']: g for g in assignment_groups}
-    
-    # Group assignments by assignment_group_id
-    grouped_assignments = {}
-    for i, s in enumerate(assignments):
-        assignment = s.get("assignment", {})
-        group_id = assignment.get("assignment_group_id")
-        
-        # Skip assignments that don't count toward final grade
-        if assignment.get('omit_from_final_grade', False):
-            continue
-        
-        if group_id not in grouped_assignments:
-            grouped_assignments[group_id] = []
-        
-        grouped_assignments[group_id].append((i, s, assignment))
-    
-    # Calculate weighted grade
+    overrides = model.split_modifications(modifications)
     total_weight = 0
     weighted_grade = 0
     
-    if debug:
-        print("\n=== GRADE CALCULATION DEBUG ===")
-    
-    for group_id, group_assignments in grouped_assignments.items():
-        group_info = group_map.get(group_id, {})
-        group_name = group_info.get('name', 'Unknown Group')
-        group_weight = group_info.get('group_weight', 0)
-        
-        # Get drop rules
-        drop_lowest = group_info.get('rules', {}).get('drop_lowest', 0)
-        drop_highest = group_info.get('rules', {}).get('drop_highest', 0)
-        never_drop = group_info.get('rules', {}).get('never_drop', [])
-        
-        # Collect all assignments with their scores
-        all_assignments = []
-        for i, s, assignment in group_assignments:
-            points_possible = assignment.get("points_possible", 0)
-            points_earned = s.get("score")
-            assignment_id = assignment.get("id")
-            
-            # Check if this assignment has a modification
-            if modifications and i in modifications:
-                points_earned = modifications[i]
-            
-            # Only include assignments with points possible > 0
-            if points_possible > 0:
-                # For graded assignments
-                if points_earned is not None:
-                    percentage = (points_earned / points_possible) * 100
-                    all_assignments.append({
-                        'earned': points_earned,
-                        'possible': points_possible,
-                        'percentage': percentage,
-                        'name': assignment.get('name', 'Unknown'),
-                        'id': assignment_id,
-                        'never_drop': assignment_id in never_drop,
-                        'graded': True
-                    })
-        
-        # Apply drop rules only to graded assignments
-        if len(all_assignments) > 0:
-            # Separate never_drop assignments
-            never_drop_assignments = [a for a in all_assignments if a.get('never_drop', False)]
-            droppable = [a for a in all_assignments if not a.get('never_drop', False)]
-            
-            # Sort droppable by percentage
-            droppable_sorted = sorted(droppable, key=lambda x: x['percentage'])
-            
-            # Drop lowest
-            if drop_lowest > 0 and len(droppable_sorted) > drop_lowest:
-                droppable_sorted = droppable_sorted[drop_lowest:]
-            
-            # Drop highest
-            if drop_highest > 0 and len(droppable_sorted) > drop_highest:
-                droppable_sorted = droppable_sorted[:-drop_highest]
-            
-            # Combine never_drop and remaining droppable
-            final_assignments = never_drop_assignments + droppable_sorted
-            
-            # Calculate group score
-            group_earned = sum(a['earned'] for a in final_assignments)
-            group_possible = sum(a['possible'] for a in final_assignments)
-            
-            if group_possible > 0:
-                group_percentage = (group_earned / group_possible) * 100
-                weighted_grade += (group_percentage * group_weight / 100)
-                total_weight += group_weight
-                
-                if debug:
-                    print(f"\n{group_name}:")
-                    print(f"  Weight: {group_weight}%")
-                    print(f"  Drop Lowest: {drop_lowest}, Drop Highest: {drop_highest}")
-                    print(f"  Assignments counted: {len(final_assignments)} (dropped: {len(all_assignments) - len(final_assignments)})")
-                    print(f"  Score: {group_earned:.2f} / {group_possible:.2f} = {group_percentage:.2f}%")
-                    print(f"  Contribution: {group_percentage * group_weight / 100:.2f}%")
-    
-    if debug:
-        print(f"\nTotal Weighted Grade: {weighted_grade:.2f}%")
-        print(f"Total Weight Used: {total_weight}%")
-    
-    # If no weights are set, fall back to simple calculation
-    if total_weight == 0:
-        all_graded = []
-        for group_id, group_assignments in grouped_assignments.items():
-            for i, s, assignment in group_assignments:
-                points_possible = assignment.get("points_possible", 0)
-                points_earned = s.get("score")
-                
-                if modifications and i in modifications:
-                    points_earned = modifications[i]
-                
-                if points_earned is not None and points_possible > 0:
-                    all_graded.append({'earned': points_earned, 'possible': points_possible})
+    print("\n=== GRADE CALCULATION DEBUG ===")
+    for position, group in enumerate(model.groups):
+        counted = group.counted(overrides.get(position))
+        if not counted:
+            continue
+        group_earned = sum(a[0] for a in counted)
+        group_possible = sum(a[1] for a in counted)
+        if group_possible <= 0:
+            continue
         
-        if len(all_graded) == 0:
-            return None
+        group_percentage = (group_earned / group_possible) * 100
+        weighted_grade += group_percentage * group.weight / 100
+        total_weight += group.weight
+        graded = len(group.graded(overrides.get(position)))
         
-        total_earned = sum(a['earned'] for a in all_graded)
-        total_possible = sum(a['possible'] for a in all_graded)
-        return (total_earned / total_possible) * 100
+        print(f"\n{group_map.get(group.group_id, {}).get('name', 'Unknown Group')}:")
+        print(f"  Weight: {group.weight}%")
+        print(f"  Drop Lowest: {group.drop_lowest}, Drop Highest: {group.drop_highest}")
+        print(f"  Assignments counted: {len(counted)} (dropped: {graded - len(counted)})")
+        print(f"  Score: {group_earned:.2f} / {group_possible:.2f} = {group_percentage:.2f}%")
+        print(f"  Contribution: {group_percentage * group.weight / 100:.2f}%")
     
-    return weighted_grade
+    print(f"\nTotal Weighted Grade: {weighted_grade:.2f}%")
+    print(f"Total Weight Used: {total_weight}%")
 
 def get_course_enrollment(course_id):
     """Get enrollment data with grade information"""
     url = f"{BASE_URL}/courses/{course_id}/enrollments?user_id={USER_ID}"
-    response = requests.get(url, headers=headers)
+    response = client.get(url, API_TOKEN)
     enrollments = response.json()
     if enrollments:
         return enrollments[0]
@@ -234,13 +169,15 @@ def get_course_enrollment(course_id):
 
 def what_if_analysis(course_id):
     """Run what-if analysis on a course"""
-    assignments = get_assignments(course_id)
-    assignment_groups = get_assignment_groups(course_id)
+    assignments, assignment_groups = load_course(course_id)
     
     display_assignments(assignments, assignment_groups)
     
+    # Compile the course once; each what-if edit only re-evaluates its own group
+    evaluator = IncrementalGrade(compile_course(assignments, assignment_groups))
+    
     # Calculate current grade
-    current_grade = calculate_grade(assignments, assignment_groups)
+    current_grade = evaluator.grade()
     if current_grade is not None:
         print(f"\n=== CURRENT GRADE ===")
         print(f"Current percentage: {current_grade:.2f}%")
@@ -266,7 +203,11 @@ def what_if_analysis(course_id):
             
             if 0 <= assignment_num < len(assignments):
                 modifications[assignment_num] = new_score
+                evaluator.set_score(assignment_num, new_score)
                 print(f"✓ Updated assignment #{assignment_num + 1} to {new_score} points")
+                running_grade = evaluator.grade()
+                if running_grade is not None:
+                    print(f"  Projected so far: {running_grade:.2f}%")
             else:
                 print(f"❌ Invalid assignment number. Must be between 1 and {len(assignments)}")
         except (ValueError, IndexError):
@@ -274,17 +215,71 @@ def what_if_analysis(course_id):
     
     # Calculate new grade with modifications
     if modifications:
-        new_grade = calculate_grade(assignments, assignment_groups, modifications)
+        new_grade = evaluator.grade()
         if new_grade is not None:
             print(f"\n=== PROJECTED GRADE ===")
             print(f"New percentage: {new_grade:.2f}%")
             if current_grade is not None:
                 change = new_grade - current_grade
                 print(f"Change: {change:+.2f}%")
+    
+    solve_required_scores(assignments, evaluator.model, modifications)
+
+def solve_required_scores(assignments, model, modifications):
+    """Ask for a target grade and report the scores needed to reach it"""
+    print("\n=== REQUIRED SCORE ===")
+    target_input = input("Target percentage (or Enter to skip): ").strip()
+    if not target_input:
+        return
+    
+    try:
+        target = float(target_input)
+        numbers = input("Assignment numbers to solve for (e.g. 12 13): ").split()
+        indices = [int(n) - 1 for n in numbers]
+    except ValueError:
+        print("❌ Invalid format. Use numbers only")
+        return
+    
+    unknown = [i + 1 for i in indices if i not in model.slots]
+    if not indices or unknown:
+        print(f"❌ These assignments don't count toward the grade: {unknown}")
+        return
+    
+    result = required_scores(model, target, indices, modifications)
+    if not result['reachable']:
+        print(f"❌ {target:.2f}% isn't reachable; full credit gives {result['grade']:.2f}%")
+        return
+    
+    print(f"Score {result['percent']:.2f}% on each to reach {result['grade']:.2f}%:")
+    for index, score in result['scores'].items():
+        name = assignments[index].get("assignment", {}).get("name", "Unknown Assignment")
+        print(f"  {index + 1}. {name}: {score:.2f} points")
+
+def show_timeline(course_id):
+    """Print how the course grade moved as each assignment was graded"""
+    assignments, assignment_groups = load_course(course_id)
+    timeline = grade_timeline(compile_course(assignments, assignment_groups), assignments)
+    
+    print("\n=== GRADE TIMELINE ===")
+    if not timeline['dates']:
+        print("No graded assignments with a grading date yet.")
+        return
+    
+    previous = timeline['start']
+    if previous is not None:
+        print(f"Before dated grades: {previous:.2f}%")
+    for graded_at, grade, indices in zip(timeline['dates'], timeline['grades'], timeline['indices']):
+        names = ", ".join(assignments[i].get("assignment", {}).get("name", "Unknown Assignment") for i in indices)
+        if grade is None:
+            print(f"{graded_at[:10]}  --  {names}")
+            continue
+        change = f" ({grade - previous:+.2f})" if previous is not None else ""
+        print(f"{graded_at[:10]}  {grade:6.2f}%{change}  {names}")
+        previous = grade
 
 # Main menu
 def main():
-    global API_TOKEN, headers
+    global API_TOKEN
     
     print("\n" + "="*50)
     print("CANVAS GRADE CALCULATOR")
@@ -302,17 +297,14 @@ def main():
         print("❌ API token is required")
         return
     
-    headers = {
-        "Authorization": f"Bearer {API_TOKEN}"
-    }
-    
     while True:
         print("\n" + "="*50)
         print("CANVAS GRADE CALCULATOR")
         print("="*50)
         print("1. View all courses")
         print("2. Analyze a specific course")
-        print("3. Exit")
+        print("3. Grade timeline for a course")
+        print("4. Exit")
         
         choice = input("\nChoice: ").strip()
         
@@ -325,6 +317,12 @@ def main():
             except ValueError:
                 print("❌ Invalid Course ID")
         elif choice == "3":
+            course_id = input("\nEnter Course ID: ").strip()
+            try:
+                show_timeline(int(course_id))
+            except ValueError:
+                print("❌ Invalid Course ID")
+        elif choice == "4":
             print("Goodbye!")
             break
         else: